@@ -0,0 +1,245 @@
+#
+# This file is part of LiteJESD204B
+#
+# Copyright (c) 2016-2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from migen import *
+
+from litex.gen import *
+
+from litex.soc.cores.code_8b10b import Encoder, Decoder
+from litex.soc.cores.code_8b10b import table_5b6b, table_5b6b_unbalanced, table_5b6b_flip
+from litex.soc.cores.code_8b10b import table_3b4b, table_3b4b_unbalanced, table_3b4b_flip
+
+# 8b/10b Model -------------------------------------------------------------------------------------
+
+# Raw symbols are LSB first (bit 0 is the first transmitted bit, a), as are the symbols in words.
+
+k_characters = [(7 << 5) | 28, (7 << 5) | 23, (7 << 5) | 27, (7 << 5) | 29, (7 << 5) | 30] + \
+    [(y << 5) | 28 for y in range(7)]
+
+def encode_8b10b(d, k, rd):
+    """Encodes octet d (control character if k) with running disparity rd (0: RD-, 1: RD+),
+    returns the raw symbol and the new running disparity."""
+    x, y = d & 0x1f, d >> 5
+    if k and x == 28:
+        code6b, unbalanced6b, flip6b = 0b110000, True, True
+    else:
+        code6b, unbalanced6b, flip6b = table_5b6b[x], table_5b6b_unbalanced[x], table_5b6b_flip[x]
+    code4b, unbalanced4b, flip4b = table_3b4b[y], table_3b4b_unbalanced[y], k or table_3b4b_flip[y]
+    alt7_rdn = (y == 7) and (k or x in [17, 18, 20])
+    alt7_rdp = (y == 7) and (k or x in [11, 13, 14])
+    if not rd and flip6b:
+        code6b = ~code6b & 0b111111
+    rd_inter = rd ^ unbalanced6b
+    if not rd_inter and alt7_rdn:
+        rd_out, code4b = not rd_inter, 0b0111
+    elif rd_inter and alt7_rdp:
+        rd_out, code4b = not rd_inter, 0b1000
+    else:
+        rd_out = rd_inter ^ unbalanced4b
+        if not rd_inter and flip4b:
+            code4b = ~code4b & 0b1111
+    code = (code6b << 4) | code4b
+    return sum(((code >> (9 - i)) & 0b1) << i for i in range(10)), int(rd_out)
+
+def get_8b10b_code_table():
+    """Returns the valid raw symbols for RD- (bit 0) and RD+ (bit 1)."""
+    table = [0]*1024
+    for rd in [0, 1]:
+        for d in range(256):
+            table[encode_8b10b(d, 0, rd)[0]] |= (1 << rd)
+        for d in k_characters:
+            table[encode_8b10b(d, 1, rd)[0]] |= (1 << rd)
+    return table
+
+# Encoder ------------------------------------------------------------------------------------------
+
+class Encoder8b10b(Module):
+    """8b/10b Encoder
+
+    Encodes the octets of data/ctrl words to raw symbols, with running disparity.
+    """
+    def __init__(self, data_width):
+        nsymbols = data_width//8
+        self.sink    = sink = Record([("data", data_width), ("ctrl", nsymbols)])
+        self.source  = Signal(10*nsymbols)
+        self.latency = self.get_latency()
+
+        # # #
+
+        encoder = Encoder(nsymbols, lsb_first=True)
+        self.submodules += encoder
+        for i in range(nsymbols):
+            self.comb += [
+                encoder.d[i].eq(sink.data[8*i:8*(i+1)]),
+                encoder.k[i].eq(sink.ctrl[i]),
+                self.source[10*i:10*(i+1)].eq(encoder.output[i])
+            ]
+
+    @staticmethod
+    def get_latency():
+        return 2
+
+# Decoder ------------------------------------------------------------------------------------------
+
+class Decoder8b10b(Module):
+    """8b/10b Decoder
+
+    Decodes raw symbols to the octets of data/ctrl words and reports per-symbol errors (on the
+    decoded words):
+    - disparity_errors:   symbol valid for the other running disparity only.
+    - not_in_table_errors: symbol not valid for any running disparity.
+    Running disparity is followed from the received symbols (and resynchronized by disparity errors).
+    """
+    def __init__(self, data_width):
+        nsymbols = data_width//8
+        self.sink    = Signal(10*nsymbols)
+        self.source  = source = Record([("data", data_width), ("ctrl", nsymbols)])
+        self.latency = self.get_latency()
+
+        self.disparity_errors    = Signal(nsymbols)
+        self.not_in_table_errors = Signal(nsymbols)
+
+        # # #
+
+        table = Memory(2, 1024, init=get_8b10b_code_table())
+        self.specials += table
+
+        rd  = Signal() # Running disparity at the start of the word.
+        rds = [rd]
+        for i in range(nsymbols):
+            symbol = self.sink[10*i:10*(i+1)]
+
+            # Decoding.
+            decoder = Decoder(lsb_first=True)
+            self.submodules += decoder
+            self.comb += [
+                decoder.input.eq(symbol),
+                source.data[8*i:8*(i+1)].eq(decoder.d),
+                source.ctrl[i].eq(decoder.k)
+            ]
+
+            # Checking (against the symbols valid for the running disparity).
+            port = table.get_port(async_read=True)
+            self.specials += port
+            ones = Signal(4)
+            self.comb += [
+                port.adr.eq(symbol),
+                ones.eq(Reduce("ADD", [symbol[j] for j in range(10)]))
+            ]
+            self.sync += [
+                self.not_in_table_errors[i].eq(port.dat_r == 0),
+                self.disparity_errors[i].eq((port.dat_r != 0) & ~Mux(rds[-1], port.dat_r[1], port.dat_r[0]))
+            ]
+
+            # Running disparity (updated by unbalanced valid symbols).
+            rd_next = Signal()
+            self.comb += [
+                rd_next.eq(rds[-1]),
+                If((port.dat_r != 0) & (ones != 5),
+                    rd_next.eq(ones > 5)
+                )
+            ]
+            rds.append(rd_next)
+        self.sync += rd.eq(rds[-1])
+
+    @staticmethod
+    def get_latency():
+        return 1
+
+# Comma Aligner ------------------------------------------------------------------------------------
+
+class CommaAligner(Module):
+    """Comma Aligner
+
+    Realigns raw words on the symbols boundaries (bit-slip): when enabled, the position of the
+    received commas (first 7 bits of K28.1/K28.5/K28.7) sets the offset of the symbols in the
+    words. Octets are then realigned on the clock word by the link layer.
+    """
+    def __init__(self, data_width):
+        nsymbols = data_width//8
+        width    = 10*nsymbols
+        self.enable  = Signal()
+        self.sink    = Signal(width)
+        self.source  = Signal(width)
+        self.offset  = Signal(max=10)
+        self.latency = self.get_latency()
+
+        # # #
+
+        last_sink = Signal(width, reset_less=True)
+        self.sync += last_sink.eq(self.sink)
+        window = Cat(last_sink, self.sink)
+
+        # Comma detection (lowest position has the priority).
+        for i in reversed(range(width)):
+            comma = window[i:i+7]
+            self.sync += If(self.enable & ((comma == 0b1111100) | (comma == 0b0000011)),
+                self.offset.eq(i%10)
+            )
+
+        # Data selection.
+        self.sync += Case(self.offset, {i: self.source.eq(window[i:i+width]) for i in range(10)})
+
+    @staticmethod
+    def get_latency():
+        return 1
+
+# Coding TX/RX -------------------------------------------------------------------------------------
+
+class LiteJESD204BCodingTX(Module):
+    """Coding TX
+
+    Fabric 8b/10b encoding of the links' words (for PHYs without 8b/10b encoder).
+    """
+    def __init__(self, data_width):
+        self.sink    = Record([("data", data_width), ("ctrl", data_width//8)])
+        self.source  = Signal(10*data_width//8)
+        self.latency = self.get_latency()
+
+        # # #
+
+        self.submodules.encoder = encoder = Encoder8b10b(data_width)
+        self.comb += [
+            encoder.sink.eq(self.sink),
+            self.source.eq(encoder.source)
+        ]
+
+    @staticmethod
+    def get_latency():
+        return Encoder8b10b.get_latency()
+
+
+class LiteJESD204BCodingRX(Module):
+    """Coding RX
+
+    Fabric comma alignment (enabled by align) and 8b/10b decoding of the PHYs' raw words (for PHYs
+    without comma aligner and 8b/10b decoder), with per-symbol errors.
+    """
+    def __init__(self, data_width):
+        self.align   = Signal()
+        self.sink    = Signal(10*data_width//8)
+        self.source  = Record([("data", data_width), ("ctrl", data_width//8)])
+        self.latency = self.get_latency()
+
+        self.disparity_errors    = Signal(data_width//8)
+        self.not_in_table_errors = Signal(data_width//8)
+
+        # # #
+
+        self.submodules.aligner = aligner = CommaAligner(data_width)
+        self.submodules.decoder = decoder = Decoder8b10b(data_width)
+        self.comb += [
+            aligner.enable.eq(self.align),
+            aligner.sink.eq(self.sink),
+            decoder.sink.eq(aligner.source),
+            self.source.eq(decoder.source),
+            self.disparity_errors.eq(decoder.disparity_errors),
+            self.not_in_table_errors.eq(decoder.not_in_table_errors)
+        ]
+
+    @staticmethod
+    def get_latency():
+        return CommaAligner.get_latency() + Decoder8b10b.get_latency()
@@ -4,7 +4,8 @@
 # Copyright (c) 2016-2019 Florent Kermarrec <florent@enjoy-digital.fr>
 # SPDX-License-Identifier: BSD-2-Clause
 
-from math import ceil
+import warnings
+from math import ceil, gcd
 
 # Control characters -------------------------------------------------------------------------------
 
@@ -101,11 +102,13 @@ class JESD204BConfigurationData:
 # Settings -----------------------------------------------------------------------------------------
 
 class JESD204BTransportSettings:
-    def __init__(self, f, s, k, cs):
+    def __init__(self, f, s, k, cs, cf=0, hd=None):
         self.f  = f  # octets/(lane and frame)
         self.s  = s  # samples/(converter and frame)
         self.k  = k  # frames/multiframe
         self.cs = cs # control bits/sample
+        self.cf = cf # control words/(frame and link)
+        self.hd = hd # high density format (None: automatic)
 
 
 class JESD204BPhysicalSettings:
@@ -139,12 +142,74 @@ class JESD204BSettings:
         self.nlanes            = phy_settings.l
         self.samples_per_frame = transport_settings.s
 
-        self.nibbles_per_word = ceil(phy_settings.np//4)
-        self.octets_per_frame = (self.samples_per_frame*
-                                 self.nibbles_per_word)//2
-        self.octets_per_lane  = (self.octets_per_frame*
-                                 self.nconverters)//self.nlanes
-        self.lmfc_cycles      = int(self.octets_per_frame*self.transport.k//4)
+        # Words are N' bits: sample (N bits) + control bits (CS bits, when not in control words) +
+        # tail bits. Control words (CF) are appended to the samples' words of each frame, each
+        # control word carrying the control bits of M/CF converters.
+        self.control_bits_per_sample = transport_settings.cs
+        if (transport_settings.cf == 0) and (phy_settings.n + transport_settings.cs > phy_settings.np):
+            # Control bits not fitting in the words were silently dropped by previous versions (only
+            # reported in the ILAS): keep doing so, as CS=0.
+            warnings.warn("CS={} control bits don't fit in N'={}-bit words with N={}, ignored (as CS=0); "
+                "this configuration is deprecated.".format(transport_settings.cs, phy_settings.np, phy_settings.n),
+                DeprecationWarning)
+            self.control_bits_per_sample = 0
+        self.nconverters_per_control_word = self.nconverters//max(transport_settings.cf, 1)
+        self.control_bits_per_word = self.control_bits_per_sample if transport_settings.cf == 0 else 0
+        self.tail_bits = phy_settings.np - phy_settings.n - self.control_bits_per_word
+        assert self.tail_bits >= 0
+        if transport_settings.cf:
+            assert transport_settings.cs > 0
+            assert self.nconverters%transport_settings.cf == 0
+            assert (self.nconverters_per_control_word*
+                    self.samples_per_frame*
+                    transport_settings.cs) <= phy_settings.np
+        self.words_per_frame  = (self.nconverters*self.samples_per_frame +
+                                 transport_settings.cf)
+        assert (self.words_per_frame*phy_settings.np)%(8*self.nlanes) == 0
+
+        self.octets_per_lane = (self.words_per_frame*
+                                phy_settings.np)//(8*self.nlanes)
+
+        # High density: samples are spread over several lanes when words are not aligned on lanes'
+        # frames (the mapping is the same, only the HD field of the configuration data differs).
+        self.hd = int((8*self.octets_per_lane)%phy_settings.np != 0)
+        if transport_settings.hd is not None:
+            assert transport_settings.hd >= self.hd
+            self.hd = transport_settings.hd
+
+    # Legacy attributes (read-only, kept for compatibility with existing designs).
+    @property
+    def lmfc_cycles(self):
+        # LMFC period for 32-bit links (cf get_lmfc_cycles for other data widths).
+        return self.get_lmfc_cycles(32)
+
+    @property
+    def octets_per_frame(self):
+        # Octets per frame of a converter (S*N'/8, not F).
+        return self.samples_per_frame*self.nibbles_per_word//2
+
+    @property
+    def nibbles_per_word(self):
+        return ceil(self.phy.np/4)
+
+    def get_lmfc_cycles(self, data_width=32):
+        octets_per_clock = data_width//8
+        assert (self.octets_per_lane*self.transport.k)%octets_per_clock == 0
+        return int(self.octets_per_lane*self.transport.k//octets_per_clock)
+
+    def get_multiblocks_per_extended_multiblock(self):
+        # 64b/66b: multiframes are carried as extended multiblocks of E multiblocks (256 octets).
+        assert (self.octets_per_lane*self.transport.k)%256 == 0
+        return int(self.octets_per_lane*self.transport.k//256)
+
+    def get_frames_per_group(self, data_width=32):
+        # Smallest group of frames carried by an integer number of data_width words.
+        octets_per_clock = data_width//8
+        return octets_per_clock//gcd(self.octets_per_lane, octets_per_clock)
+
+    def get_clocks_per_group(self, data_width=32):
+        octets_per_clock = data_width//8
+        return self.octets_per_lane//gcd(self.octets_per_lane, octets_per_clock)
 
     def get_configuration_data(self, lid=0, debug=False):
         cd = JESD204BConfigurationData()
@@ -166,6 +231,8 @@ class JESD204BSettings:
         cd.k  = self.transport.k - 1
         cd.s  = self.transport.s - 1
         cd.cs = self.transport.cs
+        cd.cf = self.transport.cf
+        cd.hd = self.hd
 
         cd.scr = int(self.scrambling)
 
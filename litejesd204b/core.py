@@ -5,12 +5,14 @@
 # Copyright (c) 2016 Robert Jordens <jordens@gmail.com>
 # SPDX-License-Identifier: BSD-2-Clause
 
+from math import gcd
+
 from migen import *
-from migen.genlib.cdc import MultiReg
-from migen.genlib.fifo import SyncFIFO
+from migen.genlib.cdc import MultiReg, PulseSynchronizer
+from migen.genlib.fifo import SyncFIFO, SyncFIFOBuffered
 
 from litex.gen import *
-from litex.gen.genlib.cdc import ElasticBuffer
+from litex.gen.genlib.misc import WaitTimer
 
 from litex.build.io import DifferentialInput, DifferentialOutput
 
@@ -19,115 +21,560 @@ from litex.soc.interconnect import stream
 
 from litejesd204b.transport import LiteJESD204BTransportTX, LiteJESD204BTransportRX
 from litejesd204b.transport import LiteJESD204BSTPLGenerator, LiteJESD204BSTPLChecker
+from litejesd204b.common import configuration_data_fields
 from litejesd204b.link import LiteJESD204BLinkTX, LiteJESD204BLinkRX
+from litejesd204b.link import get_configuration_field, get_error_report_cycles, ErrorReporter
+from litejesd204b.link_64b66b import LiteJESD204CLinkTX, LiteJESD204CLinkRX
+from litejesd204b.coding import LiteJESD204BCodingTX, LiteJESD204BCodingRX
 
 # Clock Domain Crossing ----------------------------------------------------------------------------
 
-class LiteJESD204BTXCDC(Module):
-    def __init__(self, phy, phy_cd):
-        assert len(phy.sink.data) in [16, 32]
-        self.sink   =   sink = stream.Endpoint([("data", 32), ("ctrl", 4)])
-        self.source = source = stream.Endpoint([("data", len(phy.sink.data)), ("ctrl", len(phy.sink.ctrl))])
+class GearboxBuffer(Module):
+    """Gearbox Buffer
+
+    Elastic buffer with width conversion between two clock domains whose frequencies are related by
+    the width ratio (ie iwidth*ifreq == owidth*ofreq). As with an ElasticBuffer, write and read
+    pointers are released from the same reset and are free-running, so (unlike an AsyncFIFO +
+    StrideConverter) the latency does not change from one reset to the next. The latency is reported
+    in ``latency``, in cycles of the widest interface: from the input of a word (of its first chunk
+    for a narrow input) to the output of its first chunk, with the rising edges of the narrow clock
+    aligned on the ones of the wide clock.
+
+    Memory is organized in words of the widest interface, the narrow interface is accessing it by
+    chunks (with write enables on write, with a multiplexer on read).
+    """
+    def __init__(self, iwidth, owidth, depth, idomain, odomain):
+        width  = max(iwidth, owidth)
+        iratio = width//iwidth
+        oratio = width//owidth
+        assert width%iwidth == 0 and width%owidth == 0
+        assert iratio in [1, 2, 4, 8] and oratio in [1, 2, 4, 8]
+        assert depth in [4, 8, 16, 32, 64]
+        self.din     = Signal(iwidth)
+        self.dout    = Signal(owidth)
+        self.latency = self.get_latency(depth)
 
         # # #
 
-        use_ebuf = (len(phy.sink.data) == 32)
+        # Reset (synchronized in the wide domain then propagated to the narrow one, so that the chunk
+        # pointer of the narrow domain is always released at the same phase of the wide clock).
+        reset    = Signal()
+        wr_reset = Signal(reset=1)
+        rd_reset = Signal(reset=1)
+        sync_write = getattr(self.sync, idomain)
+        sync_read  = getattr(self.sync, odomain)
+        self.comb += reset.eq(ResetSignal(idomain) | ResetSignal(odomain))
+        if iratio == 1:
+            self.specials += MultiReg(reset, wr_reset, idomain, reset=1)
+            sync_read += rd_reset.eq(wr_reset)
+        else:
+            self.specials += MultiReg(reset, rd_reset, odomain, reset=1)
+            sync_write += wr_reset.eq(rd_reset)
+
+        # Pointers (in iwidth/owidth chunks), write pointer starts half of the buffer ahead. The
+        # pointer of the narrow domain (read one at equal widths) counts from 2 of its cycles after
+        # the release of the other one and starts offset accordingly, so that the first chunks of the
+        # words are written/read on the edges of the wide clock (latency of get_latency(depth)
+        # whatever the ratio).
+        wrpointer = Signal(log2_int(depth*iratio), reset=(depth//2)*iratio - (iratio - 2 if iratio > 1 else 0))
+        rdpointer = Signal(log2_int(depth*oratio), reset=(3 - 2*oratio)%(depth*oratio) if iratio == 1 else 0)
+        sync_write += If(wr_reset,
+                wrpointer.eq(wrpointer.reset)
+            ).Else(
+                wrpointer.eq(wrpointer + 1)
+            )
+        sync_read += If(rd_reset,
+                rdpointer.eq(rdpointer.reset)
+            ).Else(
+                rdpointer.eq(rdpointer + 1)
+            )
+
+        storage = Memory(width, depth)
+        self.specials += storage
+
+        wrport = storage.get_port(write_capable=True, we_granularity=iwidth, clock_domain=idomain)
+        rdport = storage.get_port(clock_domain=odomain)
+        self.specials += wrport, rdport
+
+        # Write (chunk selected with write enables).
+        self.comb += [
+            wrport.adr.eq(wrpointer[log2_int(iratio):]),
+            wrport.dat_w.eq(Replicate(self.din, iratio)),
+        ]
+        if iratio > 1:
+            self.comb += wrport.we.eq(1 << wrpointer[:log2_int(iratio)])
+        else:
+            self.comb += wrport.we.eq(1)
+
+        # Read (chunk selected on data returned by the synchronous read port).
+        self.comb += rdport.adr.eq(rdpointer[log2_int(oratio):])
+        if oratio > 1:
+            rdchunk = Signal(log2_int(oratio))
+            sync_read += rdchunk.eq(rdpointer[:log2_int(oratio)])
+            self.comb += Case(rdchunk, {i: self.dout.eq(rdport.dat_r[i*owidth:(i+1)*owidth])
+                for i in range(oratio)})
+        else:
+            self.comb += self.dout.eq(rdport.dat_r)
+
+    @staticmethod
+    def get_latency(depth):
+        return depth//2 + 1
+
+
+def get_raw_width(data_width=32, fabric_8b10b=False, link_mode="8b10b"):
+    # Width of the PHYs' raw words carrying data_width bits of the links (raw 10-bit symbols with
+    # fabric 8b/10b, 66-bit blocks with 64b/66b), None when PHYs are provided with data/ctrl.
+    if link_mode == "64b66b":
+        return 66*data_width//64
+    if fabric_8b10b:
+        return 10*data_width//8
+    return None
+
+def get_phy_data_width(data, raw_width=None, data_width=32):
+    # PHYs' data width (in links' bits when PHYs provide raw words).
+    return len(data) if raw_width is None else len(data)*data_width//raw_width
+
+def get_cdc_latency(phy_data_widths, data_width=32, depth=4):
+    # PHYs' CDCs nominal latency (in jesd cycles, the one of the widest PHYs when widths differ).
+    return max(GearboxBuffer.get_latency(depth)*max(phy_data_width//data_width, 1)
+        for phy_data_width in phy_data_widths)
+
+def symbols_pack(data, ctrl):
+    # Pack data/ctrl as 9-bit symbols (octet + control bit) to allow width conversion on symbols.
+    return Cat(*[Cat(data[8*i:8*(i+1)], ctrl[i]) for i in range(len(ctrl))])
+
+def symbols_unpack(symbols, data, ctrl):
+    return [Cat(data[8*i:8*(i+1)], ctrl[i]).eq(symbols[9*i:9*(i+1)]) for i in range(len(ctrl))]
 
-        if use_ebuf:
-            ebuf = ElasticBuffer(len(phy.sink.data) + len(phy.source.ctrl), 4, "jesd", phy_cd)
-            self.submodules.ebuf = ebuf
+
+class LiteJESD204BTXCDC(Module):
+    def __init__(self, phy, phy_cd, data_width=32, depth=4, raw_width=None):
+        # With raw_width, words are raw words (of raw_width bits, see get_raw_width) and the PHY only
+        # has data.
+        phy_data_width = get_phy_data_width(phy.sink.data, raw_width, data_width)
+        assert phy_data_width in [16, 32, 64]
+        if raw_width is not None:
+            self.sink   =   sink = stream.Endpoint([("data", raw_width)])
+            self.source = source = stream.Endpoint([("data", len(phy.sink.data))])
+        else:
+            self.sink   =   sink = stream.Endpoint([("data", data_width), ("ctrl", data_width//8)])
+            self.source = source = stream.Endpoint([("data", phy_data_width), ("ctrl", len(phy.sink.ctrl))])
+
+        # # #
+
+        gearbox = GearboxBuffer(
+            iwidth  = len(sink.data) if raw_width is not None else 9*data_width//8,
+            owidth  = len(source.data) if raw_width is not None else 9*phy_data_width//8,
+            depth   = depth,
+            idomain = "jesd",
+            odomain = phy_cd)
+        self.submodules.gearbox = gearbox
+        self.latency = get_cdc_latency([phy_data_width], data_width, depth) # In jesd cycles.
+        self.comb += [sink.ready.eq(1), source.valid.eq(1)]
+        if raw_width is not None:
             self.comb += [
-                sink.ready.eq(1),
-                ebuf.din[:32].eq(sink.data),
-                ebuf.din[32:].eq(sink.ctrl),
-                source.valid.eq(1),
-                source.data.eq(ebuf.dout[:32]),
-                source.ctrl.eq(ebuf.dout[32:])
+                gearbox.din.eq(sink.data),
+                source.data.eq(gearbox.dout)
             ]
         else:
-            cdc = stream.AsyncFIFO([("data", 32), ("ctrl", 4)], 4)
-            cdc = ClockDomainsRenamer({"write": "jesd", "read": phy_cd})(cdc)
-            self.submodules += cdc
-            converter = stream.StrideConverter(
-                [("data", 32), ("ctrl", 4)],
-                [("data", len(phy.sink.data)), ("ctrl", len(phy.sink.ctrl))],
-                reverse=False)
-            converter = ClockDomainsRenamer(phy_cd)(converter)
-            self.submodules += converter
             self.comb += [
-                sink.connect(cdc.sink),
-                cdc.source.connect(converter.sink),
-                converter.source.connect(source)
+                gearbox.din.eq(symbols_pack(sink.data, sink.ctrl)),
+                *symbols_unpack(gearbox.dout, source.data, source.ctrl)
             ]
 
 
 class LiteJESD204BRXCDC(Module):
-    def __init__(self, phy, phy_cd):
-        assert len(phy.source.data) in [16, 32]
-        self.sink   =   sink = stream.Endpoint([("data", len(phy.source.data)), ("ctrl", len(phy.source.ctrl))])
-        self.source = source = stream.Endpoint([("data", 32), ("ctrl", 4)])
+    def __init__(self, phy, phy_cd, data_width=32, depth=4, raw_width=None):
+        # With raw_width, words are raw words (of raw_width bits, see get_raw_width) and the PHY only
+        # has data.
+        phy_data_width = get_phy_data_width(phy.source.data, raw_width, data_width)
+        assert phy_data_width in [16, 32, 64]
+        if raw_width is not None:
+            self.sink   =   sink = stream.Endpoint([("data", len(phy.source.data))])
+            self.source = source = stream.Endpoint([("data", raw_width)])
+        else:
+            self.sink   =   sink = stream.Endpoint([("data", phy_data_width), ("ctrl", len(phy.source.ctrl))])
+            self.source = source = stream.Endpoint([("data", data_width), ("ctrl", data_width//8)])
 
         # # #
 
-        use_ebuf = (len(phy.source.data) == 32)
-
-        if use_ebuf:
-            ebuf = ElasticBuffer(len(phy.source.data) + len(phy.source.ctrl), 4, phy_cd, "jesd")
-            self.submodules.ebuf = ebuf
+        gearbox = GearboxBuffer(
+            iwidth  = len(sink.data) if raw_width is not None else 9*phy_data_width//8,
+            owidth  = len(source.data) if raw_width is not None else 9*data_width//8,
+            depth   = depth,
+            idomain = phy_cd,
+            odomain = "jesd")
+        self.submodules.gearbox = gearbox
+        self.latency = get_cdc_latency([phy_data_width], data_width, depth) # In jesd cycles.
+        self.comb += [sink.ready.eq(1), source.valid.eq(1)]
+        if raw_width is not None:
             self.comb += [
-                sink.ready.eq(1),
-                ebuf.din[:32].eq(sink.data),
-                ebuf.din[32:].eq(sink.ctrl),
-                source.valid.eq(1),
-                source.data.eq(ebuf.dout[:32]),
-                source.ctrl.eq(ebuf.dout[32:])
+                gearbox.din.eq(sink.data),
+                source.data.eq(gearbox.dout)
             ]
         else:
-            converter = stream.StrideConverter(
-                [("data", len(phy.source.data)), ("ctrl", len(phy.source.ctrl))],
-                [("data", 32), ("ctrl", 4)],
-                reverse=False)
-            converter = ClockDomainsRenamer(phy_cd)(converter)
-            self.submodules += converter
-            cdc = stream.AsyncFIFO([("data", 32), ("ctrl", 4)], 4)
-            cdc = ClockDomainsRenamer({"write": phy_cd, "read": "jesd"})(cdc)
-            self.submodules += cdc
             self.comb += [
-                sink.connect(converter.sink),
-                converter.source.connect(cdc.sink),
-                cdc.source.connect(source)
+                gearbox.din.eq(symbols_pack(sink.data, sink.ctrl)),
+                *symbols_unpack(gearbox.dout, source.data, source.ctrl)
             ]
 
+# Converter Gearbox --------------------------------------------------------------------------------
+
+class ConverterGearboxTX(Module):
+    """Converter Gearbox TX
+
+    Converts the converters' samples provided on the converter_cd clock domain (ratio times slower
+    and wider than the "jesd" clock domain) to the groups of frames of the transport layer, sent
+    over clocks_per_group "jesd" clocks. Samples are continuous: each field of the layout is split
+    in ratio chunks (first samples in LSBs) and a group is made of the last clocks_per_group chunks.
+    """
+    def __init__(self, layout, ratio=1, clocks_per_group=1, converter_cd="jesd", depth=4):
+        assert ratio in [1, 2, 4]
+        self.sink   = Record(layout)
+        self.source = Record([(name, width//ratio*clocks_per_group) for name, width in layout])
+        self.latency = 0 # In jesd cycles.
+
+        # # #
+
+        sinks   = self.sink.flatten()
+        sources = self.source.flatten()
+        widths  = [len(sink)//ratio for sink in sinks]
+        chunk   = Signal(sum(widths))
+
+        # Clock Domain Crossing (chunks of the sink's fields on each jesd clock).
+        if ratio > 1:
+            gearbox = GearboxBuffer(
+                iwidth  = ratio*len(chunk),
+                owidth  = len(chunk),
+                depth   = depth,
+                idomain = converter_cd,
+                odomain = "jesd")
+            self.submodules.gearbox = gearbox
+            self.latency += gearbox.latency*ratio
+            self.comb += [
+                gearbox.din.eq(Cat(*[Cat(*[sink[j*w:(j+1)*w] for sink, w in zip(sinks, widths)])
+                    for j in range(ratio)])),
+                chunk.eq(gearbox.dout)
+            ]
+        else:
+            self.comb += chunk.eq(Cat(*sinks))
+
+        # Group of frames (last clocks_per_group chunks, first chunk in LSBs).
+        chunks = [chunk]
+        for j in range(clocks_per_group - 1):
+            chunk_d = Signal(len(chunk))
+            self.sync.jesd += chunk_d.eq(chunks[-1])
+            chunks.append(chunk_d)
+        chunks = chunks[::-1]
+        offset = 0
+        for source, w in zip(sources, widths):
+            self.comb += source.eq(Cat(*[chunk[offset:offset+w] for chunk in chunks]))
+            offset += w
+
+
+class ConverterGearboxRX(Module):
+    """Converter Gearbox RX
+
+    Converts the groups of frames of the transport layer (received over clocks_per_group "jesd"
+    clocks, valid indicating a new group) to the converters' samples on the converter_cd clock
+    domain (ratio times slower and wider than the "jesd" clock domain).
+    """
+    def __init__(self, layout, ratio=1, clocks_per_group=1, converter_cd="jesd", depth=4):
+        assert ratio in [1, 2, 4]
+        self.valid  = Signal()
+        self.sink   = Record([(name, width//ratio*clocks_per_group) for name, width in layout])
+        self.source = Record(layout)
+        self.latency = 0 # In jesd cycles.
+
+        # # #
+
+        sinks   = self.sink.flatten()
+        sources = self.source.flatten()
+        widths  = [len(source)//ratio for source in sources]
+        chunk   = Signal(sum(widths))
+
+        # Chunks of the group of frames (one on each jesd clock, starting on valid).
+        if clocks_per_group > 1:
+            counter = Signal(max=clocks_per_group)
+            index   = Signal(max=clocks_per_group)
+            self.comb += index.eq(Mux(self.valid, 0, counter))
+            self.sync.jesd += If(index == (clocks_per_group - 1),
+                    counter.eq(0)
+                ).Else(
+                    counter.eq(index + 1)
+                )
+            self.comb += Case(index, {j: chunk.eq(Cat(*[sink[j*w:(j+1)*w]
+                for sink, w in zip(sinks, widths)])) for j in range(clocks_per_group)})
+        else:
+            self.comb += chunk.eq(Cat(*sinks))
+
+        # Clock Domain Crossing.
+        if ratio > 1:
+            gearbox = GearboxBuffer(
+                iwidth  = len(chunk),
+                owidth  = ratio*len(chunk),
+                depth   = depth,
+                idomain = "jesd",
+                odomain = converter_cd)
+            self.submodules.gearbox = gearbox
+            self.latency += gearbox.latency*ratio
+            self.comb += gearbox.din.eq(chunk)
+            offset = 0
+            for source, w in zip(sources, widths):
+                self.comb += source.eq(Cat(*[gearbox.dout[j*len(chunk) + offset:j*len(chunk) + offset + w]
+                    for j in range(ratio)]))
+                offset += w
+        else:
+            self.comb += Cat(*sources).eq(chunk)
+
 # Local Multiframe Clock ---------------------------------------------------------------------------
 
+def saturating_increment(counter):
+    return If(counter != (2**len(counter) - 1), counter.eq(counter + 1))
+
+def saturating_add(counter, bits, clear=0):
+    # Adds the number of bits set in bits (to 0 when clear, ie restarting the count on this cycle).
+    total = Mux(clear, 0, counter) + sum(bits[i] for i in range(len(bits)))
+    return counter.eq(Mux(total > (2**len(counter) - 1), 2**len(counter) - 1, total))
+
+lmfc_monitor_layout = [
+    ("count",     16), # LMFC count on the last SYSREF rising edge (before reload).
+    ("edges",     16), # SYSREF rising edges.
+    ("off_phase", 16), # SYSREF rising edges not aligned with the LMFC (shifting it when loaded).
+]
+
 class LMFC(Module):
+    """Local Multiframe Clock
+
+    count is reloaded with load on jref rising edges. With shots, only the first shots edges after
+    rearm reload it (0: all the edges), the following ones being ignored once aligned. All the edges
+    are monitored (even ignored ones): count on the last edge, edges and off-phase edges (edges that
+    would shift the LMFC) in monitor (saturating). monitor_latch copies monitor to monitor_latched
+    and clears edges/off-phase in the same cycle (edges of this cycle being counted in the new count).
+    """
     def __init__(self, lmfc_cycles, load=0):
         load = (lmfc_cycles + load)%lmfc_cycles
         assert load >= 0
-        self.load  = Signal(max=lmfc_cycles, reset=load)
-        self.jref  = Signal()
-        self.count = Signal(max=lmfc_cycles, reset_less=True)
-        self.zero  = Signal(reset_less=True)
+        self.lmfc_cycles = lmfc_cycles
+        self.load        = Signal(max=lmfc_cycles, reset=load)
+        self.jref        = Signal()
+        self.count       = Signal(max=lmfc_cycles, reset_less=True)
+        self.zero        = Signal(reset_less=True)
+
+        self.shots         = Signal(8) # Input
+        self.rearm         = Signal()  # Input
+        self.monitor         = Record(lmfc_monitor_layout) # Output
+        self.monitor_latched = Record(lmfc_monitor_layout) # Output
+        self.monitor_latch   = Signal() # Input
 
         # # #
 
         _jref   = Signal(reset_less=True)
         _jref_d = Signal(reset_less=True)
+        edge    = Signal()
+        loads   = Signal(8)
+        self.comb += edge.eq(_jref & ~_jref_d)
         self.sync += [
             _jref.eq(self.jref),
             _jref_d.eq(_jref),
-            If(_jref & ~_jref_d,
+            If(self.rearm,
+                loads.eq(0)
+            ).Elif(edge & (loads < self.shots),
+                loads.eq(loads + 1)
+            ),
+            If(edge & ((self.shots == 0) | (loads < self.shots)),
                 self.count.eq(self.load)
+            ).Elif(self.count == (lmfc_cycles - 1),
+                self.count.eq(0)
             ).Else(
                 self.count.eq(self.count + 1)
             )
         ]
         self.comb += self.zero.eq(self.count == 0)
 
+        # Monitor
+        count_next = Signal(max=lmfc_cycles)
+        self.comb += count_next.eq(Mux(self.count == (lmfc_cycles - 1), 0, self.count + 1))
+        self.sync += [
+            If(edge,
+                self.monitor.count.eq(self.count)
+            ),
+            If(self.monitor_latch,
+                self.monitor_latched.eq(self.monitor)
+            ),
+            saturating_add(self.monitor.edges, edge, self.monitor_latch),
+            saturating_add(self.monitor.off_phase, edge & (count_next != self.load), self.monitor_latch)
+        ]
+
+    def count_eq(self, value, cycles=None):
+        # Count comparison modulo cycles (for links whose LMFC period is a divisor of the LMFC's one
+        # when shared).
+        cycles = self.lmfc_cycles if cycles is None else cycles
+        assert self.lmfc_cycles%cycles == 0
+        return Reduce("OR", [self.count == (value%cycles + i*cycles)
+            for i in range(self.lmfc_cycles//cycles)])
+
+# Link Profiler ------------------------------------------------------------------------------------
+
+link_profiler_state_layout = [
+    ("dwell",   48), # Clock cycles spent in the state.
+    ("entries", 16), # Transitions to the state.
+]
+
+link_profiler_layout = [
+    ("bring_up", 32), # Last bring-up duration (clock cycles from enable/drop to ready).
+    ("link_up",  48), # Current link-up time (clock cycles since ready).
+    ("drops",    16), # Ready lost while enabled.
+]
+
+class LinkProfiler(Module):
+    """Link Profiler
+
+    Profiles the bring-up of a link: dwell time and entries of the link's FSM states (when fsm is
+    provided), last bring-up duration, link-up time and drops. Counters (in clock cycles) are
+    saturating, dwell times/entries and drops are cleared with clear. All the counters are copied
+    on the same cycle on latch to latched_status/latched_states (stable until the next latch, to be
+    read from other clock domains).
+    """
+    def __init__(self, fsm=None):
+        self.enable = Signal() # Input
+        self.ready  = Signal() # Input
+        self.clear  = Signal() # Input
+        self.latch  = Signal() # Input
+        self.states = {}
+        self.status = status = Record(link_profiler_layout)
+        self.latched_states = {}
+        self.latched_status = Record(link_profiler_layout)
+
+        # # #
+
+        # FSM states
+        if fsm is not None:
+            for state in fsm.actions.keys():
+                counters  = Record(link_profiler_state_layout)
+                ongoing   = fsm.ongoing(state)
+                ongoing_d = Signal()
+                self.states[state] = counters
+                self.latched_states[state] = Record(link_profiler_state_layout)
+                self.sync += [
+                    ongoing_d.eq(ongoing),
+                    If(self.clear,
+                        counters.dwell.eq(0),
+                        counters.entries.eq(0)
+                    ).Elif(ongoing,
+                        saturating_increment(counters.dwell),
+                        If(~ongoing_d,
+                            saturating_increment(counters.entries)
+                        )
+                    )
+                ]
+
+        # Bring-up / Link-up / Drops
+        bring_up = Signal(len(status.bring_up))
+        ready_d  = Signal()
+        self.sync += [
+            ready_d.eq(self.ready),
+            If(~self.enable | self.ready,
+                bring_up.eq(0)
+            ).Else(
+                saturating_increment(bring_up)
+            ),
+            If(self.ready & ~ready_d,
+                status.bring_up.eq(bring_up)
+            ),
+            If(self.ready,
+                saturating_increment(status.link_up)
+            ).Else(
+                status.link_up.eq(0)
+            ),
+            If(self.clear,
+                status.drops.eq(0)
+            ).Elif(self.enable & ~self.ready & ready_d,
+                saturating_increment(status.drops)
+            )
+        ]
+
+        # Latch
+        self.sync += If(self.latch,
+            self.latched_status.eq(status),
+            *[self.latched_states[state].eq(counters) for state, counters in self.states.items()]
+        )
+
 # Core TX ------------------------------------------------------------------------------------------
 
+def get_lmfc_load(phys_latency=0):
+    return 1 + phys_latency # jref register + latency between the links and the PHYs
+
+def get_phys_latency(coding_cls, phys_data, link_data_width=32, phy_cdc=True, cdc_depth=4, fabric_8b10b=False,
+    link_mode="8b10b"):
+    # Latency between the links and the PHYs (in jesd cycles): fabric 8b/10b coding and PHYs' CDCs.
+    coding_latency = coding_cls.get_latency() if fabric_8b10b else 0
+    cdc_latency    = 0
+    if phy_cdc:
+        raw_width   = get_raw_width(link_data_width, fabric_8b10b, link_mode)
+        cdc_latency = get_cdc_latency([get_phy_data_width(data, raw_width, link_data_width) for data in phys_data],
+            link_data_width, cdc_depth)
+    return coding_latency, cdc_latency
+
+def get_converter_gearbox(jesd_settings, converter_data_width, link_data_width, converter_ratio):
+    # Samples are provided to/from the transport layer as groups of frames: directly when the
+    # converters' data width is the one of a group (and converter_ratio == 1), through a converter
+    # gearbox otherwise (allowing frames that are not aligned on the jesd clocks, ex S=2 with 1
+    # sample per clock).
+    assert converter_ratio in [1, 2, 4]
+    n = jesd_settings.phy.n
+    assert converter_data_width%(n*converter_ratio) == 0
+    samples_per_clock = converter_data_width//(n*converter_ratio) # Per jesd clock.
+    samples_per_group = jesd_settings.get_frames_per_group(link_data_width)*jesd_settings.transport.s
+    clocks_per_group  = jesd_settings.get_clocks_per_group(link_data_width)
+    if converter_ratio == 1 and (clocks_per_group == 1 or samples_per_clock == samples_per_group):
+        return False, converter_data_width
+    if clocks_per_group > 1:
+        assert samples_per_clock*clocks_per_group == samples_per_group
+    return True, samples_per_clock*clocks_per_group*n
+
+def get_converters_layout(jesd_settings, converter_data_width):
+    # Converters' samples (and control bits with CS) of the cores' sink/source.
+    cs     = jesd_settings.control_bits_per_sample
+    layout = [("converter"+str(i), converter_data_width) for i in range(jesd_settings.nconverters)]
+    if cs:
+        layout += [("converter{}_ctrl".format(i), cs*converter_data_width//jesd_settings.phy.n)
+            for i in range(jesd_settings.nconverters)]
+    return layout
+
 class LiteJESD204BCoreTX(Module):
-    def __init__(self, phys, jesd_settings, converter_data_width, scrambling=True, stpl_random=True):
+    def __init__(self, phys, jesd_settings, converter_data_width, scrambling=True, stpl_random=True,
+        link_data_width=32, cdc_depth=4, phy_cdc=True, converter_ratio=1, converter_cd="jesd",
+        lmfc=None, lane_offset=0, transport_pipeline_stages=0, link_pipeline_stages=0, max_latency=None,
+        fabric_8b10b=False, link_mode="8b10b", test_patterns=False, sink_valid=False, profilers=False):
+        # When phy_cdc is disabled, the links are directly clocked from the PHYs' clock domains: PHYs
+        # must then be clocked from the device clock ("jesd" clock domain) and have the same data
+        # width than the links.
+        # When sink_valid is enabled, samples are qualified by sink.valid (zeros sent instead of
+        # invalid samples), otherwise sink.valid is ignored and samples are always valid (designs
+        # only driving the converters' samples).
+        # When fabric_8b10b is enabled, links' words are 8b/10b encoded in fabric and PHYs are
+        # provided with raw 10-bit symbols (20/40/80-bit data, without ctrl).
+        # When link_mode is "64b66b", JESD204C 64b/66b links are used (on 64-bit words, extended
+        # multiblocks sent on the multiframes) and PHYs are provided with raw 66-bit blocks.
+        # When test_patterns is enabled, the links can send PRBS/JESD test patterns (8b/10b links).
+        # When profilers is enabled, the core and its lanes are profiled (link FSM states dwell
+        # times/entries, bring-up/link-up times and drops, cf LinkProfiler).
+        # Lanes can be restarted individually with lane_restart (CGS then ILAS on the lane only,
+        # SYNC~ being ignored on the lane meanwhile) for the RX lanes' recovery. Samples are not lost:
+        # the lane is restarted on the LMFC once the samples of the current multiframe are sent (and
+        # flushed by a multiframe of zeros) and ready is de-asserted (no samples consumed) until it is
+        # back.
+        # When converter_ratio > 1, sink is clocked from converter_cd, converter_ratio times slower
+        # than the "jesd" clock domain (and derived from the same reference).
+        # When lmfc is provided, the LMFC is shared with other cores (and driven by its owner) and
+        # the PHYs' clock domains are numbered from lane_offset.
+        # The latency from sink to the PHYs (in jesd cycles) is reported per stage in latency_stages
+        # and in total in latency (checked against max_latency when provided).
+        assert link_data_width in [32, 64]
+        assert link_mode in ["8b10b", "64b66b"]
+        assert link_mode == "8b10b" or (link_data_width == 64 and not fabric_8b10b and not test_patterns)
+        assert (converter_ratio == 1) == (converter_cd == "jesd")
         self.enable  = Signal()
         self.jsync   = Signal()
         self.jref    = Signal()
@@ -135,64 +582,255 @@ class LiteJESD204BCoreTX(Module):
 
         self.stpl_enable = Signal()
 
-        self.sink = Record([("converter"+str(i), converter_data_width)
-            for i in range(jesd_settings.nconverters)])
+        if test_patterns:
+            self.test_mode = Signal(3) # Links' test patterns (cf test_modes).
+
+        self.lane_restart = Signal(len(phys)) # Per-lane restart pulses.
+
+        if link_mode == "8b10b":
+            self.sync_error_reports         = Signal(32) # RX errors reported over SYNC~ (saturating).
+            self.sync_error_reports_latched = Signal(32) # Latched copy (cf RX error_counters_latched).
+            self.sync_error_reports_latch   = Signal()
+
+        # Samples are consumed (sink.ready) from the first multiframe once the links are ready, zeros
+        # are sent instead of invalid/non-consumed samples (first/last are not used). With control
+        # bits (CS), the converters' control bits are provided with their samples (converterN_ctrl).
+        self.sink = stream.Endpoint(get_converters_layout(jesd_settings, converter_data_width))
 
         # # #
 
+        # Converter gearbox
+        converter_gearbox, transport_data_width = get_converter_gearbox(
+            jesd_settings, converter_data_width, link_data_width, converter_ratio)
+        sink_consumed = self.sink.ready & (self.sink.valid if sink_valid else 1)
+        sink      = [Mux(sink_consumed, getattr(self.sink, "converter"+str(i)), 0)
+            for i in range(jesd_settings.nconverters)]
+        sink_ctrl = [Mux(sink_consumed, getattr(self.sink, "converter{}_ctrl".format(i)), 0)
+            for i in range(jesd_settings.nconverters)] if jesd_settings.control_bits_per_sample else []
+        if converter_gearbox:
+            gearbox = ConverterGearboxTX(
+                layout           = [("s"+str(i), len(s)) for i, s in enumerate(sink + sink_ctrl)],
+                ratio            = converter_ratio,
+                clocks_per_group = jesd_settings.get_clocks_per_group(link_data_width),
+                converter_cd     = converter_cd,
+                depth            = cdc_depth)
+            self.submodules.converter_gearbox = gearbox
+            self.comb += gearbox.sink.raw_bits().eq(Cat(*sink, *sink_ctrl))
+            sink      = gearbox.source.flatten()[:len(sink)]
+            sink_ctrl = gearbox.source.flatten()[len(sink):]
+
         # Transport layer
-        transport = LiteJESD204BTransportTX(jesd_settings, converter_data_width)
+        transport = LiteJESD204BTransportTX(jesd_settings, transport_data_width, link_data_width,
+            pipeline_stages=transport_pipeline_stages)
         transport = ClockDomainsRenamer("jesd")(transport)
         self.submodules.transport = transport
+        assert len(transport.source.lane0) == link_data_width
+        if jesd_settings.control_bits_per_sample:
+            self.comb += transport.sink_ctrl.raw_bits().eq(Cat(*sink_ctrl))
 
         # STPL
-        stpl = LiteJESD204BSTPLGenerator(jesd_settings, converter_data_width, random=stpl_random)
+        stpl = LiteJESD204BSTPLGenerator(jesd_settings, transport_data_width, random=stpl_random)
         stpl = ClockDomainsRenamer("jesd")(stpl)
         self.submodules.stpl = stpl
         self.comb += \
             If(self.stpl_enable,
                 transport.sink.eq(stpl.source)
             ).Else(
-                transport.sink.eq(self.sink)
+                transport.sink.raw_bits().eq(Cat(*sink))
             )
 
-        # LMFC
-        lmfc = LMFC(jesd_settings.lmfc_cycles, load=(1 + 4)) # jref + ebuf latency
-        lmfc = ClockDomainsRenamer("jesd")(lmfc)
-        self.submodules.lmfc = lmfc
-        self.sync.jesd += lmfc.jref.eq(self.jref)
+        # LMFC (loaded ahead of SYSREF by the latency between the links and the PHYs, to be aligned
+        # at the PHYs)
+        coding_latency, cdc_latency = get_phys_latency(LiteJESD204BCodingTX,
+            [phy.sink.data for phy in phys], link_data_width, phy_cdc, cdc_depth, fabric_8b10b, link_mode)
+        lmfc_cycles = jesd_settings.get_lmfc_cycles(link_data_width)
+        lmfc_zero   = Signal()
+        self.lmfc_shared = lmfc is not None
+        if lmfc is None:
+            lmfc = LMFC(lmfc_cycles, load=get_lmfc_load(coding_latency + cdc_latency))
+            lmfc = ClockDomainsRenamer("jesd")(lmfc)
+            self.submodules.lmfc = lmfc
+            self.sync.jesd += lmfc.jref.eq(self.jref)
+        self.lmfc        = lmfc
+        self.lmfc_cycles = lmfc_cycles
+        self.comb += lmfc_zero.eq(lmfc.count_eq(0, lmfc_cycles))
+
+        # Transport groups of frames start with the multiframes (data is sent on the LMFC following
+        # the first one of ILAS, with the scrambler latency). Transport/Link pipeline stages are
+        # compensated by providing the groups of frames earlier.
+        pipeline_latency = transport.latency + link_pipeline_stages
+        self.comb += transport.start.eq(lmfc.count_eq(-pipeline_latency, lmfc_cycles))
+
+        # Sink ready from the first multiframe once the links are ready (from its first chunk when
+        # converted by the gearbox, on group consumption when provided directly).
+        clocks_per_group = jesd_settings.get_clocks_per_group(link_data_width)
+        start_count = (1 - clocks_per_group if converter_gearbox else 0) - pipeline_latency
+        start   = Signal()
+        started = Signal()
+        self.sync.jesd += \
+            If(~self.ready,
+                started.eq(0)
+            ).Elif(start,
+                started.eq(1)
+            )
+        if converter_gearbox:
+            self.comb += [
+                start.eq(lmfc.count_eq(start_count, lmfc_cycles)),
+                self.sink.ready.eq(self.ready & (started | start))
+            ]
+        else:
+            self.comb += [
+                start.eq(transport.start),
+                self.sink.ready.eq(self.ready & (started | start) & transport.ready)
+            ]
 
         # Links
+        raw_width = get_raw_width(link_data_width, fabric_8b10b, link_mode)
+        link_cls  = {"8b10b": LiteJESD204BLinkTX, "64b66b": LiteJESD204CLinkTX}[link_mode]
+        link_kwargs = {"test_patterns": True} if test_patterns else {} # 8b/10b links only.
         self.links = links = []
+        restart_stops = []
         for n, (phy, lane) in enumerate(zip(phys, transport.source.flatten())):
-            phy_name = "jesd_phy{}".format(n if not hasattr(phy, "n") else phy.n)
+            phy_name = "jesd_phy{}".format(lane_offset + n if not hasattr(phy, "n") else phy.n)
             phy_cd   = phy_name + "_tx"
 
-            cdc = LiteJESD204BTXCDC(phy, phy_cd)
-            setattr(self.submodules, "cdc"+str(n), cdc)
+            if phy_cdc:
+                cdc = LiteJESD204BTXCDC(phy, phy_cd, link_data_width, cdc_depth, raw_width)
+                setattr(self.submodules, "cdc"+str(n), cdc)
+            else:
+                assert get_phy_data_width(phy.sink.data, raw_width, link_data_width) == link_data_width
 
-            link = LiteJESD204BLinkTX(32, jesd_settings, n)
-            link = ClockDomainsRenamer("jesd")(link)
+            link = link_cls(link_data_width, jesd_settings, n,
+                pipeline_stages=link_pipeline_stages, **link_kwargs)
+            link = ClockDomainsRenamer("jesd" if phy_cdc else phy_cd)(link)
             self.submodules += link
             links.append(link)
+            if test_patterns:
+                self.comb += link.test_mode.eq(self.test_mode)
+
+            # Lane restart: samples consumption stopped at the end of the current multiframe (ready
+            # de-asserted) and lane reset on the LMFC following a multiframe of zeros (flushing the last
+            # samples through the links and the RX buffers), then CGS for 2 multiframes (jsync held)
+            # and ILAS on the next LMFC (or with the other lanes on a re-synchronization request).
+            restart_pending = Signal()
+            restart_stop    = Signal()
+            restart_stopped = Signal()
+            restart_flushed = Signal()
+            restart         = Signal()
+            restart_hold    = Signal(2)
+            restart_stops.append(restart_stop | restart_stopped)
             self.comb += [
-                link.reset.eq(~self.enable),
+                restart_stop.eq(restart_pending & ~restart_stopped & lmfc.count_eq(start_count - 1, lmfc_cycles)),
+                restart.eq(lmfc_zero & restart_flushed)
+            ]
+            self.sync.jesd += [
+                If(restart,
+                    restart_pending.eq(0),
+                    restart_stopped.eq(0),
+                    restart_flushed.eq(0)
+                ).Else(
+                    If(self.lane_restart[n], restart_pending.eq(1)),
+                    If(restart_stop,         restart_stopped.eq(1)),
+                    If(lmfc_zero & restart_stopped, restart_flushed.eq(1))
+                ),
+                If(restart,
+                    restart_hold.eq(2)
+                ).Elif(~self.jsync,
+                    restart_hold.eq(0)
+                ).Elif(lmfc_zero & (restart_hold != 0),
+                    restart_hold.eq(restart_hold - 1)
+                )
+            ]
+
+            self.comb += [
+                link.reset.eq(~self.enable | restart),
                 link.datapath.scrambler.enable.eq(int(scrambling)),
-                link.jsync.eq(self.jsync),
+                link.jsync.eq(self.jsync & (restart_hold == 0)),
                 link.jref.eq(self.jref),
-                link.lmfc_zero.eq(self.lmfc.zero),
+                link.lmfc_zero.eq(lmfc_zero),
             ]
 
             # connect data
+            self.comb += link.sink.data.eq(lane)
+            if phy_cdc:
+                self.comb += [
+                    cdc.sink.valid.eq(1),
+                    cdc.source.connect(phy.sink)
+                ]
+                lane_sink = cdc.sink
+            else:
+                self.comb += phy.sink.valid.eq(1)
+                lane_sink = phy.sink
+            if fabric_8b10b:
+                coding = LiteJESD204BCodingTX(link_data_width)
+                coding = ClockDomainsRenamer("jesd" if phy_cdc else phy_cd)(coding)
+                setattr(self.submodules, "coding"+str(n), coding)
+                self.comb += [
+                    coding.sink.data.eq(link.source.data),
+                    coding.sink.ctrl.eq(link.source.ctrl),
+                    lane_sink.data.eq(coding.source)
+                ]
+            elif link_mode == "64b66b":
+                self.comb += lane_sink.data.eq(link.source.data)
+            else:
+                self.comb += [
+                    lane_sink.data.eq(link.source.data),
+                    lane_sink.ctrl.eq(link.source.ctrl)
+                ]
+
+        # Ready de-asserted while a lane is restarted (samples not consumed, zeros sent on all the lanes
+        # and samples consumed again from the first multiframe once the lane is back).
+        self.sync.jesd += self.ready.eq(Reduce("AND", [link.ready & ~restart_stops[n]
+            for n, link in enumerate(links)]))
+
+        # Profilers (core and lanes, with their link FSM states, latched together).
+        if profilers:
+            self.profiler_clear = Signal()
+            self.profiler_latch = Signal()
+            profiler = LinkProfiler()
+            profiler = ClockDomainsRenamer("jesd")(profiler)
+            self.submodules.profiler = profiler
             self.comb += [
-                link.sink.data.eq(lane),
-                cdc.sink.valid.eq(1),
-                cdc.sink.data.eq(link.source.data),
-                cdc.sink.ctrl.eq(link.source.ctrl),
-                cdc.source.connect(phy.sink)
+                profiler.enable.eq(self.enable),
+                profiler.ready.eq(self.ready),
+                profiler.clear.eq(self.profiler_clear),
+                profiler.latch.eq(self.profiler_latch)
+            ]
+            self.lane_profilers = []
+            for link in links:
+                lane_profiler = LinkProfiler(getattr(link, "fsm", None))
+                lane_profiler = ClockDomainsRenamer("jesd")(lane_profiler)
+                self.submodules += lane_profiler
+                self.lane_profilers.append(lane_profiler)
+                self.comb += [
+                    lane_profiler.enable.eq(self.enable),
+                    lane_profiler.ready.eq(link.ready),
+                    lane_profiler.clear.eq(self.profiler_clear),
+                    lane_profiler.latch.eq(self.profiler_latch)
+                ]
+
+        # SYNC~ errors reports (SYNC~ is common to the links, latched and cleared together).
+        if link_mode == "8b10b":
+            self.sync.jesd += [
+                If(self.sync_error_reports_latch,
+                    self.sync_error_reports_latched.eq(self.sync_error_reports),
+                    self.sync_error_reports.eq(links[0].error_report)
+                ).Elif(links[0].error_report,
+                    saturating_increment(self.sync_error_reports)
+                )
             ]
 
-        self.sync.jesd += self.ready.eq(Reduce("AND", [link.ready for link in links]))
+        # Latency
+        self.latency_stages = {
+            "converter_gearbox" : gearbox.latency if converter_gearbox else 0,
+            "transport"         : transport.latency,
+            "link"              : links[0].datapath.latency,
+            "coding"            : coding_latency,
+            "cdc"               : cdc_latency,
+        }
+        self.latency = sum(self.latency_stages.values())
+        if max_latency is not None:
+            assert self.latency <= max_latency
 
     def register_jsync(self, jsync, polarity=0b0):
         self.jsync_registered = True
@@ -220,8 +858,64 @@ class LiteJESD204BCoreTX(Module):
 
 # Core RX ------------------------------------------------------------------------------------------
 
+error_counters_layout = [
+    ("code",               16), # 8b/10b disparity/not-in-table (fabric 8b/10b) or CRC-12 (64b/66b) errors.
+    ("unexpected_control", 16), # Control characters other than /F/ and /A/.
+    ("frame_align",        16), # Misplaced /F/.
+    ("lane_align",         16), # Misplaced /A/.
+]
+
+lane_recovery_layout = [
+    ("count", 16), # Recoveries.
+    ("time",  16), # Last recovery time (in jesd clock cycles, from the drop to the release).
+]
+
 class LiteJESD204BCoreRX(Module):
-    def __init__(self, phys, jesd_settings, converter_data_width, scrambling=True, ilas_check=True, stpl_random=True):
+    def __init__(self, phys, jesd_settings, converter_data_width, scrambling=True, ilas_check=True, stpl_random=True,
+        link_data_width=32, cdc_depth=4, phy_cdc=True, converter_ratio=1, converter_cd="jesd",
+        lmfc=None, lane_offset=0, skew_fifo_depth=None, skew_fifo_buffered=False,
+        transport_pipeline_stages=0, link_pipeline_stages=0, max_latency=None, fabric_8b10b=False,
+        link_mode="8b10b", test_patterns=False, lane_restart_recovery=False, lane_recovery_timeout=16,
+        profilers=False):
+        # When phy_cdc is disabled, the links are directly clocked from the PHYs' clock domains: PHYs
+        # must then be clocked from the device clock ("jesd" clock domain) and have the same data
+        # width than the links.
+        # When fabric_8b10b is enabled, PHYs provide raw 10-bit symbols (20/40/80-bit data, without
+        # ctrl/rx_align) that are comma aligned and 8b/10b decoded in fabric, with per-lane errors.
+        # When link_mode is "64b66b", JESD204C 64b/66b links are used (on 64-bit words, extended
+        # multiblocks received on the multiframes) and PHYs provide raw 66-bit blocks (without
+        # ctrl/rx_align), with per-lane CRC errors.
+        # When test_patterns is enabled, the links can check PRBS/JESD test patterns (8b/10b links),
+        # with per-lane bit errors counters.
+        # When profilers is enabled, the core and its lanes are profiled (cf LiteJESD204BCoreTX).
+        # Errors of the 8b/10b lanes are reported over SYNC~ once for all the lanes (one frame SYNC~
+        # de-assertions, at most one report per 2 frames window, cf ErrorReporter).
+        # When lane_restart_recovery is enabled, the RX lanes can be recovered individually from a
+        # TX restarting its lanes by itself (ex LiteJESD204BCoreTX's lane_restart, own TX or
+        # loopback), standard TXs only re-sending CGS/ILAS on SYNC~ requests being not supported.
+        # When lane_recovery is then set, a lane dropping once the core is ready is recovered on its
+        # own (re-CGS/re-ILAS) while the other lanes keep their alignment: it is masked from
+        # SYNC~/ready (with zeros on its samples, flagged in lanes_masked) until its skew FIFO is
+        # released again on the release LMFC. Samples are not valid while lanes are masked
+        # (source.valid de-asserted, then re-asserted from the second multiframe once they are
+        # released, as on link-up). A lane not restarted by the TX within lane_recovery_timeout
+        # multiframes (or all the lanes dropping) re-synchronizes the core: ready is de-asserted and
+        # the lane's SYNC~ request triggers a full re-initialization.
+        # When converter_ratio > 1, source is clocked from converter_cd, converter_ratio times slower
+        # than the "jesd" clock domain (and derived from the same reference).
+        # When lmfc is provided, the LMFC is shared with other cores (and driven by its owner) and
+        # the PHYs' clock domains are numbered from lane_offset.
+        # skew_fifo_depth (default: LMFC period) must cover the lanes' levels on release (cycles
+        # between the lanes' arrival and the release, bounded by the expected lanes skew when the
+        # release is trimmed with the RBD). Skew FIFOs use asynchronous reads (LUT RAM/SRL) or, when
+        # skew_fifo_buffered, registered reads (Block RAM).
+        # The latency from the PHYs to source (in jesd cycles, skew FIFOs excluded: their level on
+        # release is set by the lanes' arrival and the RBD) is reported per stage in latency_stages
+        # and in total in latency (checked against max_latency when provided).
+        assert link_data_width in [32, 64]
+        assert link_mode in ["8b10b", "64b66b"]
+        assert link_mode == "8b10b" or (link_data_width == 64 and not fabric_8b10b and not test_patterns)
+        assert (converter_ratio == 1) == (converter_cd == "jesd")
         self.enable = Signal()
         self.jsync  = Signal()
         self.jref   = Signal()
@@ -230,84 +924,461 @@ class LiteJESD204BCoreRX(Module):
         self.ilas_check  = Signal(reset=int(ilas_check))
         self.stpl_enable = Signal()
 
-        self.source = Record([("converter"+str(i), converter_data_width)
-            for i in range(jesd_settings.nconverters)])
+        self.frame_align_errors = Signal(len(phys)) # Per-lane misplaced /F/ (sticky).
+        self.lane_align_errors  = Signal(len(phys)) # Per-lane misplaced /A/ (sticky).
+        self.align_errors_clear = Signal()
+
+        # Per-lane error counters (saturating, in erroneous octets while the links are ready, blocks
+        # and multiblocks for 64b/66b). Each lane's counters are copied to error_counters_latched and
+        # cleared in the same cycle by its bit of error_counters_latch (errors of this cycle being
+        # counted in the new count), the latched copy being stable until the next latch. Code errors
+        # are only counted when known to the core (fabric 8b/10b or 64b/66b).
+        code_errors = fabric_8b10b or link_mode == "64b66b"
+        error_counters_lane_layout = [(name, size) for name, size in error_counters_layout
+            if code_errors or name != "code"]
+        self.error_counters         = [Record(error_counters_lane_layout) for _ in phys]
+        self.error_counters_latched = [Record(error_counters_lane_layout) for _ in phys]
+        self.error_counters_latch   = Signal(len(phys))
+
+        # Per-lane recovery (saturating statistics).
+        lanes_masked = Signal(len(phys)) # Lanes dropped/recovering, zeroed samples.
+        if lane_restart_recovery:
+            self.lane_recovery   = Signal()
+            self.lane_recoveries = [Record(lane_recovery_layout) for _ in phys]
+            self.lanes_masked    = lanes_masked # Output
+
+        if test_patterns:
+            self.test_mode           = Signal(3) # Links' test patterns (cf test_modes).
+            self.test_errors         = []        # Per-lane test patterns bit errors (saturating).
+            self.test_errors_latched = []        # Per-lane latched copies (cf error_counters_latched).
+            self.test_errors_latch   = Signal(len(phys))
+
+        if link_mode == "8b10b":
+            self.ilas_configurations = [] # Per-lane configuration octets of the last received ILAS.
+            self.ilas_captured       = [] # Per-lane configuration octets captured.
+            self.ilas_mismatches     = [] # Per-lane mismatches with the expected configuration fields.
+
+        if fabric_8b10b:
+            self.disparity_errors    = Signal(len(phys)) # Per-lane 8b/10b disparity errors (sticky).
+            self.not_in_table_errors = Signal(len(phys)) # Per-lane 8b/10b not-in-table errors (sticky).
+            self.code_errors_clear   = Signal()
+        if link_mode == "64b66b":
+            self.crc_errors        = Signal(len(phys)) # Per-lane 64b/66b CRC-12 errors (sticky).
+            self.code_errors_clear = Signal()
+
+        # Multi-device synchronization (driven by a LiteJESD204BRXSyncGroup when grouped).
+        self.links_jsync   = Signal()         # Output
+        self.links_ready   = Signal()         # Output
+        self.group_jsync   = Signal(reset=1)  # Input
+        self.group_ready   = Signal(reset=1)  # Input
+        self.group_release = Signal(reset=1)  # Input
+
+        # Samples are valid (source.valid) from the second multiframe once the links are ready,
+        # first/last indicate the start/end of the multiframes (source.ready is not used). When
+        # converter_ratio > 1, words can straddle multiframes: valid/first/last are then set on the
+        # words containing valid samples/the start/the end of a multiframe. With control bits (CS),
+        # the converters' control bits are provided with their samples (converterN_ctrl).
+        self.source = stream.Endpoint(get_converters_layout(jesd_settings, converter_data_width))
 
         # # #
 
         # Transport Layer
-        transport = LiteJESD204BTransportRX(jesd_settings, converter_data_width)
+        converter_gearbox, transport_data_width = get_converter_gearbox(
+            jesd_settings, converter_data_width, link_data_width, converter_ratio)
+        transport = LiteJESD204BTransportRX(jesd_settings, transport_data_width, link_data_width,
+            pipeline_stages=transport_pipeline_stages)
         transport = ClockDomainsRenamer("jesd")(transport)
         self.submodules.transport = transport
+        assert len(transport.sink.lane0) == link_data_width
+        source      = transport.source.flatten()
+        source_ctrl = transport.source_ctrl.flatten() if jesd_settings.control_bits_per_sample else []
+
+        # Converter gearbox (source qualifiers are converted with the samples, one per jesd clock)
+        clocks_per_group = jesd_settings.get_clocks_per_group(link_data_width)
+        source_valid = Signal()
+        source_first = Signal()
+        source_last  = Signal()
+        if converter_gearbox:
+            gearbox = ConverterGearboxRX(
+                layout           = [("s"+str(i), len(s)) for i, s in enumerate(self.source.payload.flatten())] +
+                    [("valid", converter_ratio), ("first", converter_ratio), ("last", converter_ratio)],
+                ratio            = converter_ratio,
+                clocks_per_group = clocks_per_group,
+                converter_cd     = converter_cd,
+                depth            = cdc_depth)
+            self.submodules.converter_gearbox = gearbox
+            self.comb += [
+                gearbox.valid.eq(transport.valid),
+                gearbox.sink.raw_bits().eq(Cat(*source, *source_ctrl,
+                    Replicate(source_valid, clocks_per_group),
+                    Replicate(source_first, clocks_per_group),
+                    Replicate(source_last,  clocks_per_group))),
+                self.source.valid.eq(gearbox.source.valid != 0),
+                self.source.first.eq(gearbox.source.first != 0),
+                self.source.last.eq(gearbox.source.last != 0),
+            ]
+            source      = gearbox.source.flatten()[:len(source)]
+            source_ctrl = gearbox.source.flatten()[len(source):len(source) + len(source_ctrl)]
+        else:
+            self.comb += [
+                self.source.valid.eq(source_valid),
+                self.source.first.eq(source_first),
+                self.source.last.eq(source_last),
+            ]
+        for i, s in enumerate(source_ctrl):
+            self.comb += getattr(self.source, "converter{}_ctrl".format(i)).eq(s)
 
         # STPL
-        stpl = LiteJESD204BSTPLChecker(jesd_settings, converter_data_width, stpl_random)
+        stpl = LiteJESD204BSTPLChecker(jesd_settings, transport_data_width, stpl_random,
+            pipeline_stages=transport_pipeline_stages)
         stpl = ClockDomainsRenamer("jesd")(stpl)
         self.submodules.stpl = stpl
         self.comb += \
             If(self.stpl_enable,
                 stpl.sink.eq(transport.source)
             ).Else(
-                self.source.eq(transport.source)
+                *[getattr(self.source, "converter"+str(i)).eq(s) for i, s in enumerate(source)]
             )
 
-        # LMFC
-        lmfc = LMFC(jesd_settings.lmfc_cycles, load=-(1 + 4)) # jref + ebuf latency
-        lmfc = ClockDomainsRenamer("jesd")(lmfc)
-        self.submodules.lmfc = lmfc
-        self.sync.jesd += lmfc.jref.eq(self.jref)
+        # LMFC (loaded behind SYSREF by the latency between the PHYs and the links, to be aligned at
+        # the PHYs)
+        coding_latency, cdc_latency = get_phys_latency(LiteJESD204BCodingRX,
+            [phy.source.data for phy in phys], link_data_width, phy_cdc, cdc_depth, fabric_8b10b, link_mode)
+        lmfc_cycles = jesd_settings.get_lmfc_cycles(link_data_width)
+        lmfc_zero   = Signal()
+        self.lmfc_shared = lmfc is not None
+        if lmfc is None:
+            lmfc = LMFC(lmfc_cycles, load=-get_lmfc_load(coding_latency + cdc_latency))
+            lmfc = ClockDomainsRenamer("jesd")(lmfc)
+            self.submodules.lmfc = lmfc
+            self.sync.jesd += lmfc.jref.eq(self.jref)
+        self.lmfc        = lmfc
+        self.lmfc_cycles = lmfc_cycles
+        self.comb += lmfc_zero.eq(lmfc.count_eq(0, lmfc_cycles))
+
+        # Release LMFC: LMFC delayed by the RBD (Receive Buffer Delay, in jesd clock cycles). Skew
+        # FIFOs are released on its zero, allowing the RX latency to be trimmed to the lowest
+        # deterministic value (all lanes must still be received before the release).
+        self.rbd          = Signal(max=lmfc_cycles)
+        self.release_zero = Signal()
+        release_count     = Signal(max=lmfc_cycles)
+        self.sync.jesd += [
+            If(lmfc.count_eq(lmfc_cycles - 1, lmfc_cycles),
+                release_count.eq(Mux(self.rbd == 0, 0, lmfc_cycles - self.rbd))
+            ).Elif(release_count == (lmfc_cycles - 1),
+                release_count.eq(0)
+            ).Else(
+                release_count.eq(release_count + 1)
+            )
+        ]
+        self.comb += self.release_zero.eq(release_count == 0)
+        def release_count_eq(value):
+            return release_count == (value%lmfc_cycles)
+
+        # Transport groups of frames start with the multiframes (skew FIFOs are released on the
+        # cycle following the release LMFC).
+        self.comb += transport.start.eq(release_count_eq(1))
+
+        # Source valid from the second multiframe once the links are ready (the first one starts
+        # with the descrambler synchronization), first/last on multiframes boundaries (on the clocks
+        # of the first/last chunks of the multiframes when converted by the gearbox, on the updates
+        # of the first/last groups of frames when provided directly), delayed by the transport
+        # pipeline stages.
+        if converter_gearbox or clocks_per_group == 1:
+            update      = 1
+            delay       = clocks_per_group if clocks_per_group > 1 else 0
+            first_count = 1 + delay
+            last_count  = delay
+        else:
+            update      = transport.valid
+            first_count = 1 + clocks_per_group
+            last_count  = 1
+        first_count += transport.latency
+        last_count  += transport.latency
+        # Samples are not valid while lanes are masked (restarting from the second multiframe once
+        # they are released).
+        primed  = Signal()
+        started = Signal()
+        self.sync.jesd += \
+            If(~self.ready | (lanes_masked != 0),
+                primed.eq(0),
+                started.eq(0)
+            ).Elif(source_first,
+                primed.eq(1),
+                started.eq(primed)
+            )
+        self.comb += [
+            source_first.eq(update & release_count_eq(first_count)),
+            source_last.eq(update & release_count_eq(last_count)),
+            source_valid.eq(self.ready & (lanes_masked == 0) & update & (started | (source_first & primed))),
+        ]
 
         # Links
-        self.links      = links      = []
-        self.skew_fifos = skew_fifos = []
+        raw_width = get_raw_width(link_data_width, fabric_8b10b, link_mode)
+        link_cls  = {"8b10b": LiteJESD204BLinkRX, "64b66b": LiteJESD204CLinkRX}[link_mode]
+        link_kwargs = {"test_patterns": True} if test_patterns else {} # 8b/10b links only.
+        if link_mode == "8b10b":
+            link_kwargs["error_reporting"] = False # Reported by the core.
+        if skew_fifo_depth is None:
+            skew_fifo_depth = lmfc_cycles
+        ready_d = Signal()
+        self.sync.jesd += ready_d.eq(self.ready)
+        self.links            = links            = []
+        self.skew_fifos       = skew_fifos       = []
+        self.skew_fifo_levels = skew_fifo_levels = []
+        masked            = []
+        recovery_timeouts = []
         for n, (phy, lane) in enumerate(zip(phys, transport.sink.flatten())):
-            phy_name = "jesd_phy{}".format(n if not hasattr(phy, "n") else phy.n)
+            phy_name = "jesd_phy{}".format(lane_offset + n if not hasattr(phy, "n") else phy.n)
             phy_cd = phy_name + "_rx"
 
-            cdc = LiteJESD204BRXCDC(phy, phy_cd)
-            setattr(self.submodules, "cdc"+str(n), cdc)
+            if phy_cdc:
+                cdc = LiteJESD204BRXCDC(phy, phy_cd, link_data_width, cdc_depth, raw_width)
+                setattr(self.submodules, "cdc"+str(n), cdc)
+            else:
+                assert get_phy_data_width(phy.source.data, raw_width, link_data_width) == link_data_width
 
-            link = LiteJESD204BLinkRX(32, jesd_settings, n)
-            link = ClockDomainsRenamer("jesd")(link)
+            link = link_cls(link_data_width, jesd_settings, n,
+                pipeline_stages=link_pipeline_stages, **link_kwargs)
+            link = ClockDomainsRenamer("jesd" if phy_cdc else phy_cd)(link)
             self.submodules += link
             links.append(link)
+            if test_patterns:
+                self.test_errors.append(link.test_errors)
+                self.test_errors_latched.append(link.test_errors_latched)
+                self.comb += [
+                    link.test_mode.eq(self.test_mode),
+                    link.test_errors_latch.eq(self.test_errors_latch[n])
+                ]
+            if link_mode == "8b10b":
+                self.ilas_configurations.append(link.ilas_configuration)
+                self.ilas_captured.append(link.ilas_captured)
+                self.ilas_mismatches.append(link.ilas_mismatch)
             self.comb += [
                 link.reset.eq(~self.enable),
                 link.ilas_check.eq(self.ilas_check),
                 link.datapath.descrambler.enable.eq(int(scrambling)),
                 link.jref.eq(self.jref),
-                link.lmfc_zero.eq(self.lmfc.zero),
-                phy.rx_align.eq(link.align)
+                link.lmfc_zero.eq(lmfc_zero),
             ]
 
-            skew_fifo = SyncFIFO(32, jesd_settings.lmfc_cycles)
+            # Alignment monitoring (sticky until link re-initialization or clear).
+            self.sync.jesd += [
+                If(~link.ready | self.align_errors_clear,
+                    self.frame_align_errors[n].eq(0),
+                    self.lane_align_errors[n].eq(0)
+                ).Else(
+                    If(link.frame_align_error != 0, self.frame_align_errors[n].eq(1)),
+                    If(link.lane_align_error != 0,  self.lane_align_errors[n].eq(1))
+                )
+            ]
+
+            if skew_fifo_buffered:
+                skew_fifo = SyncFIFOBuffered(link_data_width, skew_fifo_depth)
+            else:
+                skew_fifo = SyncFIFO(link_data_width, skew_fifo_depth)
             skew_fifo = ClockDomainsRenamer("jesd")(skew_fifo)
             skew_fifo = ResetInserter()(skew_fifo)
             skew_fifos.append(skew_fifo)
             self.submodules += skew_fifo
+
+            # Lane recovery: lane dropped (masked) until its skew FIFO is released again.
+            masked.append(Signal())
+            masked_d = Signal()
+            self.comb += lanes_masked[n].eq(masked[n])
+            self.sync.jesd += masked_d.eq(masked[n])
+            if lane_restart_recovery:
+                dropped    = Signal()
+                recovering = Signal()
+                self.comb += [
+                    dropped.eq(self.lane_recovery & self.ready & ~link.ready),
+                    masked[n].eq(dropped | recovering)
+                ]
+                self.sync.jesd += [
+                    If(~self.lane_recovery | ~self.ready,
+                        recovering.eq(0)
+                    ).Elif(dropped,
+                        recovering.eq(1)
+                    ).Elif(self.release_zero & link.ready,
+                        recovering.eq(0)
+                    )
+                ]
+                recovery_timer = WaitTimer(lane_recovery_timeout*lmfc_cycles)
+                recovery_timer = ClockDomainsRenamer("jesd")(recovery_timer)
+                self.submodules += recovery_timer
+                self.comb += recovery_timer.wait.eq(masked[n] & ~link.ready)
+                recovery_timeouts.append(recovery_timer.done)
+                lane_recovery = self.lane_recoveries[n]
+                recovery_time = Signal(len(lane_recovery.time))
+                self.sync.jesd += [
+                    If(masked[n],
+                        If(~masked_d,
+                            saturating_increment(lane_recovery.count),
+                            recovery_time.eq(1)
+                        ).Else(
+                            saturating_increment(recovery_time)
+                        )
+                    ).Elif(masked_d,
+                        lane_recovery.time.eq(recovery_time)
+                    )
+                ]
+
             self.comb += [
                 skew_fifo.reset.eq(~link.ready),
                 skew_fifo.we.eq(1),
-                skew_fifo.re.eq(self.ready),
+                skew_fifo.re.eq(self.ready & ~masked[n]),
             ]
 
+            # Skew FIFO level latched on release/recovery (lane's skew margin: skew_fifo_depth - level).
+            skew_fifo_level = Signal(len(skew_fifo.level))
+            skew_fifo_levels.append(skew_fifo_level)
+            self.sync.jesd += If(self.ready & (~ready_d | (masked_d & ~masked[n])),
+                skew_fifo_level.eq(skew_fifo.level)
+            )
+
             # connect data
+            code_error = Signal(link_data_width//8 if fabric_8b10b else 1)
+            if phy_cdc:
+                self.comb += [
+                    phy.source.connect(cdc.sink, omit={"ctrl"} if raw_width is not None else set()),
+                    cdc.source.ready.eq(1)
+                ]
+                lane_source = cdc.source
+            else:
+                self.comb += phy.source.ready.eq(1)
+                lane_source = phy.source
+            if fabric_8b10b:
+                coding = LiteJESD204BCodingRX(link_data_width)
+                coding = ClockDomainsRenamer("jesd" if phy_cdc else phy_cd)(coding)
+                setattr(self.submodules, "coding"+str(n), coding)
+                self.comb += [
+                    coding.align.eq(link.align),
+                    coding.sink.eq(lane_source.data),
+                    link.sink.data.eq(coding.source.data),
+                    link.sink.ctrl.eq(coding.source.ctrl),
+                    code_error.eq(coding.disparity_errors | coding.not_in_table_errors),
+                    link.code_error.eq(code_error != 0)
+                ]
+
+                # 8b/10b errors monitoring (sticky until link re-initialization or clear).
+                self.sync.jesd += [
+                    If(~link.ready | self.code_errors_clear,
+                        self.disparity_errors[n].eq(0),
+                        self.not_in_table_errors[n].eq(0)
+                    ).Else(
+                        If(coding.disparity_errors != 0,    self.disparity_errors[n].eq(1)),
+                        If(coding.not_in_table_errors != 0, self.not_in_table_errors[n].eq(1))
+                    )
+                ]
+            elif link_mode == "64b66b":
+                self.comb += [
+                    link.sink.data.eq(lane_source.data),
+                    code_error.eq(link.crc_error)
+                ]
+
+                # CRC errors monitoring (sticky until link re-initialization or clear).
+                self.sync.jesd += [
+                    If(~link.ready | self.code_errors_clear,
+                        self.crc_errors[n].eq(0)
+                    ).Elif(link.crc_error,
+                        self.crc_errors[n].eq(1)
+                    )
+                ]
+            else:
+                self.comb += [
+                    phy.rx_align.eq(link.align),
+                    link.sink.data.eq(lane_source.data),
+                    link.sink.ctrl.eq(lane_source.ctrl)
+                ]
             self.comb += [
-                phy.source.connect(cdc.sink),
-                link.sink.data.eq(cdc.source.data),
-                link.sink.ctrl.eq(cdc.source.ctrl),
-                cdc.source.ready.eq(1),
                 skew_fifo.din.eq(link.source.data),
-                lane.eq(skew_fifo.dout)
+                lane.eq(Mux(masked[n], 0, skew_fifo.dout))
             ]
 
+            # Error counters (latched and cleared together).
+            error_counters         = self.error_counters[n]
+            error_counters_latched = self.error_counters_latched[n]
+            latch = self.error_counters_latch[n]
+            self.sync.jesd += [
+                If(latch,
+                    error_counters_latched.eq(error_counters)
+                ),
+                If(link.ready,
+                    saturating_add(error_counters.unexpected_control, link.unexpected_control_error, latch),
+                    saturating_add(error_counters.frame_align,        link.frame_align_error,        latch),
+                    saturating_add(error_counters.lane_align,         link.lane_align_error,         latch),
+                    *([saturating_add(error_counters.code, code_error, latch)] if code_errors else [])
+                ).Elif(latch,
+                    *[getattr(error_counters, name).eq(0) for name, _ in error_counters.layout]
+                )
+            ]
+
+        # SYNC~ errors reports (lanes' errors serialized on a single reporter).
+        error_report = Signal()
+        if link_mode == "8b10b":
+            error_reporter = ErrorReporter(get_error_report_cycles(link_data_width, jesd_settings.octets_per_lane))
+            error_reporter = ClockDomainsRenamer("jesd")(error_reporter)
+            self.submodules.error_reporter = error_reporter
+            self.comb += [
+                error_reporter.error.eq(Reduce("OR", [link.error & ~masked[n] for n, link in enumerate(links)])),
+                error_report.eq(error_reporter.report)
+            ]
+
+        self.comb += [
+            self.links_jsync.eq(Reduce("AND", [link.jsync | masked[n] for n, link in enumerate(links)]) & ~error_report),
+            self.links_ready.eq(Reduce("AND", [link.ready | masked[n] for n, link in enumerate(links)]) &
+                                Reduce("OR",  [link.ready for link in links])),
+        ]
+        recovery_timeout = Signal()
+        if lane_restart_recovery:
+            self.comb += recovery_timeout.eq(Reduce("OR", recovery_timeouts))
         self.sync.jesd += [
-            self.jsync.eq(Reduce("AND", [link.jsync for link in links])),
-            If(lmfc.zero,
-                self.ready.eq(Reduce("AND", [link.ready for link in links]))
+            self.jsync.eq(self.links_jsync & self.group_jsync),
+            If(recovery_timeout,
+                self.ready.eq(0)
+            ).Elif(self.release_zero & self.group_release,
+                self.ready.eq(self.links_ready & self.group_ready)
             ),
         ]
 
+        # Profilers (core and lanes, with their link FSM states, latched together).
+        if profilers:
+            self.profiler_clear = Signal()
+            self.profiler_latch = Signal()
+            profiler = LinkProfiler()
+            profiler = ClockDomainsRenamer("jesd")(profiler)
+            self.submodules.profiler = profiler
+            self.comb += [
+                profiler.enable.eq(self.enable),
+                profiler.ready.eq(self.ready),
+                profiler.clear.eq(self.profiler_clear),
+                profiler.latch.eq(self.profiler_latch)
+            ]
+            self.lane_profilers = []
+            for link in links:
+                lane_profiler = LinkProfiler(getattr(link, "fsm", None))
+                lane_profiler = ClockDomainsRenamer("jesd")(lane_profiler)
+                self.submodules += lane_profiler
+                self.lane_profilers.append(lane_profiler)
+                self.comb += [
+                    lane_profiler.enable.eq(self.enable),
+                    lane_profiler.ready.eq(link.ready),
+                    lane_profiler.clear.eq(self.profiler_clear),
+                    lane_profiler.latch.eq(self.profiler_latch)
+                ]
+
+        # Latency
+        self.latency_stages = {
+            "cdc"               : cdc_latency,
+            "coding"            : coding_latency,
+            "link"              : links[0].datapath.latency,
+            "transport"         : transport.latency,
+            "converter_gearbox" : gearbox.latency if converter_gearbox else 0,
+        }
+        self.latency = sum(self.latency_stages.values())
+        if max_latency is not None:
+            assert self.latency <= max_latency
+
     def register_jsync(self, jsync, polarity=0b0):
         self.jsync_registered = True
         _jsync = Signal()
@@ -332,7 +1403,190 @@ class LiteJESD204BCoreRX(Module):
         assert hasattr(self, "jsync_registered")
         assert hasattr(self, "jref_registered")
 
-# Core Control ----------------------------------------------------------------------------------
+# Multi-Link Core ----------------------------------------------------------------------------------
+
+class LiteJESD204BMultiLinkCore(Module):
+    """Multi-Link Core
+
+    Several JESD204B links (ex one per converter device) with their own settings, transport,
+    converters' interface and SYNC~, sharing one LMFC and SYSREF. Each link is implemented by a core
+    (in cores, to be controlled and to register its SYNC~ individually), PHYs' clock domains are
+    numbered over all the lanes. The LMFC period is the least common multiple of the links' ones.
+    """
+    def __init__(self, core_cls, lmfc_load, phys, jesd_settings, converter_data_width,
+        link_data_width=32, **kwargs):
+        assert len(phys) == len(jesd_settings)
+        if not isinstance(converter_data_width, (list, tuple)):
+            converter_data_width = [converter_data_width]*len(jesd_settings)
+        self.jref  = Signal()
+        self.ready = Signal()
+
+        # # #
+
+        # Shared LMFC
+        lmfc_cycles = 1
+        for settings in jesd_settings:
+            cycles      = settings.get_lmfc_cycles(link_data_width)
+            lmfc_cycles = lmfc_cycles*cycles//gcd(lmfc_cycles, cycles)
+        lmfc = LMFC(lmfc_cycles, load=lmfc_load)
+        lmfc = ClockDomainsRenamer("jesd")(lmfc)
+        self.submodules.lmfc = lmfc
+        self.sync.jesd += lmfc.jref.eq(self.jref)
+
+        # Links' cores
+        self.cores  = cores = []
+        lane_offset = 0
+        for n, (link_phys, settings, data_width) in enumerate(zip(phys, jesd_settings, converter_data_width)):
+            core = core_cls(link_phys, settings, data_width,
+                link_data_width = link_data_width,
+                lmfc            = lmfc,
+                lane_offset     = lane_offset,
+                **kwargs)
+            core.register_jref(self.jref)
+            setattr(self.submodules, "core"+str(n), core)
+            cores.append(core)
+            lane_offset += len(link_phys)
+        self.comb += self.ready.eq(Reduce("AND", [core.ready for core in cores]))
+
+    def register_jref(self, jref):
+        self.jref_registered = True
+        if isinstance(jref, Signal):
+            self.comb += self.jref.eq(jref)
+        elif isinstance(jref, Record):
+            self.specials += DifferentialInput(jref.p, jref.n, self.jref)
+        else:
+            raise ValueError
+
+    def do_finalize(self):
+        assert hasattr(self, "jref_registered")
+
+
+class LiteJESD204BMultiLinkCoreTX(LiteJESD204BMultiLinkCore):
+    def __init__(self, phys, jesd_settings, converter_data_width, link_data_width=32, cdc_depth=4,
+        phy_cdc=True, fabric_8b10b=False, link_mode="8b10b", **kwargs):
+        phys_latency = get_phys_latency(LiteJESD204BCodingTX, [phy.sink.data for link_phys in phys for phy in link_phys],
+            link_data_width, phy_cdc, cdc_depth, fabric_8b10b, link_mode)
+        LiteJESD204BMultiLinkCore.__init__(self, LiteJESD204BCoreTX, get_lmfc_load(sum(phys_latency)),
+            phys, jesd_settings, converter_data_width, link_data_width,
+            cdc_depth=cdc_depth, phy_cdc=phy_cdc, fabric_8b10b=fabric_8b10b, link_mode=link_mode,
+            **kwargs)
+
+
+class LiteJESD204BMultiLinkCoreRX(LiteJESD204BMultiLinkCore):
+    def __init__(self, phys, jesd_settings, converter_data_width, link_data_width=32, cdc_depth=4,
+        phy_cdc=True, fabric_8b10b=False, link_mode="8b10b", **kwargs):
+        phys_latency = get_phys_latency(LiteJESD204BCodingRX, [phy.source.data for link_phys in phys for phy in link_phys],
+            link_data_width, phy_cdc, cdc_depth, fabric_8b10b, link_mode)
+        LiteJESD204BMultiLinkCore.__init__(self, LiteJESD204BCoreRX, -get_lmfc_load(sum(phys_latency)),
+            phys, jesd_settings, converter_data_width, link_data_width,
+            cdc_depth=cdc_depth, phy_cdc=phy_cdc, fabric_8b10b=fabric_8b10b, link_mode=link_mode,
+            **kwargs)
+
+# RX Synchronization Group -------------------------------------------------------------------------
+
+class LiteJESD204BRXSyncGroup(Module):
+    """RX Synchronization Group
+
+    Groups RX cores (ex one per ADC device) for aligned multi-device capture: SYNC~ is combined
+    across all the cores and the skew FIFOs of all the cores are released together, on the same
+    release LMFC edge (of the core with the longest LMFC period, which must be a multiple of the
+    other cores' ones). Cores must share the jesd clock, SYSREF and RBD.
+
+    The skew between the earliest and the latest lanes of the group (in jesd clock cycles) is
+    reported from the skew FIFOs' levels latched on release.
+    """
+    def __init__(self, cores):
+        levels = [level for core in cores for level in core.skew_fifo_levels]
+        self.jsync = Signal()
+        self.ready = Signal()
+        self.skew  = Signal(max(len(level) for level in levels))
+
+        # # #
+
+        reference = max(cores, key=lambda core: core.lmfc_cycles)
+        for core in cores:
+            assert reference.lmfc_cycles%core.lmfc_cycles == 0
+
+        # Combined SYNC~ and common release.
+        group_jsync = Reduce("AND", [core.links_jsync for core in cores])
+        group_ready = Reduce("AND", [core.links_ready for core in cores])
+        for core in cores:
+            self.comb += [
+                core.group_jsync.eq(group_jsync),
+                core.group_ready.eq(group_ready),
+                core.group_release.eq(reference.release_zero),
+            ]
+        self.comb += [
+            self.jsync.eq(Reduce("AND", [core.jsync for core in cores])),
+            self.ready.eq(Reduce("AND", [core.ready for core in cores])),
+        ]
+
+        # Skew (difference between the highest and lowest skew FIFOs' levels on release).
+        level_min = levels[0]
+        level_max = levels[0]
+        for level in levels[1:]:
+            level_min = Mux(level < level_min, level, level_min)
+            level_max = Mux(level > level_max, level, level_max)
+        self.comb += self.skew.eq(level_max - level_min)
+
+# SYSREF Control -----------------------------------------------------------------------------------
+
+class LiteJESD204BSYSREFControl(Module, AutoCSR):
+    def __init__(self, lmfc):
+        self.control = CSRStorage(fields=[
+            CSRField("mode", size=2, offset=0, values=[
+                ("``0b00``", "Continuous: LMFC reloaded on all the SYSREF rising edges."),
+                ("``0b01``", "One-shot: LMFC reloaded on the first SYSREF rising edge after rearm."),
+                ("``0b10``", "N-shot: LMFC reloaded on the first ``shots`` SYSREF rising edges after rearm."),
+                ("``0b11``", "Reserved (continuous)."),
+            ]),
+            CSRField("shots", size=len(lmfc.shots), offset=8, reset=1,
+                description="SYSREF rising edges reloading the LMFC in N-shot mode (0: all)."),
+            CSRField("rearm", size=1, offset=16, pulse=True,
+                description="Rearm one-shot/N-shot SYSREF capture."),
+            CSRField("monitor_latch", size=1, offset=17, pulse=True,
+                description="Latch the SYSREF monitor to ``status`` and clear its edges/off-phase edges."),
+        ])
+        monitor_descriptions = {
+            "count"     : "LMFC count on the last SYSREF rising edge (before reload, latched with ``monitor_latch``)",
+            "edges"     : "SYSREF rising edges (saturating, latched and cleared with ``monitor_latch``)",
+            "off_phase" : "SYSREF rising edges not aligned with the LMFC, even ignored (saturating, latched and "
+                          "cleared with ``monitor_latch``)",
+        }
+        self.status = CSRStatus(fields=[
+            CSRField(field, size=size, offset=16*i, description=monitor_descriptions[field] + ".")
+            for i, (field, size) in enumerate(lmfc_monitor_layout)])
+
+        # # #
+
+        # Capture mode
+        shots = Signal(len(lmfc.shots))
+        self.comb += Case(self.control.fields.mode, {
+            0b00 : shots.eq(0),
+            0b01 : shots.eq(1),
+            0b10 : shots.eq(self.control.fields.shots),
+            0b11 : shots.eq(0), # Reserved.
+        })
+        self.specials += MultiReg(shots, lmfc.shots, "jesd")
+        rearm = PulseSynchronizer("sys", "jesd")
+        self.submodules += rearm
+        self.comb += [
+            rearm.i.eq(self.control.fields.rearm),
+            lmfc.rearm.eq(rearm.o)
+        ]
+
+        # Monitor (latched and cleared in the jesd domain on request, only the latched (stable) copy
+        # crossing to sys).
+        monitor_latch = PulseSynchronizer("sys", "jesd")
+        self.submodules += monitor_latch
+        self.comb += [
+            monitor_latch.i.eq(self.control.fields.monitor_latch),
+            lmfc.monitor_latch.eq(monitor_latch.o)
+        ]
+        for field, _ in lmfc_monitor_layout:
+            self.specials += MultiReg(getattr(lmfc.monitor_latched, field), getattr(self.status.fields, field), "sys")
+
+# Core Control -------------------------------------------------------------------------------------
 
 class LiteJESD204BCoreControl(Module, AutoCSR):
     def __init__(self, core, sys_clk_freq, default_enable=0, default_ilas_check_disable=0, default_stpl_enable=0):
@@ -344,7 +1598,26 @@ class LiteJESD204BCoreControl(Module, AutoCSR):
             CSRField("ilas_check_disable", size=1, offset=8, values=[
                 ("``0b0``", "Enable  RX ILAS Check."),
                 ("``0b1``", "Disable RX ILAS Check.")
-            ], reset=default_ilas_check_disable)
+            ], reset=default_ilas_check_disable),
+            CSRField("lane_recovery", size=1, offset=9, values=[
+                ("``0b0``", "RX lane drop re-synchronizes all the lanes."),
+                ("``0b1``", "RX lane drop recovers the lane only (``RX only``).")
+            ], description="RX lane recovery (RX cores with ``lane_restart_recovery``, only for TXs restarting "
+                "their lanes by themselves, ex with ``lane_restart``): the dropped lane's ``SYNC~`` request is "
+                "masked, all the lanes being re-synchronized after the recovery timeout when the TX does not "
+                "restart it. Samples are not valid while lanes are masked (cf ``lanes_masked``)."),
+            CSRField("align_errors_clear", size=1, offset=16, pulse=True,
+                description="Clear RX alignment errors (``RX only``)."),
+            CSRField("code_errors_clear", size=1, offset=17, pulse=True,
+                description="Clear RX 8b/10b/CRC errors (``RX only``, fabric 8b/10b or 64b/66b)."),
+            CSRField("profiler_clear", size=1, offset=18, pulse=True,
+                description="Clear profiler's dwell times/entries and drops (with profilers)."),
+            CSRField("errors_latch", size=1, offset=19, pulse=True,
+                description="Latch the error counters to ``laneN_errors``/``laneN_test_errors`` (RX) or "
+                    "``sync_error_reports`` (TX) and clear them."),
+            CSRField("profiler_latch", size=1, offset=20, pulse=True,
+                description="Latch all the profilers' counters to the profilers' CSRs (to be done before reading "
+                    "them, with profilers)."),
         ])
         self.status = CSRStatus(fields=[
             CSRField("ready", size=1, offset=0, values=[
@@ -361,23 +1634,314 @@ class LiteJESD204BCoreControl(Module, AutoCSR):
             ], reset=default_stpl_enable)
         ])
         self.stpl_errors = CSRStatus(32, description="STPL test errors.")
-        self.lmfc        = CSRStorage(fields=[
-            CSRField("load_on_sysref", size=len(core.lmfc.load),
-                reset       = core.lmfc.load.reset,
-                description = "LMFC reload value on SYSREF rising edge."),
+        stage_size = max(8,  bits_for(max(core.latency_stages.values())))
+        total_size = max(16, bits_for(core.latency))
+        self.latency = CSRStatus(fields=[
+            CSRField(stage, size=stage_size, offset=stage_size*i, reset=latency,
+                description="JESD {} latency (in JESD clock cycles).".format(stage.replace("_", " ")))
+            for i, (stage, latency) in enumerate(core.latency_stages.items())] + [
+            CSRField("total", size=total_size, offset=stage_size*len(core.latency_stages), reset=core.latency,
+                description="JESD total latency (in JESD clock cycles).")
         ])
+        lmfc_fields = []
+        if not core.lmfc_shared: # Shared LMFC is controlled by its owner.
+            lmfc_fields.append(CSRField("load_on_sysref", size=len(core.lmfc.load),
+                reset       = core.lmfc.load.reset,
+                description = "LMFC reload value on SYSREF rising edge."))
+        if hasattr(core, "rbd"):
+            lmfc_fields.append(CSRField("rbd", size=len(core.rbd), offset=16,
+                description = "Receive Buffer Delay: skew FIFOs release offset from the LMFC (in JESD clock cycles, ``RX only``)."))
+        if lmfc_fields:
+            self.lmfc = CSRStorage(fields=lmfc_fields)
+        if not core.lmfc_shared:
+            self.submodules.sysref = LiteJESD204BSYSREFControl(core.lmfc)
+        if hasattr(core, "skew_fifo_levels"):
+            for n, level in enumerate(core.skew_fifo_levels):
+                name = "skew_fifo{}_level".format(n)
+                setattr(self, name, CSRStatus(len(level), name=name,
+                    description="Lane {} skew FIFO level on release (``RX only``).".format(n)))
+        if hasattr(core, "lane_align_errors"):
+            self.frame_align_errors = CSRStatus(len(core.frame_align_errors),
+                description="Per-lane frame alignment errors (misplaced ``/F/``) since link-up/clear.")
+            self.lane_align_errors  = CSRStatus(len(core.lane_align_errors),
+                description="Per-lane lane alignment errors (misplaced ``/A/``) since link-up/clear.")
+        if hasattr(core, "disparity_errors"):
+            self.disparity_errors    = CSRStatus(len(core.disparity_errors),
+                description="Per-lane 8b/10b disparity errors since link-up/clear.")
+            self.not_in_table_errors = CSRStatus(len(core.not_in_table_errors),
+                description="Per-lane 8b/10b not-in-table errors since link-up/clear.")
+        if hasattr(core, "crc_errors"):
+            self.crc_errors = CSRStatus(len(core.crc_errors),
+                description="Per-lane 64b/66b CRC-12 errors since link-up/clear.")
+        if hasattr(core, "error_counters"):
+            error_counters_descriptions = {
+                "code"               : "8b/10b (fabric 8b/10b, in octets) or CRC-12 (64b/66b, in multiblocks) errors",
+                "unexpected_control" : "unexpected control characters (other than ``/F/`` and ``/A/``, in octets)",
+                "frame_align"        : "frame alignment errors (misplaced ``/F/``, in octets)",
+                "lane_align"         : "lane alignment errors (misplaced ``/A/`` octets or 64b/66b pilots)",
+            }
+            for n, error_counters in enumerate(core.error_counters):
+                name = "lane{}_errors".format(n)
+                setattr(self, name, CSRStatus(name=name, fields=[
+                    CSRField(field, size=size, offset=sum(s for _, s in error_counters.layout[:i]),
+                        description="Lane {} {} (saturating, latched and cleared with ``errors_latch``, "
+                            "``RX only``).".format(n, error_counters_descriptions[field]))
+                    for i, (field, size) in enumerate(error_counters.layout)]))
+        if hasattr(core, "profiler"):
+            profiler_descriptions = {
+                "bring_up" : "last bring-up duration (in JESD clock cycles, from enable/drop to ready)",
+                "link_up"  : "link-up time (in JESD clock cycles, since ready)",
+                "drops"    : "drops (ready lost while enabled)",
+            }
+            profilers = [("profiler", "Link", core.profiler)] + [
+                ("lane{}_profiler".format(n), "Lane {}".format(n), lane_profiler)
+                for n, lane_profiler in enumerate(core.lane_profilers)]
+            for name, prefix, profiler in profilers:
+                setattr(self, name, CSRStatus(name=name, fields=[
+                    CSRField(field, size=size, offset=sum(size for _, size in link_profiler_layout[:i]),
+                        description="{} {} (latched with ``profiler_latch``).".format(
+                            prefix, profiler_descriptions[field]))
+                    for i, (field, size) in enumerate(link_profiler_layout)]))
+                for state in profiler.states.keys():
+                    state_name = name + "_" + state.lower().replace("-", "_")
+                    setattr(self, state_name, CSRStatus(name=state_name, fields=[
+                        CSRField("dwell", size=48, offset=0,
+                            description="{} {} dwell time (in JESD clock cycles, latched with "
+                                "``profiler_latch``).".format(prefix, state)),
+                        CSRField("entries", size=16, offset=48,
+                            description="{} {} entries (latched with ``profiler_latch``).".format(prefix, state)),
+                    ]))
+        if hasattr(core, "lane_restart"):
+            self.lane_restart = CSRStorage(fields=[
+                CSRField("lanes", size=len(core.lane_restart), pulse=True,
+                    description="Restart TX lanes (CGS/ILAS on the lanes only, one bit per lane, ``TX only``).")
+            ])
+        if hasattr(core, "lanes_masked"):
+            self.lanes_masked = CSRStatus(len(core.lanes_masked),
+                description="Per-lane masked status (lane dropped/recovering, zeroed samples, ``RX only``).")
+        if hasattr(core, "lane_recoveries"):
+            lane_recovery_descriptions = {
+                "count" : "recoveries (saturating)",
+                "time"  : "last recovery time (in JESD clock cycles, from the drop to the release)",
+            }
+            for n in range(len(core.lane_recoveries)):
+                name = "lane{}_recovery".format(n)
+                setattr(self, name, CSRStatus(name=name, fields=[
+                    CSRField(field, size=size, offset=16*i,
+                        description="Lane {} {} (``RX only``).".format(n, lane_recovery_descriptions[field]))
+                    for i, (field, size) in enumerate(lane_recovery_layout)]))
+        if hasattr(core, "sync_error_reports"):
+            self.sync_error_reports = CSRStatus(32,
+                description="RX errors reported over ``SYNC~`` (saturating, latched and cleared with "
+                    "``errors_latch``, ``TX only``).")
+        if hasattr(core, "test_mode"):
+            self.test_mode = CSRStorage(fields=[
+                CSRField("mode", size=len(core.test_mode), values=[
+                    ("``0b000``", "Normal operation."),
+                    ("``0b001``", "PRBS7 (x^7 + x^6 + 1)."),
+                    ("``0b010``", "PRBS15 (x^15 + x^14 + 1)."),
+                    ("``0b011``", "PRBS23 (x^23 + x^18 + 1)."),
+                    ("``0b100``", "PRBS31 (x^31 + x^28 + 1)."),
+                    ("``0b101``", "Random pattern (RPAT)."),
+                    ("``0b110``", "Scrambled jitter pattern (JSPAT)."),
+                    ("``0b111``", "Continuous ``/K28.5/``."),
+                ], description="Link test pattern, replacing the lanes' CGS/ILAS/data: links are not "
+                    "synchronized while a pattern is selected, select it on TX and RX with the cores "
+                    "disabled then enable them, disable/re-enable them once back to normal operation.")
+            ])
+        if hasattr(core, "test_errors"):
+            for n in range(len(core.test_errors)):
+                name = "lane{}_test_errors".format(n)
+                setattr(self, name, CSRStatus(32, name=name,
+                    description="Lane {} test pattern bit errors (saturating, latched and cleared with "
+                        "``errors_latch``, ``RX only``).".format(n)))
+        if hasattr(core, "ilas_configurations"):
+            for n in range(len(core.ilas_configurations)):
+                fields = []
+                offset = 0
+                for field_name, field in configuration_data_fields.items():
+                    size = min(field.width, 8 - field.offset)
+                    fields.append(CSRField(field_name, size=size, offset=offset,
+                        description="Lane {} received ``{}`` (``RX only``).".format(n, field_name.upper())))
+                    offset += size
+                fields.append(CSRField("captured", size=1, offset=offset,
+                    description="Lane {} configuration captured (``RX only``).".format(n)))
+                name = "lane{}_ilas".format(n)
+                setattr(self, name, CSRStatus(name=name, fields=fields))
+                name = "lane{}_ilas_mismatch".format(n)
+                setattr(self, name, CSRStatus(name=name, fields=[
+                    CSRField(field_name, size=1, offset=i,
+                        description="Lane {} received ``{}`` mismatch (``RX only``).".format(n, field_name.upper()))
+                    for i, field_name in enumerate(configuration_data_fields.keys())]))
 
         # # #
 
         self.specials += [
             MultiReg(self.control.fields.enable,      core.enable,      "jesd"),
             MultiReg(self.stpl_enable.storage,        core.stpl_enable, "jesd"),
-            MultiReg(self.lmfc.fields.load_on_sysref, core.lmfc.load,   "jesd"),
             MultiReg(core.stpl.errors, self.stpl_errors.status,   "sys"),
             MultiReg(core.ready,       self.status.fields.ready,  "sys"),
             MultiReg(core.jsync,       self.status.fields.sync_n, "sys"),
         ]
+        if not core.lmfc_shared:
+            self.specials += MultiReg(self.lmfc.fields.load_on_sysref, core.lmfc.load, "jesd")
+        if hasattr(core, "rbd"):
+            self.specials += MultiReg(self.lmfc.fields.rbd, core.rbd, "jesd")
         if hasattr(core, "skew_fifos"):
             self.specials += MultiReg(core.skew_fifos[0].level, self.status.fields.skew_fifo)
+        if hasattr(core, "skew_fifo_levels"):
+            for n, level in enumerate(core.skew_fifo_levels):
+                self.specials += MultiReg(level, getattr(self, "skew_fifo{}_level".format(n)).status, "sys")
         if hasattr(core, "ilas_check"):
             self.comb += core.ilas_check.eq(~self.control.fields.ilas_check_disable)
+        if hasattr(core, "lane_align_errors"):
+            align_errors_clear = PulseSynchronizer("sys", "jesd")
+            self.submodules += align_errors_clear
+            self.comb += [
+                align_errors_clear.i.eq(self.control.fields.align_errors_clear),
+                core.align_errors_clear.eq(align_errors_clear.o)
+            ]
+            self.specials += [
+                MultiReg(core.frame_align_errors, self.frame_align_errors.status, "sys"),
+                MultiReg(core.lane_align_errors,  self.lane_align_errors.status,  "sys"),
+            ]
+        if hasattr(core, "code_errors_clear"):
+            code_errors_clear = PulseSynchronizer("sys", "jesd")
+            self.submodules += code_errors_clear
+            self.comb += [
+                code_errors_clear.i.eq(self.control.fields.code_errors_clear),
+                core.code_errors_clear.eq(code_errors_clear.o)
+            ]
+        if hasattr(core, "disparity_errors"):
+            self.specials += [
+                MultiReg(core.disparity_errors,    self.disparity_errors.status,    "sys"),
+                MultiReg(core.not_in_table_errors, self.not_in_table_errors.status, "sys"),
+            ]
+        if hasattr(core, "crc_errors"):
+            self.specials += MultiReg(core.crc_errors, self.crc_errors.status, "sys")
+        if hasattr(core, "error_counters"):
+            # Counters latched and cleared in the jesd domain on request, only the latched (stable)
+            # copies crossing to sys.
+            errors_latch = PulseSynchronizer("sys", "jesd")
+            self.submodules += errors_latch
+            self.comb += [
+                errors_latch.i.eq(self.control.fields.errors_latch),
+                core.error_counters_latch.eq(Replicate(errors_latch.o, len(core.error_counters_latch)))
+            ]
+            for n, error_counters in enumerate(core.error_counters_latched):
+                csr = getattr(self, "lane{}_errors".format(n))
+                for field, _ in error_counters.layout:
+                    self.specials += MultiReg(getattr(error_counters, field), getattr(csr.fields, field), "sys")
+        if hasattr(core, "profiler"):
+            profiler_clear = PulseSynchronizer("sys", "jesd")
+            self.submodules += profiler_clear
+            self.comb += [
+                profiler_clear.i.eq(self.control.fields.profiler_clear),
+                core.profiler_clear.eq(profiler_clear.o)
+            ]
+            # Counters snapshot in the jesd domain on request, only the latched (stable) copies
+            # crossing to sys.
+            profiler_latch = PulseSynchronizer("sys", "jesd")
+            self.submodules += profiler_latch
+            self.comb += [
+                profiler_latch.i.eq(self.control.fields.profiler_latch),
+                core.profiler_latch.eq(profiler_latch.o)
+            ]
+            for name, _, profiler in profilers:
+                csr = getattr(self, name)
+                for field, _ in link_profiler_layout:
+                    self.specials += MultiReg(getattr(profiler.latched_status, field), getattr(csr.fields, field), "sys")
+                for state, counters in profiler.latched_states.items():
+                    csr = getattr(self, name + "_" + state.lower().replace("-", "_"))
+                    for field, _ in link_profiler_state_layout:
+                        self.specials += MultiReg(getattr(counters, field), getattr(csr.fields, field), "sys")
+        if hasattr(core, "lane_restart"):
+            for n in range(len(core.lane_restart)):
+                lane_restart = PulseSynchronizer("sys", "jesd")
+                self.submodules += lane_restart
+                self.comb += [
+                    lane_restart.i.eq(self.lane_restart.fields.lanes[n]),
+                    core.lane_restart[n].eq(lane_restart.o)
+                ]
+        if hasattr(core, "lane_recovery"):
+            self.specials += MultiReg(self.control.fields.lane_recovery, core.lane_recovery, "jesd")
+        if hasattr(core, "lanes_masked"):
+            self.specials += MultiReg(core.lanes_masked, self.lanes_masked.status, "sys")
+        if hasattr(core, "lane_recoveries"):
+            for n, lane_recovery in enumerate(core.lane_recoveries):
+                csr = getattr(self, "lane{}_recovery".format(n))
+                for field, _ in lane_recovery_layout:
+                    self.specials += MultiReg(getattr(lane_recovery, field), getattr(csr.fields, field), "sys")
+        if hasattr(core, "sync_error_reports"):
+            # Latched and cleared in the jesd domain on errors_latch, only the latched (stable) copy
+            # crossing to sys.
+            sync_error_reports_latch = PulseSynchronizer("sys", "jesd")
+            self.submodules += sync_error_reports_latch
+            self.comb += [
+                sync_error_reports_latch.i.eq(self.control.fields.errors_latch),
+                core.sync_error_reports_latch.eq(sync_error_reports_latch.o)
+            ]
+            self.specials += MultiReg(core.sync_error_reports_latched, self.sync_error_reports.status, "sys")
+        if hasattr(core, "test_mode"):
+            self.specials += MultiReg(self.test_mode.fields.mode, core.test_mode, "jesd")
+        if hasattr(core, "ilas_configurations"):
+            for n, configuration in enumerate(core.ilas_configurations):
+                csr = getattr(self, "lane{}_ilas".format(n))
+                for field_name, field in configuration_data_fields.items():
+                    self.specials += MultiReg(get_configuration_field(configuration, field),
+                        getattr(csr.fields, field_name), "sys")
+                self.specials += MultiReg(core.ilas_captured[n], csr.fields.captured, "sys")
+                csr = getattr(self, "lane{}_ilas_mismatch".format(n))
+                self.specials += MultiReg(core.ilas_mismatches[n], csr.status, "sys")
+        if hasattr(core, "test_errors"):
+            # Latched and cleared with the error counters (cf errors_latch).
+            test_errors_latch = PulseSynchronizer("sys", "jesd")
+            self.submodules += test_errors_latch
+            self.comb += [
+                test_errors_latch.i.eq(self.control.fields.errors_latch),
+                core.test_errors_latch.eq(Replicate(test_errors_latch.o, len(core.test_errors_latch)))
+            ]
+            for n, test_errors in enumerate(core.test_errors_latched):
+                csr = getattr(self, "lane{}_test_errors".format(n))
+                self.specials += MultiReg(test_errors, csr.status, "sys")
+
+# Multi-Link Core Control --------------------------------------------------------------------------
+
+class LiteJESD204BMultiLinkCoreControl(Module, AutoCSR):
+    def __init__(self, core, sys_clk_freq, **kwargs):
+        self.lmfc = CSRStorage(fields=[
+            CSRField("load_on_sysref", size=len(core.lmfc.load),
+                reset       = core.lmfc.load.reset,
+                description = "Shared LMFC reload value on SYSREF rising edge."),
+        ])
+        self.submodules.sysref = LiteJESD204BSYSREFControl(core.lmfc)
+
+        # # #
+
+        # Links' controls
+        for n, link_core in enumerate(core.cores):
+            setattr(self.submodules, "link"+str(n), LiteJESD204BCoreControl(link_core, sys_clk_freq, **kwargs))
+
+        self.specials += MultiReg(self.lmfc.fields.load_on_sysref, core.lmfc.load, "jesd")
+
+# RX Synchronization Group Control -----------------------------------------------------------------
+
+class LiteJESD204BRXSyncGroupControl(Module, AutoCSR):
+    def __init__(self, group):
+        self.status = CSRStatus(fields=[
+            CSRField("ready", size=1, offset=0, values=[
+                ("``0b0``", "JESD group not ready, all cores are not synchronized."),
+                ("``0b1``", "JESD group ready, all cores are synchronized and released.")
+            ]),
+            CSRField("sync_n", size=1, offset=1, description="JESD combined ``SYNC~`` status."),
+            CSRField("skew",   size=len(group.skew), offset=8,
+                description="Skew between the earliest and latest lanes of the group on release (in JESD clock cycles)."),
+        ])
+
+        # # #
+
+        self.specials += [
+            MultiReg(group.ready, self.status.fields.ready,  "sys"),
+            MultiReg(group.jsync, self.status.fields.sync_n, "sys"),
+            MultiReg(group.skew,  self.status.fields.skew,   "sys"),
+        ]
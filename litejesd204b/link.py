@@ -4,13 +4,18 @@
 # Copyright (c) 2016-2019 Florent Kermarrec <florent@enjoy-digital.fr>
 # SPDX-License-Identifier: BSD-2-Clause
 
+from math import gcd, ceil
 from collections import namedtuple
 
 from migen import *
 
 from litex.gen.genlib.misc import WaitTimer
 
+from litex.soc.cores.prbs import PRBSGenerator, PRBSChecker
+
 from litejesd204b.common import control_characters
+from litejesd204b.common import configuration_data_length, configuration_data_fields
+from litejesd204b.common import JESD204BConfigurationData
 
 
 Control = namedtuple("Control", "value")
@@ -93,7 +98,7 @@ class Descrambler(Scrambler):
             full.eq(Cat(swizzle(sink.data, data_width), state)),
             feedback.eq(full[15:15+data_width] ^
                         full[14:14+data_width] ^
-                        full[0:32])
+                        full[0:data_width])
         ]
 
         source.data.reset_less = True
@@ -110,6 +115,68 @@ class Descrambler(Scrambler):
 
 # Framing ------------------------------------------------------------------------------------------
 
+def get_frame_last_patterns(data_width, octets_per_frame):
+    """Compute the frame_last patterns of the successive clock words
+
+    Frames and clock words are realigned every lcm(octets_per_frame, octets_per_clock) octets, this
+    returns the patterns of the clock words of this period (frames can span several clock words).
+    """
+    octets_per_clock  = data_width//8
+    octets_per_period = octets_per_frame*octets_per_clock//gcd(octets_per_frame, octets_per_clock)
+    patterns = []
+    for i in range(octets_per_period//octets_per_clock):
+        pattern = 0
+        for j in range(octets_per_clock):
+            if (i*octets_per_clock + j + 1)%octets_per_frame == 0:
+                pattern |= (1<<j)
+        patterns.append(pattern)
+    return patterns
+
+
+class FrameTracker(Module):
+    """Frame/Multiframe Tracker
+
+    Generates the frame_last/multiframe_last flags of the clock words from frame and multiframe
+    counters (frames can span several clock words). Counters start on a multiframe boundary.
+    """
+    def __init__(self, data_width, octets_per_frame, frames_per_multiframe):
+        self.frame_last      = Signal(data_width//8)
+        self.multiframe_last = Signal(data_width//8)
+
+        # # #
+
+        octets_per_clock      = data_width//8
+        octets_per_multiframe = octets_per_frame*frames_per_multiframe
+        clocks_per_multiframe = octets_per_multiframe//octets_per_clock
+
+        # Multiframes aligned on clock
+        assert octets_per_multiframe%octets_per_clock == 0
+
+        frame_last_patterns = get_frame_last_patterns(data_width, octets_per_frame)
+
+        # Frame/Multiframe counters
+        frame_counter      = Signal(max=max(len(frame_last_patterns), 2))
+        multiframe_counter = Signal(max=max(clocks_per_multiframe, 2))
+        self.sync += [
+            frame_counter.eq(frame_counter + 1),
+            If(frame_counter == (len(frame_last_patterns)-1),
+                frame_counter.eq(0)
+            ),
+            multiframe_counter.eq(multiframe_counter + 1),
+            If(multiframe_counter == (clocks_per_multiframe-1),
+                multiframe_counter.eq(0)
+            )
+        ]
+
+        self.comb += [
+            Case(frame_counter, {i: self.frame_last.eq(pattern)
+                for i, pattern in enumerate(frame_last_patterns)}),
+            If(multiframe_counter == (clocks_per_multiframe-1),
+                self.multiframe_last.eq(1<<(octets_per_clock-1))
+            )
+        ]
+
+
 @ResetInserter()
 class Framer(Module):
     """Framer"""
@@ -121,152 +188,208 @@ class Framer(Module):
 
         # # #
 
-        frame_width           = octets_per_frame*8
-        frames_per_clock      = data_width//frame_width
-        clocks_per_multiframe = frames_per_multiframe//frames_per_clock
-
-        # At least a frame per clock
-        assert frame_width <= data_width
-        # Multiple number of frame per clock
-        assert data_width%frame_width == 0
-        # Multiframes aligned on clock
-        assert frames_per_multiframe%frames_per_clock == 0
-
-        frame_last = 0
-        for i in range(data_width//8):
-            if (i+1)%octets_per_frame == 0:
-                frame_last |= (1<<i)
-
-        counter = Signal(8)
-        self.sync += counter.eq(counter+1)
-        self.sync += If(source.multiframe_last != 0, counter.eq(0))
+        tracker = FrameTracker(data_width, octets_per_frame, frames_per_multiframe)
+        self.submodules.tracker = tracker
 
         self.comb += [
             source.data.eq(sink.data),
             If(self.enable,
-                source.frame_last.eq(frame_last),
-                If(counter == (clocks_per_multiframe-1),
-                    source.multiframe_last.eq(1<<(data_width//8)-1)
-                )
+                source.frame_last.eq(tracker.frame_last),
+                source.multiframe_last.eq(tracker.multiframe_last)
             )
         ]
 
 @ResetInserter()
 class Deframer(Module):
-    """Deframer"""
+    """Deframer
+
+    Tracks frame/multiframe boundaries of the received data (reset must be released on the first
+    octet of a multiframe, ie just after ILAS) and monitors the position of the received alignment
+    characters (per octet):
+    - frame_align_error:        /F/ received at another position than the end of a frame.
+    - lane_align_error:         /A/ received at another position than the end of a multiframe.
+    - unexpected_control_error: control character other than /F/ and /A/ received.
+    cf section 5.3.3.8
+    """
     def __init__(self, data_width, octets_per_frame, frames_per_multiframe):
         self.sink    = sink   = Record(link_layout(data_width))
-        self.source  = source = Record([("data", data_width)])
+        self.source  = source = Record(link_layout(data_width))
         self.latency = 0
 
+        self.frame_align_error        = Signal(data_width//8)
+        self.lane_align_error         = Signal(data_width//8)
+        self.unexpected_control_error = Signal(data_width//8)
+
         # # #
 
-        frame_width           = octets_per_frame*8
-        frames_per_clock      = data_width//frame_width
-        clocks_per_multiframe = frames_per_multiframe//frames_per_clock
+        tracker = FrameTracker(data_width, octets_per_frame, frames_per_multiframe)
+        self.submodules.tracker = tracker
 
-        # at least a frame per clock
-        assert frame_width <= data_width
-        # multiple number of frame per clock
-        assert data_width%frame_width == 0
-        # multiframes aligned on clock
-        assert frames_per_multiframe%frames_per_clock == 0
+        self.comb += [
+            source.data.eq(sink.data),
+            source.ctrl.eq(sink.ctrl),
+            source.frame_last.eq(tracker.frame_last),
+            source.multiframe_last.eq(tracker.multiframe_last)
+        ]
 
-        # FIXME: start on multiframe boundary?
-        self.comb += source.data.eq(sink.data)
+        # Alignment characters monitoring
+        for i in range(data_width//8):
+            data = sink.data[8*i:8*(i+1)]
+            self.comb += [
+                # /F/ expected at the end of a frame (not at the end of a multiframe).
+                If(sink.ctrl[i] & (data == control_characters["F"]),
+                    self.frame_align_error[i].eq(~tracker.frame_last[i] | tracker.multiframe_last[i])
+                ),
+                # /A/ expected at the end of a multiframe.
+                If(sink.ctrl[i] & (data == control_characters["A"]),
+                    self.lane_align_error[i].eq(~tracker.multiframe_last[i])
+                ),
+                # Only /F/ and /A/ expected in data.
+                self.unexpected_control_error[i].eq(sink.ctrl[i] &
+                    (data != control_characters["F"]) &
+                    (data != control_characters["A"]))
+            ]
 
 # Alignment ----------------------------------------------------------------------------------------
 
+def pipeline(module, record, stages):
+    # Register record over stages and return the registered record.
+    for i in range(stages):
+        record_r = Record(record.layout)
+        module.sync += record_r.eq(record)
+        record = record_r
+    return record
+
+
+@ResetInserter()
 class AlignInserter(Module):
     """Alignment Character Inserter
     cf section 5.3.3.4.3
+
+    Output can be registered over pipeline_stages (reported in latency).
     """
-    def __init__(self, data_width):
+    def __init__(self, data_width, pipeline_stages=0):
         self.scrambling = Signal(reset=1)
         self.sink       = sink   = Record(link_layout(data_width))
-        self.source     = source = Record(link_layout(data_width))
-        self.latency = 0
+        self.source     = Record(link_layout(data_width))
+        self.latency    = pipeline_stages
 
         # # #
 
+        source = Record(link_layout(data_width))
         self.comb += source.eq(sink)
 
-        data_last = [Signal(8) for i in range(data_width//8)]
+        # Last octet of the previous frame (can be in the current or in a previous clock word).
+        frame_data_last = Signal(8)
+        data_last       = frame_data_last
 
         for i in range(data_width//8):
             data = sink.data[8*i:8*(i+1)]
             self.comb += [
                 # With    Scrambling : If last octet in a multiframe equals "A" control character.
-                # Without Scrambling : If last octet in a multiframe equals previous octet.
+                # Without Scrambling : If last octet in a multiframe equals last octet of previous frame.
                 If(sink.multiframe_last[i],
                     If(( self.scrambling & (data == control_characters["A"])) |
-                       (~self.scrambling & (data == data_last[i])),
+                       (~self.scrambling & (data == data_last)),
                         source.ctrl[i].eq(1),
                         source.data[8*i:8*(i+1)].eq(control_characters["A"]),
                     )
                 # With    Scrambling : If last octet in a frame (not at a end of multiframe) equals "F" control character.
-                # Without Scrambling : If last octet in a frame (not at a end of multiframe) equals previous octet.
+                # Without Scrambling : If last octet in a frame (not at a end of multiframe) equals last octet of previous frame.
                 ).Elif(sink.frame_last[i],
                     If(( self.scrambling & (data == control_characters["F"])) |
-                       (~self.scrambling & (data == data_last[i])),
+                       (~self.scrambling & (data == data_last)),
                         source.ctrl[i].eq(1),
                         source.data[8*i:8*(i+1)].eq(control_characters["F"]),
                     )
                 )
             ]
-            self.sync += data_last[i].eq(data)
+            _data_last = Signal(8)
+            self.comb += [
+                _data_last.eq(data_last),
+                If(sink.frame_last[i],
+                    _data_last.eq(data)
+                )
+            ]
+            data_last = _data_last
+        self.sync += frame_data_last.eq(data_last)
+
+        # Pipeline stages
+        self.comb += self.source.eq(pipeline(self, source, pipeline_stages))
 
 
+@ResetInserter()
 class AlignReplacer(Module):
     """Alignment Character Replacer
     cf section 5.3.3.4.3
+
+    Output can be registered over pipeline_stages (reported in latency).
     """
-    def __init__(self, data_width):
+    def __init__(self, data_width, pipeline_stages=0):
         self.scrambling = Signal(reset=1)
         self.sink       = sink   = Record(link_layout(data_width))
-        self.source     = source = Record(link_layout(data_width))
-        self.latency = 0
+        self.source     = Record(link_layout(data_width))
+        self.latency    = pipeline_stages
 
         # # #
 
+        source = Record(link_layout(data_width))
         self.comb += source.eq(sink)
 
-        data_last = [Signal(8) for i in range(data_width//8)]
+        # Last octet of the previous frame (can be in the current or in a previous clock word).
+        frame_data_last = Signal(8)
+        data_last       = frame_data_last
 
         for i in range(data_width//8):
-            data = sink.data[8*i:8*(i+1)]
+            data  = Signal(8)
+            align = sink.ctrl[i] & ((sink.data[8*i:8*(i+1)] == control_characters["A"]) |
+                                    (sink.data[8*i:8*(i+1)] == control_characters["F"]))
             self.comb += [
+                data.eq(sink.data[8*i:8*(i+1)]),
                 If(self.scrambling,
                     # No Replacement, just set ctrl to 0.
                     source.ctrl[i].eq(0)
                 ).Else(
-                    # If "A" control character, replace with last octet.
-                    If(sink.ctrl[i] & (sink.data[8*i:8*(i+1)] == control_characters["A"]),
+                    # If "A"/"F" control character, replace with last octet of previous frame.
+                    If(align,
                         source.ctrl[i].eq(0),
-                        source.data[8*i:8*(i+1)].eq(data_last[i])
-                    ),
-                    # If "A" control character, replace with last octet.
-                    If(sink.ctrl[i] & (sink.data[8*i:8*(i+1)] == control_characters["F"]),
-                        source.ctrl[i].eq(0),
-                        source.data[8*i:8*(i+1)].eq(data_last[i])
+                        data.eq(data_last)
                     )
+                ),
+                source.data[8*i:8*(i+1)].eq(data)
+            ]
+            _data_last = Signal(8)
+            self.comb += [
+                _data_last.eq(data_last),
+                If(sink.frame_last[i],
+                    _data_last.eq(data)
                 )
             ]
-            self.sync += data_last[i].eq(data)
+            data_last = _data_last
+        self.sync += frame_data_last.eq(data_last)
+
+        # Pipeline stages
+        self.comb += self.source.eq(pipeline(self, source, pipeline_stages))
 
 class Aligner(Module):
+    """Aligner
+
+    Realigns the received octets on the clock word boundary: the position of the /R/ control
+    character (start of multiframe) seen during ILAS is used as the reference.
+    """
     def __init__(self, data_width):
-        assert data_width == 32
+        octets_per_clock = data_width//8
+        assert octets_per_clock in [2, 4, 8]
         self.sink    = sink   = Record(link_layout(data_width))
         self.source  = source = Record(link_layout(data_width))
         self.latency = 1
 
         # # #
 
-        alignment = Signal(2)
+        alignment = Signal(max=octets_per_clock)
 
-        last_data = Signal(32, reset_less=True)
-        last_ctrl = Signal(4,  reset_less=True)
+        last_data = Signal(data_width,       reset_less=True)
+        last_ctrl = Signal(octets_per_clock, reset_less=True)
 
         # Register last data/ctrl
         self.sync += [
@@ -275,7 +398,7 @@ class Aligner(Module):
         ]
 
         # Alignment detection
-        for i in range(4):
+        for i in range(octets_per_clock):
             self.sync += [
                 If(sink.ctrl[i] & (sink.data[8*i:8*(i+1)] == control_characters["R"]),
                     alignment.eq(i)
@@ -286,7 +409,7 @@ class Aligner(Module):
         data = Cat(last_data, sink.data)
         ctrl = Cat(last_ctrl, sink.ctrl)
         cases = {}
-        for i in range(4):
+        for i in range(octets_per_clock):
             cases[i] = [
                 source.data.eq(data[8*i:]),
                 source.ctrl.eq(ctrl[i:]),
@@ -336,6 +459,8 @@ class CGSChecker(Module):
 class ILAS:
     """Initial Lane Alignment Sequence
     cf section 5.3.3.5
+
+    Reference ILAS data/ctrl words (computed in Python).
     """
     def __init__(self, data_width, octets_per_frame, frames_per_multiframe, configuration_data, with_counter=True):
 
@@ -357,7 +482,7 @@ class ILAS:
                 multiframe[2:2+len(configuration_data)] = configuration_data
             octets += multiframe
 
-        # Pack ILAS's octets in a lookup table
+        # Pack ILAS's octets in words
 
         octets_per_clock = data_width//8
 
@@ -376,51 +501,113 @@ class ILAS:
             data_words.append(data_word)
             ctrl_words.append(ctrl_word)
 
-        #print("ILAs datas/ctrls:")
-        #for data, ctrl in zip(data_words, ctrl_words):
-        #    print(f"data: 0x{data:08x}, ctrl: 0x{ctrl:02x}")
-
         assert len(data_words) == (octets_per_frame*frames_per_multiframe*4//octets_per_clock)
 
-@ResetInserter()
-class ILASGenerator(ILAS, Module):
-    """Initial Lane Alignment Sequence Generator
+
+class ILASEngine(Module):
+    """Initial Lane Alignment Sequence Engine
     cf section 5.3.3.5
+
+    Produces the ILAS data/ctrl words on the fly (one per clock, from reset) from counters: ramp
+    (octets' index in the ILAS), /R/ and /A/ on multiframes' boundaries, /Q/ and configuration
+    octets on the second multiframe. Bit-exact with the reference ILAS words.
     """
     def __init__(self, data_width, octets_per_frame, frames_per_multiframe, configuration_data, with_counter=True):
-        self.source = source = Record(link_layout(data_width))
+        self.data = Signal(data_width)
+        self.ctrl = Signal(data_width//8)
+        self.last = Signal()
         self.done = Signal()
 
         # # #
 
-        # Compute ILAS's data/ctrl words
-        ILAS.__init__(self, data_width, octets_per_frame, frames_per_multiframe, configuration_data, with_counter)
+        octets_per_clock      = data_width//8
+        octets_per_multiframe = octets_per_frame*frames_per_multiframe
+        assert octets_per_multiframe%octets_per_clock == 0
+        words_per_multiframe  = octets_per_multiframe//octets_per_clock
+        words                 = 4*words_per_multiframe
+
+        # Counters (word in the ILAS, word in the multiframe and multiframe)
+        self.words      = words
+        self.counter    = counter    = Signal(max=words+1)
+        self.word       = word       = Signal(max=words_per_multiframe)
+        self.multiframe = multiframe = Signal(2)
+        self.sync += [
+            If(~self.done,
+                counter.eq(counter + 1),
+                word.eq(word + 1),
+                If(word == (words_per_multiframe - 1),
+                    word.eq(0),
+                    multiframe.eq(multiframe + 1)
+                )
+            )
+        ]
+        self.comb += [
+            self.last.eq(counter == (words - 1)),
+            self.done.eq(counter == words),
+        ]
+
+        # Octets
+        for j in range(octets_per_clock):
+            data = self.data[8*j:8*(j+1)]
+            ctrl = self.ctrl[j]
+            # Ramp: octet's index in the ILAS (modulo 256)
+            if with_counter:
+                self.comb += data.eq(Cat(Constant(j, log2_int(octets_per_clock)), counter))
+            # /R/ on first octet of the multiframes
+            if j == 0:
+                self.comb += If(word == 0,
+                    data.eq(control_characters["R"]),
+                    ctrl.eq(1)
+                )
+            # /A/ on last octet of the multiframes
+            if j == (octets_per_clock - 1):
+                self.comb += If(word == (words_per_multiframe - 1),
+                    data.eq(control_characters["A"]),
+                    ctrl.eq(1)
+                )
+            # /Q/ on second octet of the second multiframe
+            if j == 1:
+                self.comb += If((multiframe == 1) & (word == 0),
+                    data.eq(control_characters["Q"]),
+                    ctrl.eq(1)
+                )
+            # Configuration octets following /Q/
+            for w in range(words_per_multiframe):
+                position = w*octets_per_clock + j
+                if 2 <= position < (2 + len(configuration_data)):
+                    self.comb += If((multiframe == 1) & (word == w),
+                        data.eq(configuration_data[position - 2]),
+                        ctrl.eq(0)
+                    )
 
-        data_lut = Memory(data_width, len(self.data_words), init=self.data_words)
-        data_port = data_lut.get_port(async_read=True)
-        self.specials += data_lut, data_port
+@ResetInserter()
+class ILASGenerator(Module):
+    """Initial Lane Alignment Sequence Generator
+    cf section 5.3.3.5
+    """
+    def __init__(self, data_width, octets_per_frame, frames_per_multiframe, configuration_data, with_counter=True):
+        self.source = source = Record(link_layout(data_width))
+        self.done = Signal()
 
-        ctrl_lut = Memory(data_width//8, len(self.ctrl_words), init=self.ctrl_words)
-        ctrl_port = ctrl_lut.get_port(async_read=True)
-        self.specials += ctrl_lut, ctrl_port
+        # # #
 
-        # Stream data/ctrl from lookup tables
-        counter = Signal(max=len(self.data_words)+1)
+        # Generate ILAS's data/ctrl words
+        engine = ILASEngine(data_width, octets_per_frame, frames_per_multiframe, configuration_data, with_counter)
+        self.submodules.engine = engine
         self.comb += [
-            source.last.eq(counter == (len(self.data_words)-1)),
-            data_port.adr.eq(counter),
-            ctrl_port.adr.eq(counter),
-            source.data.eq(data_port.dat_r),
-            source.ctrl.eq(ctrl_port.dat_r)
-        ]
-        self.sync += [
-            If(counter != len(self.data_words),
-                counter.eq(counter + 1)
-            )
+            source.last.eq(engine.last),
+            source.data.eq(engine.data),
+            source.ctrl.eq(engine.ctrl)
         ]
 
         # Done
-        self.comb += self.done.eq(counter == len(self.data_words))
+        self.comb += self.done.eq(engine.done)
+
+
+def get_configuration_field(configuration_data, field):
+    # Field of the configuration data octets (clipped to its octet, as in JESD204BConfigurationData).
+    octet = configuration_data[8*field.octet:8*(field.octet + 1)]
+    return octet[field.offset:field.offset + field.width]
 
 
 class ILASStartChecker(Module):
@@ -436,14 +623,14 @@ class ILASStartChecker(Module):
             If((~sink.ctrl[0]) | (sink.data[0:8] != control_characters["R"]),
                 valid.eq(0)
             ),
-            If(sink.ctrl[1] | sink.ctrl[2] | sink.ctrl[3],
+            If(sink.ctrl[1:] != 0,
                 valid.eq(0)
             ),
         ]
 
 
 @ResetInserter()
-class ILASChecker(ILAS, Module):
+class ILASChecker(Module):
     """Initial Lane Alignment Sequence Checker
     cf section 5.3.3.5
     """
@@ -459,31 +646,25 @@ class ILASChecker(ILAS, Module):
         self.submodules.start = start
         self.comb += start.sink.eq(sink)
 
-        # Compute ILAS's data/ctrl words
-        ILAS.__init__(self, data_width, octets_per_frame, frames_per_multiframe, configuration_data, with_counter)
-
-        data_lut  = Memory(data_width, len(self.data_words), init=self.data_words)
-        data_port = data_lut.get_port(async_read=True)
-        self.specials += data_lut, data_port
+        # Generate ILAS's data/ctrl words
+        engine = ILASEngine(data_width, octets_per_frame, frames_per_multiframe, configuration_data, with_counter)
+        self.submodules.engine = engine
 
-        ctrl_lut  = Memory(data_width//8, len(self.ctrl_words), init=self.ctrl_words)
-        ctrl_port = ctrl_lut.get_port(async_read=True)
-        self.specials += ctrl_lut, ctrl_port
+        self.data = engine.data
+        self.ctrl = engine.ctrl
 
-        self.data = data_port.dat_r
-        self.ctrl = ctrl_port.dat_r
+        # Received configuration octets (valid on the clock they are received)
+        octets_per_clock = data_width//8
+        self.configuration_data  = Signal(8*len(configuration_data))
+        self.configuration_valid = Signal(len(configuration_data))
+        for i in range(len(configuration_data)):
+            w, j = divmod(2 + i, octets_per_clock)
+            self.comb += [
+                self.configuration_data[8*i:8*(i+1)].eq(sink.data[8*j:8*(j+1)]),
+                self.configuration_valid[i].eq((engine.multiframe == 1) & (engine.word == w))
+            ]
 
-        # Compare data/ctrl with lookup tables
-        counter = Signal(max=len(self.data_words)+1)
-        self.comb += [
-            data_port.adr.eq(counter),
-            ctrl_port.adr.eq(counter),
-        ]
-        self.sync += [
-            If(counter != len(self.data_words),
-                counter.eq(counter + 1),
-            )
-        ]
+        # Compare data/ctrl with generated words
         self.comb += [
             valid.eq(1),
             If(sink.data != self.data,
@@ -495,12 +676,160 @@ class ILASChecker(ILAS, Module):
         ]
 
         # Done
-        self.comb += self.done.eq(counter == len(self.data_words))
+        self.comb += self.done.eq(engine.done)
+
+# Test Patterns ------------------------------------------------------------------------------------
+
+test_modes = {
+    "off"    : 0b000, # Normal operation.
+    "prbs7"  : 0b001, # PRBS7  (x^7  + x^6  + 1) on data octets.
+    "prbs15" : 0b010, # PRBS15 (x^15 + x^14 + 1) on data octets.
+    "prbs23" : 0b011, # PRBS23 (x^23 + x^18 + 1) on data octets.
+    "prbs31" : 0b100, # PRBS31 (x^31 + x^28 + 1) on data octets.
+    "rpat"   : 0b101, # Random pattern (RPAT).
+    "jspat"  : 0b110, # Scrambled jitter pattern (JSPAT).
+    "k28_5"  : 0b111, # Continuous /K28.5/.
+}
+
+prbs_polynomials = {
+    # name     n_state taps
+    "prbs7"  : (7,  [5,  6]),
+    "prbs15" : (15, [13, 14]),
+    "prbs23" : (23, [17, 22]),
+    "prbs31" : (31, [27, 30]),
+}
+
+# Random pattern data octets (cf IEEE 802.3 Annex 48A.4), repeated.
+rpat_octets = [0xbe, 0xd7, 0x23, 0x47, 0x6b, 0x8f, 0xb3, 0x14, 0x5e, 0xfb, 0x35, 0x59]
+
+def get_rpat_words(data_width):
+    octets_per_clock = data_width//8
+    words = []
+    for i in range(len(rpat_octets)//gcd(len(rpat_octets), octets_per_clock)):
+        word = 0
+        for j in range(octets_per_clock):
+            word |= rpat_octets[(i*octets_per_clock + j)%len(rpat_octets)] << 8*j
+        words.append(word)
+    return words
+
+
+class PatternGenerator(Module):
+    """Test Pattern Generator
+
+    Generates the link test patterns selected by mode (cf test_modes):
+    - PRBS: data octets from the PRBS, first octet carrying the oldest bits (LSB first).
+    - RPAT: random pattern data octets.
+    - JSPAT: random pattern data octets through the scrambler.
+    - K28.5: /K/ control characters.
+    """
+    def __init__(self, data_width):
+        self.mode   = Signal(3)
+        self.source = source = Record(link_layout(data_width))
+
+        # # #
+
+        cases = {}
+
+        # PRBS
+        for name, (n_state, taps) in prbs_polynomials.items():
+            prbs = PRBSGenerator(data_width, n_state, taps)
+            setattr(self.submodules, name, prbs)
+            cases[test_modes[name]] = source.data.eq(prbs.o[::-1])
+
+        # RPAT
+        rpat_words = get_rpat_words(data_width)
+        rpat       = Signal(data_width)
+        rpat_word  = Signal(max=len(rpat_words))
+        self.sync += [
+            rpat_word.eq(rpat_word + 1),
+            If(rpat_word == (len(rpat_words) - 1),
+                rpat_word.eq(0)
+            )
+        ]
+        self.comb += rpat.eq(Array(Constant(word, data_width) for word in rpat_words)[rpat_word])
+        cases[test_modes["rpat"]] = source.data.eq(rpat)
+
+        # JSPAT: the RPAT data octets through the link's self-synchronous scrambler (1 + x^14 + x^15,
+        # default seed, cf section 5.2.3), this scrambled RPAT being the JSPAT definition followed here
+        # (first octets checked against a fixed reference in test_link).
+        self.submodules.scrambler = scrambler = Scrambler(data_width)
+        self.comb += scrambler.sink.data.eq(rpat)
+        cases[test_modes["jspat"]] = source.data.eq(scrambler.source.data)
+
+        # K28.5
+        cases[test_modes["k28_5"]] = [
+            source.data.eq(Replicate(Constant(control_characters["K"], 8), data_width//8)),
+            source.ctrl.eq(2**(data_width//8) - 1)
+        ]
+
+        self.comb += Case(self.mode, cases)
+
+
+class PatternChecker(Module):
+    """Test Pattern Checker
+
+    Checks the link test patterns selected by mode (cf test_modes) and reports the erroneous bits
+    of the received words in errors. Checkers are self-synchronizing: PRBS on the received bits,
+    RPAT/JSPAT on the successor of the previous received octet and are then insensitive to the
+    octets' alignment on the clock words. Octets with unexpected control flags are reported with
+    all their bits erroneous.
+    """
+    def __init__(self, data_width):
+        self.mode   = Signal(3)
+        self.sink   = sink = Record(link_layout(data_width))
+        self.errors = Signal(data_width)
+
+        # # #
+
+        octets_per_clock = data_width//8
+        cases = {}
+
+        # PRBS
+        for name, (n_state, taps) in prbs_polynomials.items():
+            prbs = PRBSChecker(data_width, n_state, taps)
+            setattr(self.submodules, name, prbs)
+            self.comb += prbs.i.eq(sink.data[::-1])
+            cases[test_modes[name]] = self.errors.eq(prbs.errors[::-1])
+
+        # RPAT / JSPAT (JSPAT, the scrambled RPAT cf PatternGenerator, descrambled to RPAT)
+        self.submodules.descrambler = descrambler = Descrambler(data_width)
+        self.comb += descrambler.sink.data.eq(sink.data)
+        data      = Signal(data_width)
+        last_data = Signal(data_width)
+        self.comb += data.eq(Mux(self.mode == test_modes["jspat"], descrambler.source.data, sink.data))
+        self.sync += last_data.eq(data)
+        successors = {octet: rpat_octets[(i + 1)%len(rpat_octets)] for i, octet in enumerate(rpat_octets)}
+        successor  = Array(Constant(successors.get(octet, 0), 8) for octet in range(256))
+        in_pattern = Array(Constant(octet in successors, 1) for octet in range(256))
+        rpat_errors = Signal(data_width)
+        previous    = Cat(last_data[-8:], data)
+        for j in range(octets_per_clock):
+            octet      = data[8*j:8*(j+1)]
+            prev_octet = previous[8*j:8*(j+1)]
+            self.comb += rpat_errors[8*j:8*(j+1)].eq(
+                Mux(in_pattern[prev_octet], octet ^ successor[prev_octet], 0xff))
+        cases[test_modes["rpat"]]  = self.errors.eq(rpat_errors)
+        cases[test_modes["jspat"]] = self.errors.eq(rpat_errors)
+
+        # K28.5
+        cases[test_modes["k28_5"]] = self.errors.eq(sink.data ^
+            Replicate(Constant(control_characters["K"], 8), octets_per_clock))
+
+        cases["default"] = self.errors.eq(0)
+        self.sync += Case(self.mode, cases)
+
+        # Unexpected control flags
+        ctrl = Signal(octets_per_clock)
+        self.comb += ctrl.eq(Mux(self.mode == test_modes["k28_5"], 2**octets_per_clock - 1, 0))
+        for j in range(octets_per_clock):
+            self.sync += If((self.mode != test_modes["off"]) & (sink.ctrl[j] != ctrl[j]),
+                self.errors[8*j:8*(j+1)].eq(0xff)
+            )
 
 # Link TX ------------------------------------------------------------------------------------------
 
 class LiteJESD204BLinkTXDatapath(Module):
-    def __init__(self, data_width, octets_per_frame, frames_per_multiframe):
+    def __init__(self, data_width, octets_per_frame, frames_per_multiframe, pipeline_stages=0):
         self.sink   = Record([("data", data_width)])
         self.source = Record(link_layout(data_width))
 
@@ -514,8 +843,9 @@ class LiteJESD204BLinkTXDatapath(Module):
         self.submodules.framer = framer
 
         # Alignment
-        self.submodules.align_inserter = align_inserter = AlignInserter(data_width)
+        self.submodules.align_inserter = align_inserter = AlignInserter(data_width, pipeline_stages)
         self.comb += align_inserter.scrambling.eq(scrambler.enable)
+        self.comb += align_inserter.reset.eq(framer.reset)
 
         # Flow
         self.latency = scrambler.latency + framer.latency + align_inserter.latency
@@ -528,20 +858,47 @@ class LiteJESD204BLinkTXDatapath(Module):
         ]
 
 
+def get_error_report_cycles(data_width, octets_per_frame):
+    # Errors are reported by de-asserting jsync for one frame (at least one clock).
+    return max(ceil(8*octets_per_frame/data_width), 1)
+
+
+def get_sync_request_cycles(data_width, octets_per_frame):
+    # Re-synchronization requests are jsync de-assertions of at least 5 frames + 9 octets.
+    return ceil(8*(5*octets_per_frame + 9)/data_width)
+
+
 @ResetInserter()
 class LiteJESD204BLinkTX(Module):
-    """Link TX layer"""
-    def __init__(self, data_width, jesd_settings, n=0):
+    """Link TX layer
+
+    With pipeline_stages, the alignment characters insertion is pipelined: the framer is released
+    pipeline_stages clocks before the end of ILAS (data multiframes are still sent on the LMFC) and
+    sink is then sent pipeline_stages clocks earlier.
+
+    With test_patterns, the test pattern selected by test_mode (cf test_modes) is sent instead of
+    the link words when not off, whatever the FSM state (CGS/ILAS included): selecting a mode on a
+    live link breaks its synchronization, the links have to be re-initialized once back to off.
+
+    jsync de-assertions shorter than 5 frames + 9 octets while sending data are RX errors reports
+    (signaled on error_report), longer ones are re-synchronization requests.
+    """
+    def __init__(self, data_width, jesd_settings, n=0, pipeline_stages=0, test_patterns=False):
         self.jsync     = Signal() # Input
         self.jref      = Signal() # Input
         self.lmfc_zero = Signal() # Input
         self.ready     = Signal() # Output
+        self.test_mode = Signal(3) # Input
+
+        self.error_report = Signal() # Output
 
         self.sink   = sink   = Record([("data", data_width)])
-        self.source = source = Record(link_layout(data_width))
+        self.source = Record(link_layout(data_width))
 
         # # #
 
+        source = Record(link_layout(data_width))
+
         # Code Group Synchronization
         cgs = CGSGenerator(data_width)
         self.submodules.cgs = cgs
@@ -552,19 +909,24 @@ class LiteJESD204BLinkTX(Module):
             jesd_settings.transport.k,
             jesd_settings.get_configuration_data(n))
         self.submodules.ilas = ilas
+        assert pipeline_stages < ilas.engine.words
 
         # Datapath
         datapath = LiteJESD204BLinkTXDatapath(data_width,
-            jesd_settings.octets_per_frame,
-            jesd_settings.transport.k)
+            jesd_settings.octets_per_lane,
+            jesd_settings.transport.k,
+            pipeline_stages)
         self.submodules.datapath = datapath
         self.comb += datapath.sink.eq(sink)
         self.comb += datapath.framer.enable.eq(int(jesd_settings.framing))
 
         # Sync
-        jsync_timer = WaitTimer(4) # Distinguish errors reporting / re-synchronization requests.
+        # Distinguish errors reporting / re-synchronization requests.
+        jsync_timer = WaitTimer(get_sync_request_cycles(data_width, jesd_settings.octets_per_lane))
         self.submodules += jsync_timer
         self.comb += jsync_timer.wait.eq(~self.jsync)
+        jsync_last = Signal()
+        self.sync += jsync_last.eq(self.jsync)
 
         # FSM
         self.submodules.fsm = fsm = FSM(reset_state="SEND-CGS")
@@ -580,7 +942,7 @@ class LiteJESD204BLinkTX(Module):
             )
         )
         fsm.act("SEND-ILAS",
-            datapath.framer.reset.eq(1),
+            datapath.framer.reset.eq(ilas.engine.counter < (ilas.engine.words - pipeline_stages)),
             source.data.eq(ilas.source.data),
             source.ctrl.eq(ilas.source.ctrl),
             If(ilas.source.last,
@@ -590,47 +952,123 @@ class LiteJESD204BLinkTX(Module):
         fsm.act("SEND-DATA",
             self.ready.eq(1),
             source.eq(datapath.source),
+            # Error report: jsync re-asserted before the re-synchronization request delay.
+            self.error_report.eq(self.jsync & ~jsync_last),
             If(jsync_timer.done,
                 NextState("SEND-CGS")
             )
         )
 
+        # Test patterns
+        if test_patterns:
+            test_pattern = PatternGenerator(data_width)
+            self.submodules.test_pattern = test_pattern
+            self.comb += [
+                test_pattern.mode.eq(self.test_mode),
+                If(self.test_mode != test_modes["off"],
+                    self.source.eq(test_pattern.source)
+                ).Else(
+                    self.source.eq(source)
+                )
+            ]
+        else:
+            self.comb += self.source.eq(source)
+
 # Link RX ------------------------------------------------------------------------------------------
 
 class LiteJESD204BLinkRXDatapath(Module):
-    def __init__(self, data_width, octets_per_frame, frames_per_multiframe):
+    def __init__(self, data_width, octets_per_frame, frames_per_multiframe, pipeline_stages=0):
         self.sink   = Record(link_layout(data_width))
         self.source = Record([("data", data_width)])
 
         # # #
 
-        # Alignment
-        self.submodules.align_replacer = align_replacer = AlignReplacer(data_width)
-
         # Deframing
         deframer = Deframer(data_width,
             octets_per_frame,
             frames_per_multiframe)
         self.submodules.deframer = deframer
 
+        # Alignment
+        self.submodules.align_replacer = align_replacer = AlignReplacer(data_width, pipeline_stages)
+        self.comb += align_replacer.reset.eq(deframer.reset)
+
         # Descrambling
         self.submodules.descrambler = descrambler = Descrambler(data_width)
         self.comb += align_replacer.scrambling.eq(descrambler.enable)
 
         # Flow
-        self.latency = align_replacer.latency + deframer.latency + descrambler.latency
+        self.latency = deframer.latency + align_replacer.latency + descrambler.latency
         self.comb += [
-            align_replacer.sink.eq(self.sink),
-            deframer.sink.eq(align_replacer.source),
-            descrambler.sink.eq(deframer.source),
+            deframer.sink.eq(self.sink),
+            align_replacer.sink.eq(deframer.source),
+            descrambler.sink.data.eq(align_replacer.source.data),
             self.source.eq(descrambler.source)
         ]
 
 
+class ErrorReporter(Module):
+    """Errors reporter
+
+    Errors (error) are reported by de-asserting jsync for one frame (cycles clocks), reports being
+    followed by at least one frame of jsync assertion: errors during a report are part of it, errors
+    during the following frame are reported after it (at most one report per 2 frames window).
+    """
+    def __init__(self, cycles):
+        self.error  = Signal() # Input
+        self.jsync  = Signal() # Output
+        self.report = Signal() # Output
+
+        # # #
+
+        count   = Signal(max=2*cycles + 1)
+        pending = Signal()
+        self.sync += [
+            If(count != 0,
+                count.eq(count - 1)
+            ).Elif(self.error | pending,
+                count.eq(2*cycles)
+            ),
+            If(count == 0,
+                pending.eq(0)
+            ).Elif((count <= cycles) & self.error,
+                pending.eq(1)
+            )
+        ]
+        self.comb += [
+            self.report.eq(count > cycles),
+            self.jsync.eq(~self.report)
+        ]
+
+
 @ResetInserter()
 class LiteJESD204BLinkRX(Module):
-    """Link RX layer"""
-    def __init__(self, data_width, jesd_settings, n=0, ilas_check=True):
+    """Link RX layer
+
+    With pipeline_stages, the alignment characters replacement is pipelined: ready is then delayed
+    by pipeline_stages clocks (and still asserted with the first data multiframe on source).
+
+    Recoverable errors while receiving data (code errors from code_error, unexpected control
+    characters, misplaced /F/ and /A/) are signaled on error and reported by de-asserting jsync for
+    one frame (cf ErrorReporter, below the TX's re-synchronization request delay) instead of
+    restarting the synchronization. Without error_reporting, errors are only signaled on error (ex
+    to be reported by the core, once for all the lanes). Unexpected control characters, misplaced /F/
+    and /A/ are also signaled per octet (on unexpected_control_error, frame_align_error and
+    lane_align_error).
+
+    With test_patterns, the received words are checked against the test pattern selected by
+    test_mode (cf test_modes) when not off and the erroneous bits are counted in test_errors
+    (saturating, errors of the first clocks in a mode being ignored while the checker synchronizes).
+    test_errors_latch copies test_errors to test_errors_latched and clears it in the same cycle.
+    Link synchronization is not maintained while testing (the TX patterns replace CGS/ILAS/data),
+    the links have to be re-initialized once back to off.
+
+    The configuration octets of the last received ILAS are captured in ilas_configuration (even when
+    not valid) and compared with the expected ones, field by field (cf configuration_data_fields),
+    in ilas_mismatch. To capture all of them, an invalid ILAS is only rejected at its end.
+    """
+    def __init__(self, data_width, jesd_settings, n=0, ilas_check=True, pipeline_stages=0,
+        test_patterns=False, error_reporting=True):
         self.jsync      = Signal() # Output
         self.jref       = Signal() # Input
         self.lmfc_zero  = Signal() # Input
@@ -638,6 +1076,22 @@ class LiteJESD204BLinkRX(Module):
         self.align      = Signal() # Output
         self.ilas_check = Signal(reset=int(ilas_check))
 
+        self.ilas_configuration = Signal(8*configuration_data_length)    # Output
+        self.ilas_captured      = Signal()                               # Output
+        self.ilas_mismatch      = Signal(len(configuration_data_fields)) # Output
+
+        self.frame_align_error        = Signal(data_width//8) # Output (per octet)
+        self.lane_align_error         = Signal(data_width//8) # Output (per octet)
+        self.unexpected_control_error = Signal(data_width//8) # Output (per octet)
+        self.code_error               = Signal()              # Input
+        self.error                    = Signal()              # Output
+        self.error_report             = Signal()              # Output
+
+        self.test_mode           = Signal(3)  # Input
+        self.test_errors         = Signal(32) # Output
+        self.test_errors_latched = Signal(32) # Output
+        self.test_errors_latch   = Signal()   # Input
+
         self.sink   = sink   = Record(link_layout(data_width))
         self.source = source = Record([("data", data_width)])
 
@@ -660,8 +1114,9 @@ class LiteJESD204BLinkRX(Module):
 
         # Datapath
         datapath = LiteJESD204BLinkRXDatapath(data_width,
-            jesd_settings.octets_per_frame,
-            jesd_settings.transport.k)
+            jesd_settings.octets_per_lane,
+            jesd_settings.transport.k,
+            pipeline_stages)
         self.submodules.datapath = datapath
         self.comb += source.eq(datapath.source)
 
@@ -673,7 +1128,38 @@ class LiteJESD204BLinkRX(Module):
             datapath.sink.eq(aligner.source),
         ]
 
+        # Errors reporting
+        if error_reporting:
+            error_reporter = ErrorReporter(get_error_report_cycles(data_width, jesd_settings.octets_per_lane))
+            self.submodules.error_reporter = error_reporter
+            self.comb += [
+                error_reporter.error.eq(self.error),
+                self.error_report.eq(error_reporter.report)
+            ]
+
+        # ILAS errors (latched until the end of the ILAS)
+        ilas_error = Signal()
+        self.sync += [
+            If(ilas.reset,
+                ilas_error.eq(0)
+            ).Elif(~ilas.done & ~ilas.valid,
+                ilas_error.eq(1)
+            )
+        ]
+
+        # ILAS configuration capture and mismatches
+        expected = JESD204BConfigurationData(jesd_settings.get_configuration_data(n))
+        for i in range(configuration_data_length):
+            self.sync += If(ilas.configuration_valid[i],
+                self.ilas_configuration[8*i:8*(i+1)].eq(ilas.configuration_data[8*i:8*(i+1)])
+            )
+        self.sync += If(ilas.configuration_valid[-1], self.ilas_captured.eq(1))
+        for i, (name, field) in enumerate(configuration_data_fields.items()):
+            value = get_configuration_field(self.ilas_configuration, field)
+            self.comb += self.ilas_mismatch[i].eq(self.ilas_captured & (value != getattr(expected, name)))
+
         # FSM
+        ready = Signal()
         self.submodules.fsm = fsm = FSM(reset_state="RECEIVE-CGS")
         fsm.act("RECEIVE-CGS",
             self.align.eq(1),
@@ -697,18 +1183,64 @@ class LiteJESD204BLinkRX(Module):
         )
         fsm.act("RECEIVE-ILAS",
             self.jsync.eq(1),
-            datapath.deframer.reset.eq(1),
+            # Start deframing on the first multiframe after ILAS.
+            datapath.deframer.reset.eq(~ilas.done),
             datapath.descrambler.reset.eq(1),
             If(ilas.done,
-                NextState("RECEIVE-DATA")
-            ).Elif(self.ilas_check & ~ilas.valid,
-                NextState("RECEIVE-CGS")
+                If(self.ilas_check & ilas_error,
+                    NextState("RECEIVE-CGS")
+                ).Else(
+                    NextState("RECEIVE-DATA")
+                )
             )
         )
         fsm.act("RECEIVE-DATA",
-            self.jsync.eq(1),
-            self.ready.eq(1),
+            self.jsync.eq(~self.error_report),
+            ready.eq(1),
+            self.error.eq(self.code_error | ((
+                datapath.deframer.frame_align_error |
+                datapath.deframer.lane_align_error |
+                datapath.deframer.unexpected_control_error) != 0)),
+            self.frame_align_error.eq(datapath.deframer.frame_align_error),
+            self.lane_align_error.eq(datapath.deframer.lane_align_error),
+            self.unexpected_control_error.eq(datapath.deframer.unexpected_control_error),
             If(cgs.valid,
                 NextState("RECEIVE-CGS")
             )
         )
+
+        # Ready (delayed by the pipeline stages, with the datapath)
+        for i in range(pipeline_stages):
+            ready_r = Signal()
+            self.sync += ready_r.eq(ready)
+            ready = ready_r
+        self.comb += self.ready.eq(ready)
+
+        # Test patterns
+        if test_patterns:
+            test_pattern = PatternChecker(data_width)
+            self.submodules.test_pattern = test_pattern
+            self.comb += [
+                test_pattern.mode.eq(self.test_mode),
+                test_pattern.sink.eq(aligner.source)
+            ]
+            test_mode_last = Signal(3)
+            test_timer     = WaitTimer(8) # Checkers synchronization.
+            self.submodules += test_timer
+            self.sync += test_mode_last.eq(self.test_mode)
+            self.comb += test_timer.wait.eq(
+                (self.test_mode != test_modes["off"]) & (self.test_mode == test_mode_last))
+            popcount    = Array(Constant(bin(octet).count("1"), 4) for octet in range(256))
+            test_errors = Signal(32 + 1)
+            self.comb += test_errors.eq(self.test_errors +
+                sum(popcount[test_pattern.errors[8*i:8*(i+1)]] for i in range(data_width//8)))
+            self.sync += [
+                If(self.test_errors_latch,
+                    self.test_errors_latched.eq(self.test_errors)
+                ),
+                If(self.test_errors_latch | (self.test_mode == test_modes["off"]),
+                    self.test_errors.eq(0)
+                ).Elif(test_timer.done,
+                    self.test_errors.eq(Mux(test_errors[-1], 2**32 - 1, test_errors))
+                )
+            ]
@@ -0,0 +1,445 @@
+#
+# This file is part of LiteJESD204B
+#
+# Copyright (c) 2016-2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# SPDX-License-Identifier: BSD-2-Clause
+
+from migen import *
+
+from litex.gen import *
+
+from litejesd204b.link import swizzle, pipeline
+
+# JESD204C 64b/66b link layer.
+#
+# Blocks are 64-bit words (8 octets) with a 2-bit sync header, raw blocks are MSB first (bit 65 is
+# the first transmitted bit, as for the scrambler): sync header then scrambled payload (first octet
+# first, MSB first).
+# The sync bits (second bit of the sync headers) of the 32 blocks of a multiblock form the sync
+# header stream (CRC-12 mode):
+#
+#   block: 0-2       3  4-6      7  8-10     11 12-14    15 16-18    19 20-22    23 24     25    26 27-30 31
+#   bits:  CRC[11:9] 1  CRC[8:6] 1  CRC[5:3] 1  CRC[2:0] 1  CMD[6:4] 1  CMD[3:1] 1  CMD[0] EoEMB 1  0000  1
+#
+# The CRC-12 of the scrambled payload of a multiblock is sent in the following multiblock, EoEMB
+# is set on the last multiblock of the extended multiblocks (E multiblocks, carried as LMFC
+# multiframes, ie F*K = 256*E) and the "00001" pilot is only seen at the end of the multiblocks.
+
+blocks_per_multiblock = 32
+crc12_polynom         = 0x30d # x^12 + x^9 + x^8 + x^3 + x^2 + 1
+
+def get_sync_header_stream(crc, cmd, eoemb):
+    """Returns the sync header stream bits (one per block) of a multiblock."""
+    bit  = lambda v, i: (v >> i) & 0b1 if isinstance(v, int) else v[i]
+    bits = []
+    for i in range(4):
+        bits += [bit(crc, 11 - 3*i - j) for j in range(3)] + [1]
+    for i in range(2):
+        bits += [bit(cmd, 6 - 3*i - j) for j in range(3)] + [1]
+    bits += [bit(cmd, 0), eoemb, 1, 0, 0, 0, 0, 1]
+    return bits
+
+def get_pilot_mask():
+    """Returns the mask/value of the fixed bits (pilot and separators) of the sync header stream."""
+    positions = [3, 7, 11, 15, 19, 23] + list(range(26, 32))
+    stream    = get_sync_header_stream(crc=0, cmd=0, eoemb=0)
+    return sum(1 << i for i in positions), sum(stream[i] << i for i in positions)
+
+def crc12(bits, crc=0):
+    """Returns the CRC-12 of bits (in transmission order), from crc."""
+    for bit in bits:
+        feedback = ((crc >> 11) & 0b1) ^ bit
+        crc = (crc << 1) & 0xfff
+        if feedback:
+            crc ^= crc12_polynom
+    return crc
+
+def get_crc12_tables(octets=8):
+    """Returns the CRC-12 contributions of the state (6-bit halves) and of each octet of a block."""
+    octet_bits = lambda v: [(v >> (7 - i)) & 0b1 for i in range(8)]
+    state_tables = [[crc12([0]*8*octets, v << 6*i) for v in range(64)] for i in range(2)]
+    octet_tables = [[crc12(octet_bits(v) + [0]*8*(octets - 1 - k)) for v in range(256)]
+        for k in range(octets)]
+    return state_tables, octet_tables
+
+# Scrambling ---------------------------------------------------------------------------------------
+
+class Scrambler64b66b(Module):
+    """Scrambler
+    Self-synchronous scrambler (1 + x^39 + x^58) on the blocks' payloads.
+    """
+    def __init__(self, data_width=64):
+        self.enable  = Signal(reset=1)
+        self.sink    = sink   = Record([("data", data_width)])
+        self.source  = source = Record([("data", data_width)])
+        self.latency = 1
+
+        # # #
+
+        state    = Signal(58)
+        feedback = Signal(data_width)
+        full     = Signal(data_width+58)
+
+        self.comb += [
+            full.eq(Cat(feedback, state)),
+            feedback.eq(full[39:39+data_width] ^
+                        full[58:58+data_width] ^
+                        swizzle(sink.data, data_width))
+        ]
+
+        source.data.reset_less = True
+        self.sync += [
+            state.eq(full),
+            If(self.enable,
+                source.data.eq(swizzle(feedback, data_width))
+            ).Else(
+                source.data.eq(sink.data)
+            )
+        ]
+
+
+class Descrambler64b66b(Module):
+    """Descrambler
+    Self-synchronous descrambler (1 + x^39 + x^58) on the blocks' payloads.
+    """
+    def __init__(self, data_width=64):
+        self.enable  = Signal(reset=1)
+        self.sink    = sink   = Record([("data", data_width)])
+        self.source  = source = Record([("data", data_width)])
+        self.latency = 1
+
+        # # #
+
+        state    = Signal(58)
+        feedback = Signal(data_width)
+        full     = Signal(data_width+58)
+
+        self.comb += [
+            full.eq(Cat(swizzle(sink.data, data_width), state)),
+            feedback.eq(full[39:39+data_width] ^
+                        full[58:58+data_width] ^
+                        full[0:data_width])
+        ]
+
+        source.data.reset_less = True
+        self.sync += [
+            state.eq(full),
+            If(self.enable,
+                source.data.eq(swizzle(feedback, data_width))
+            ).Else(
+                source.data.eq(sink.data)
+            )
+        ]
+
+# CRC ----------------------------------------------------------------------------------------------
+
+class CRC12(Module):
+    """CRC-12
+
+    CRC-12 of the (scrambled) payloads of the blocks of a multiblock (in transmission order),
+    restarted on first and available in value on the block following last.
+    """
+    def __init__(self, data_width=64):
+        self.data  = Signal(data_width)
+        self.first = Signal()
+        self.last  = Signal()
+        self.value = Signal(12)
+
+        # # #
+
+        crc      = Signal(12)
+        crc_prev = Signal(12)
+        crc_next = Signal(12)
+        self.comb += crc_prev.eq(Mux(self.first, 0, crc))
+
+        # CRC-12 being linear, the next CRC is the XOR of the contributions of the state and of the
+        # octets (looked up in constant tables).
+        state_tables, octet_tables = get_crc12_tables(data_width//8)
+        values = [crc_prev[0:6], crc_prev[6:12]] + [self.data[8*k:8*(k+1)] for k in range(data_width//8)]
+        self.comb += crc_next.eq(Reduce("XOR", [Array(Constant(v, 12) for v in table)[value]
+            for table, value in zip(state_tables + octet_tables, values)]))
+        self.sync += [
+            crc.eq(crc_next),
+            If(self.last, self.value.eq(crc_next))
+        ]
+
+# Sync Header Alignment ----------------------------------------------------------------------------
+
+class SyncHeaderAligner(Module):
+    """Sync Header Aligner
+
+    Realigns raw words on the blocks boundaries (bit-slip): slips one bit on each invalid sync header
+    (00/11) until 64 consecutive valid ones are received (locked), lock is lost on 16 invalid sync
+    headers in 64 blocks.
+    """
+    def __init__(self, width=66):
+        self.sink    = Signal(width)
+        self.source  = Signal(width)
+        self.locked  = Signal()
+        self.latency = 1
+
+        # # #
+
+        offset    = Signal(max=width)
+        last_sink = Signal(width, reset_less=True)
+        window    = Cat(self.sink, last_sink)
+        self.sync += [
+            last_sink.eq(self.sink),
+            Case(offset, {i: self.source.eq(window[i:i+width]) for i in range(width)})
+        ]
+
+        valid   = Signal()
+        slip    = Signal()
+        wait    = Signal(2)
+        count   = Signal(6)
+        invalid = Signal(5)
+        self.comb += valid.eq(self.source[-1] != self.source[-2])
+        self.sync += [
+            If(wait != 0,
+                wait.eq(wait - 1)
+            ).Elif(~self.locked,
+                # Hunting: slip on invalid, lock on 64 consecutive valid.
+                If(~valid,
+                    offset.eq(Mux(offset == (width - 1), 0, offset + 1)),
+                    count.eq(0),
+                    wait.eq(2)
+                ).Else(
+                    count.eq(count + 1),
+                    If(count == (64 - 1), self.locked.eq(1))
+                )
+            ).Else(
+                # Locked: unlock on 16 invalid in 64.
+                count.eq(count + 1),
+                If(count == (64 - 1), invalid.eq(0)),
+                If(~valid,
+                    invalid.eq(invalid + 1),
+                    If(invalid == (16 - 1),
+                        self.locked.eq(0),
+                        count.eq(0),
+                        invalid.eq(0)
+                    )
+                )
+            )
+        ]
+
+# Link TX ------------------------------------------------------------------------------------------
+
+class LiteJESD204CLinkTXDatapath(Module):
+    def __init__(self, data_width=64, pipeline_stages=0):
+        self.sink   = Record([("data", data_width)])
+        self.source = Record([("data", data_width)])
+
+        # # #
+
+        # Scrambling
+        self.submodules.scrambler = scrambler = Scrambler64b66b(data_width)
+
+        # Flow
+        self.latency = scrambler.latency + pipeline_stages
+        self.comb += scrambler.sink.eq(self.sink)
+        self.comb += self.source.eq(pipeline(self, scrambler.source, pipeline_stages))
+
+
+@ResetInserter()
+class LiteJESD204CLinkTX(Module):
+    """Link TX layer (JESD204C 64b/66b)
+
+    Same interface than LiteJESD204BLinkTX (sink words, source as raw 66-bit blocks). Extended
+    multiblocks are sent on the multiframes (with the datapath latency) and data from the first
+    LMFC following the reset (no SYNC~: jsync is unused). With pipeline_stages, the scrambled
+    payloads are registered over pipeline_stages clocks (sink is then sent pipeline_stages clocks
+    earlier).
+    """
+    def __init__(self, data_width, jesd_settings, n=0, pipeline_stages=0):
+        assert data_width == 64
+        self.jsync     = Signal() # Input (unused)
+        self.jref      = Signal() # Input
+        self.lmfc_zero = Signal() # Input
+        self.ready     = Signal() # Output
+
+        self.sink   = sink   = Record([("data", data_width)])
+        self.source = source = Record([("data", 66)])
+
+        # # #
+
+        multiblocks = jesd_settings.get_multiblocks_per_extended_multiblock()
+
+        # Datapath
+        datapath = LiteJESD204CLinkTXDatapath(data_width, pipeline_stages)
+        self.submodules.datapath = datapath
+        self.comb += datapath.sink.eq(sink)
+
+        # Blocks/Multiblocks (of the scrambled payloads, block 0 on the LMFC + scrambler latency)
+        block      = Signal(max=blocks_per_multiblock)
+        multiblock = Signal(max=max(multiblocks, 2))
+        self.sync += [
+            If(self.lmfc_zero,
+                block.eq(0),
+                multiblock.eq(0)
+            ).Else(
+                block.eq(block + 1),
+                If(block == (blocks_per_multiblock - 1),
+                    multiblock.eq(Mux(multiblock == (multiblocks - 1), 0, multiblock + 1))
+                )
+            )
+        ]
+
+        # CRC
+        self.submodules.crc = crc = CRC12(data_width)
+        self.comb += [
+            crc.data.eq(datapath.source.data),
+            crc.first.eq(block == 0),
+            crc.last.eq(block == (blocks_per_multiblock - 1)),
+        ]
+
+        # Sync header
+        stream = Signal(blocks_per_multiblock)
+        self.comb += stream.eq(Cat(*get_sync_header_stream(
+            crc   = crc.value,
+            cmd   = 0,
+            eoemb = (multiblock == (multiblocks - 1)))))
+        sync_bit = Signal()
+        self.comb += sync_bit.eq(stream.part(block, 1))
+
+        # Raw blocks
+        self.comb += source.data.eq(Cat(swizzle(datapath.source.data, data_width), sync_bit, ~sync_bit))
+
+        # Ready on the first LMFC after reset
+        self.sync += If(self.lmfc_zero, self.ready.eq(1))
+
+# Link RX ------------------------------------------------------------------------------------------
+
+class LiteJESD204CLinkRXDatapath(Module):
+    def __init__(self, data_width=64, pipeline_stages=0):
+        self.sink   = Record([("data", data_width)])
+        self.source = Record([("data", data_width)])
+
+        # # #
+
+        # Descrambling
+        self.submodules.descrambler = descrambler = Descrambler64b66b(data_width)
+
+        # Flow
+        self.latency = descrambler.latency + pipeline_stages
+        self.comb += descrambler.sink.eq(self.sink)
+        self.comb += self.source.eq(pipeline(self, descrambler.source, pipeline_stages))
+
+
+@ResetInserter()
+class LiteJESD204CLinkRX(Module):
+    """Link RX layer (JESD204C 64b/66b)
+
+    Same interface than LiteJESD204BLinkRX (sink as raw 66-bit blocks, source words). The blocks
+    are realigned on the sync headers, then the multiblocks on the pilot and the extended
+    multiblocks on EoEMB: ready is asserted with the first extended multiblock on source (and
+    jsync with the sync header lock). Reported errors:
+    - crc_error:        CRC-12 mismatch on the previous multiblock.
+    - lane_align_error: pilot received at another position than the end of a multiblock.
+    """
+    def __init__(self, data_width, jesd_settings, n=0, ilas_check=True, pipeline_stages=0):
+        assert data_width == 64
+        self.jsync      = Signal() # Output
+        self.jref       = Signal() # Input
+        self.lmfc_zero  = Signal() # Input
+        self.ready      = Signal() # Output
+        self.align      = Signal() # Output (unused)
+        self.ilas_check = Signal(reset=int(ilas_check)) # Unused (no ILAS)
+
+        self.frame_align_error        = Signal() # Output (unused)
+        self.lane_align_error         = Signal() # Output
+        self.unexpected_control_error = Signal() # Output (unused)
+        self.crc_error                = Signal() # Output
+
+        self.sink   = sink   = Record([("data", 66)])
+        self.source = source = Record([("data", data_width)])
+
+        # # #
+
+        multiblocks = jesd_settings.get_multiblocks_per_extended_multiblock()
+
+        # Sync header alignment
+        self.submodules.aligner = aligner = SyncHeaderAligner(66)
+        self.comb += [
+            aligner.sink.eq(sink.data),
+            self.jsync.eq(aligner.locked)
+        ]
+        sync_bit = aligner.source[data_width]
+        payload  = swizzle(aligner.source[:data_width], data_width)
+
+        # Datapath
+        datapath = LiteJESD204CLinkRXDatapath(data_width, pipeline_stages)
+        self.submodules.datapath = datapath
+        self.comb += [
+            datapath.sink.data.eq(payload),
+            source.eq(datapath.source)
+        ]
+
+        # Multiblocks (pilot at the end of the sync header stream) / Extended multiblocks (EoEMB).
+        stream      = Signal(blocks_per_multiblock)
+        stream_next = Signal(blocks_per_multiblock)
+        pilot       = Signal()
+        pilot_mask, pilot_value = get_pilot_mask()
+        self.sync += If(aligner.locked, stream.eq(stream_next))
+        self.comb += [
+            stream_next.eq(Cat(stream[1:], sync_bit)),
+            pilot.eq(aligner.locked & ((stream_next & pilot_mask) == pilot_value))
+        ]
+
+        block         = Signal(max=blocks_per_multiblock)
+        multiblock    = Signal(max=max(multiblocks, 2))
+        block_locked  = Signal()
+        emb_locked    = Signal()
+        self.sync += [
+            If(~aligner.locked,
+                block_locked.eq(0),
+                emb_locked.eq(0)
+            ).Elif(pilot,
+                block.eq(0),
+                block_locked.eq(1),
+                If(stream_next[25],
+                    multiblock.eq(0),
+                    emb_locked.eq(block_locked)
+                ).Else(
+                    multiblock.eq(Mux(multiblock == (multiblocks - 1), 0, multiblock + 1))
+                )
+            ).Else(
+                block.eq(block + 1)
+            )
+        ]
+        self.comb += self.lane_align_error.eq(block_locked & pilot & (block != (blocks_per_multiblock - 1)))
+
+        # CRC (checked against the one received with the following multiblock)
+        self.submodules.crc = crc = CRC12(data_width)
+        crc_valid    = Signal()
+        crc_received = Signal(12)
+        self.comb += [
+            crc.data.eq(payload),
+            crc.first.eq(block == 0),
+            crc.last.eq(pilot),
+        ]
+        self.comb += crc_received.eq(Cat(*reversed([stream_next[i] for i in range(16) if (i%4) != 3])))
+        self.sync += [
+            If(~block_locked,
+                crc_valid.eq(0)
+            ).Elif(pilot,
+                crc_valid.eq(1)
+            )
+        ]
+        self.comb += self.crc_error.eq(pilot & crc_valid & (crc_received != crc.value))
+
+        # Ready (from the first extended multiblock on source, with the datapath)
+        ready = Signal()
+        start = Signal()
+        self.comb += start.eq(emb_locked & (block == 0) & (multiblock == 0))
+        self.sync += [
+            If(~emb_locked,
+                ready.eq(0)
+            ).Elif(start,
+                ready.eq(1)
+            )
+        ]
+        for i in range(datapath.latency):
+            ready_r = Signal()
+            self.sync += ready_r.eq(ready | start if i == 0 else ready)
+            ready = ready_r
+        self.comb += self.ready.eq(ready & emb_locked)
@@ -19,55 +19,92 @@ class LiteJESD204BTransportTX(Module):
     inputs:
     - jesd_settings:        JESD204B settings
     - converter_data_width: Converters' data width
+    - lane_data_width:      Lanes' data width (optional)
+    Samples are provided on sink, control bits (when CS > 0) on sink_ctrl.
+
+    When lanes' words can't carry an integer number of frames (ex F=3 on 32-bit lanes), sink carries
+    the samples of a group of frames that is sent over several clocks: start must be asserted on
+    the first clock of a multiframe and ready indicates when sink is consumed.
+
+    Lanes' words can be registered over pipeline_stages (reported in latency).
     cf section 5.1.3
     """
-    def __init__(self, jesd_settings, converter_data_width):
+    def __init__(self, jesd_settings, converter_data_width, lane_data_width=None, pipeline_stages=0):
         # Compute parameters
-        samples_per_clock = converter_data_width//jesd_settings.phy.n
+        n  = jesd_settings.phy.n
+        np = jesd_settings.phy.np
+        cs = jesd_settings.control_bits_per_sample
+        cf = jesd_settings.transport.cf
+        samples_per_clock = converter_data_width//n
         samples_per_frame = jesd_settings.transport.s
-        lane_data_width   = (samples_per_clock*
-                             jesd_settings.phy.np*
-                             jesd_settings.nconverters)//jesd_settings.nlanes
+        assert samples_per_clock%samples_per_frame == 0
+        frames_data_width = (samples_per_clock//samples_per_frame)*jesd_settings.octets_per_lane*8
+        if lane_data_width is None:
+            lane_data_width = frames_data_width
+        assert frames_data_width%lane_data_width == 0
+        clocks_per_group = frames_data_width//lane_data_width
+
+        # Control
+        self.start = Signal() # Input
+        self.ready = Signal() # Output
 
         # Endpoints
         self.sink = Record([("converter"+str(i), converter_data_width)
             for i in range(jesd_settings.nconverters)])
+        if cs:
+            self.sink_ctrl = Record([("converter"+str(i), cs*samples_per_clock)
+                for i in range(jesd_settings.nconverters)])
         self.source = Record([("lane"+str(i), lane_data_width)
             for i in range(jesd_settings.nlanes)])
+        self.latency = pipeline_stages
 
         # # #
 
+        lanes  = [Signal(frames_data_width) for i in range(jesd_settings.nlanes)]
+        source = Record(self.source.layout)
+
         current_sample = 0
         current_octet  = 0
         while current_sample < samples_per_clock:
-            # Frame's samples
-            frame_samples = []
+            # Frame's samples (and control bits)
+            frame_samples  = []
+            frame_controls = []
             for j in range(jesd_settings.nconverters):
                 for i in range(samples_per_frame):
                     converter_data = getattr(self.sink, "converter"+str(j))
-                    sample = Signal(jesd_settings.phy.n)
-                    self.comb += sample.eq(
-                        converter_data[(current_sample+i)*jesd_settings.phy.n:
-                        (current_sample+i+1)*jesd_settings.phy.n])
+                    sample = Signal(n)
+                    self.comb += sample.eq(converter_data[(current_sample+i)*n:(current_sample+i+1)*n])
                     frame_samples.append(sample)
+                    if cs:
+                        converter_ctrl = getattr(self.sink_ctrl, "converter"+str(j))
+                        control = Signal(cs)
+                        self.comb += control.eq(converter_ctrl[(current_sample+i)*cs:(current_sample+i+1)*cs])
+                        frame_controls.append(control)
 
-            # Frame's words
-            frame_words = frame_samples # no control bits
-
-            # Frame's nibbles
-            frame_nibbles = []
-            for word in frame_words:
-                for i in reversed(range(jesd_settings.nibbles_per_word)):
-                    nibble = Signal(4)
-                    self.comb += nibble.eq(word[4*i:4*(i+1)])
-                    frame_nibbles.append(nibble)
-
-            # Frame's octets
+            # Frame's words: sample + control bits (when not in control words) + tail bits
+            frame_words = []
+            for i, sample in enumerate(frame_samples):
+                word = Signal(np)
+                if jesd_settings.control_bits_per_word:
+                    self.comb += word.eq(Cat(Replicate(0, jesd_settings.tail_bits), frame_controls[i], sample))
+                else:
+                    self.comb += word.eq(Cat(Replicate(0, jesd_settings.tail_bits), sample))
+                frame_words.append(word)
+
+            # Frame's control words: control bits of M/CF converters (MSB first) + tail bits
+            for i in range(cf):
+                controls_per_word = jesd_settings.nconverters_per_control_word*samples_per_frame
+                controls = frame_controls[i*controls_per_word:(i+1)*controls_per_word]
+                word = Signal(np)
+                self.comb += word[np-cs*controls_per_word:].eq(Cat(*reversed(controls)))
+                frame_words.append(word)
+
+            # Frame's octets (words are sent MSB first)
+            frame_bits   = Cat(*reversed(frame_words))
             frame_octets = []
-            for i in range(len(frame_nibbles)//2):
+            for i in range(len(frame_bits)//8):
                 octet = Signal(8)
-                self.comb += octet.eq(Cat(frame_nibbles[2*i+1],
-                                          frame_nibbles[2*i]))
+                self.comb += octet.eq(frame_bits[len(frame_bits)-8*(i+1):len(frame_bits)-8*i])
                 frame_octets.append(octet)
 
             # Lanes' octets for a frame
@@ -75,7 +112,7 @@ class LiteJESD204BTransportTX(Module):
                 frame_lane_octets = frame_octets[
                     i*jesd_settings.octets_per_lane:
                     (i+1)*jesd_settings.octets_per_lane]
-                lane_data = getattr(self.source, "lane"+str(i))
+                lane_data = lanes[i]
                 for j, octet in enumerate(frame_lane_octets):
                     self.comb += lane_data[
                         8*(current_octet+j):
@@ -84,6 +121,37 @@ class LiteJESD204BTransportTX(Module):
             current_sample += samples_per_frame
             current_octet += jesd_settings.octets_per_lane
 
+        # Lanes' words (group of frames sent over clocks_per_group clocks)
+        if clocks_per_group == 1:
+            self.comb += self.ready.eq(1)
+            for i, lane_data in enumerate(lanes):
+                self.comb += getattr(source, "lane"+str(i)).eq(lane_data)
+        else:
+            counter = Signal(max=clocks_per_group)
+            index   = Signal(max=clocks_per_group)
+            self.comb += index.eq(Mux(self.start, 0, counter))
+            self.sync += If(index == (clocks_per_group - 1),
+                    counter.eq(0)
+                ).Else(
+                    counter.eq(index + 1)
+                )
+            self.comb += self.ready.eq(index == 0)
+            for i, lane_data in enumerate(lanes):
+                lane_data_r = Signal(frames_data_width)
+                self.sync += If(self.ready, lane_data_r.eq(lane_data))
+                cases = {0: getattr(source, "lane"+str(i)).eq(lane_data[:lane_data_width])}
+                for j in range(1, clocks_per_group):
+                    cases[j] = getattr(source, "lane"+str(i)).eq(
+                        lane_data_r[j*lane_data_width:(j+1)*lane_data_width])
+                self.comb += Case(index, cases)
+
+        # Pipeline stages
+        for i in range(pipeline_stages):
+            source_r = Record(self.source.layout)
+            self.sync += source_r.raw_bits().eq(source.raw_bits())
+            source = source_r
+        self.comb += self.source.raw_bits().eq(source.raw_bits())
+
 # Transport RX -------------------------------------------------------------------------------------
 
 class LiteJESD204BTransportRX(Module):
@@ -91,24 +159,79 @@ class LiteJESD204BTransportRX(Module):
     inputs:
     - jesd_settings:        JESD204B settings
     - converter_data_width: Converters' data width
+    - lane_data_width:      Lanes' data width (optional)
+    Samples are provided on source, control bits (when CS > 0) on source_ctrl.
+
+    When lanes' words can't carry an integer number of frames (ex F=3 on 32-bit lanes), source
+    carries the samples of a group of frames that is received over several clocks: start must be
+    asserted on the first clock of a multiframe and valid indicates when source is updated (source
+    is then held until the next group).
+
+    Converters' samples (and valid) can be registered over pipeline_stages (reported in latency).
     cf section 5.1.3
     """
-    def __init__(self, jesd_settings, converter_data_width):
+    def __init__(self, jesd_settings, converter_data_width, lane_data_width=None, pipeline_stages=0):
         # Compute parameters
-        samples_per_clock = converter_data_width//jesd_settings.phy.n
+        n  = jesd_settings.phy.n
+        np = jesd_settings.phy.np
+        cs = jesd_settings.control_bits_per_sample
+        cf = jesd_settings.transport.cf
+        samples_per_clock = converter_data_width//n
         samples_per_frame = jesd_settings.transport.s
-        lane_data_width   = (samples_per_clock*
-                             jesd_settings.phy.np*
-                             jesd_settings.nconverters)//jesd_settings.nlanes
+        assert samples_per_clock%samples_per_frame == 0
+        frames_data_width = (samples_per_clock//samples_per_frame)*jesd_settings.octets_per_lane*8
+        if lane_data_width is None:
+            lane_data_width = frames_data_width
+        assert frames_data_width%lane_data_width == 0
+        clocks_per_group = frames_data_width//lane_data_width
+
+        # Control
+        self.start = Signal() # Input
+        self.valid = Signal() # Output
 
         # Endpoints
         self.sink = Record([("lane"+str(i), lane_data_width)
             for i in range(jesd_settings.nlanes)])
         self.source = Record([("converter"+str(i), converter_data_width)
             for i in range(jesd_settings.nconverters)])
+        if cs:
+            self.source_ctrl = Record([("converter"+str(i), cs*samples_per_clock)
+                for i in range(jesd_settings.nconverters)])
+        self.latency = pipeline_stages
 
         # # #
 
+        valid       = Signal()
+        source      = Record(self.source.layout)
+        source_ctrl = Record(self.source_ctrl.layout) if cs else None
+
+        # Lanes' words (group of frames received over clocks_per_group clocks)
+        lanes = [Signal(frames_data_width) for i in range(jesd_settings.nlanes)]
+        if clocks_per_group == 1:
+            self.comb += valid.eq(1)
+            for i, lane_data in enumerate(lanes):
+                self.comb += lane_data.eq(getattr(self.sink, "lane"+str(i)))
+        else:
+            counter = Signal(max=clocks_per_group)
+            index   = Signal(max=clocks_per_group)
+            self.comb += index.eq(Mux(self.start, 0, counter))
+            self.sync += If(index == (clocks_per_group - 1),
+                    counter.eq(0)
+                ).Else(
+                    counter.eq(index + 1)
+                )
+            # Group is registered on its last clock (source is held until the next group).
+            self.sync += valid.eq(index == (clocks_per_group - 1))
+            for i, lane_data in enumerate(lanes):
+                lane_data_r = Signal(frames_data_width - lane_data_width)
+                self.sync += [
+                    Case(index, {j: lane_data_r[j*lane_data_width:(j+1)*lane_data_width].eq(
+                        getattr(self.sink, "lane"+str(i))) for j in range(clocks_per_group - 1)}),
+                    If(index == (clocks_per_group - 1),
+                        lane_data.eq(Cat(lane_data_r, getattr(self.sink, "lane"+str(i))))
+                    )
+                ]
+
         current_sample = 0
         current_octet = 0
         while current_sample < samples_per_clock:
@@ -116,42 +239,58 @@ class LiteJESD204BTransportRX(Module):
             frame_octets = []
             for i in range(jesd_settings.nlanes):
                 frame_lane_octets = []
-                lane_data = getattr(self.sink, "lane"+str(i))
+                lane_data = lanes[i]
                 for j in range(jesd_settings.octets_per_lane):
                     frame_lane_octets.append(lane_data[
                         8*(current_octet+j):
                         8*(current_octet+j+1)])
                 frame_octets += frame_lane_octets
 
-            # Frame's nibbles
-            frame_nibbles = []
-            for octet in frame_octets:
-                for j in reversed(range(2)):
-                    frame_nibbles.append(octet[4*j:4*(j+1)])
-
-            # Frame's words
+            # Frame's words (words are received MSB first)
+            frame_bits  = Cat(*reversed(frame_octets))
             frame_words = []
+            for i in range(jesd_settings.words_per_frame):
+                word = Signal(np)
+                self.comb += word.eq(frame_bits[len(frame_bits)-np*(i+1):len(frame_bits)-np*i])
+                frame_words.append(word)
+
+            # Frame's samples (and control bits)
+            frame_samples  = []
+            frame_controls = []
+            for word in frame_words[:jesd_settings.nconverters*samples_per_frame]:
+                frame_samples.append(word[np-n:])
+                if jesd_settings.control_bits_per_word:
+                    frame_controls.append(word[jesd_settings.tail_bits:jesd_settings.tail_bits+cs])
+            for word in frame_words[jesd_settings.nconverters*samples_per_frame:]:
+                controls_per_word = jesd_settings.nconverters_per_control_word*samples_per_frame
+                for i in range(controls_per_word):
+                    frame_controls.append(word[np-cs*(i+1):np-cs*i])
+
+            # Converters' samples (and control bits) for a frame
             for j in range(jesd_settings.nconverters):
                 for i in range(samples_per_frame):
-                    word = Signal(jesd_settings.nibbles_per_word*4)
-                    for k in range(jesd_settings.nibbles_per_word):
-                        self.comb += word[4*k:4*(k+1)].eq(frame_nibbles.pop())
-                    frame_words.append(word)
-
-            # Frame's samples
-            frame_samples = frame_words # no control bits
-
-            # Converters' samples for a frame
-            for j in range(jesd_settings.nconverters):
-                for i in range(samples_per_frame):
-                    converter_data = getattr(self.source, "converter"+str(j))
+                    converter_data = getattr(source, "converter"+str(j))
                     self.comb += converter_data[
-                        (current_sample+i)*jesd_settings.phy.n:
-                        (current_sample+i+1)*jesd_settings.phy.n].eq(frame_samples.pop())
+                        (current_sample+i)*n:
+                        (current_sample+i+1)*n].eq(frame_samples[j*samples_per_frame+i])
+                    if cs:
+                        converter_ctrl = getattr(source_ctrl, "converter"+str(j))
+                        self.comb += converter_ctrl[
+                            (current_sample+i)*cs:
+                            (current_sample+i+1)*cs].eq(frame_controls[j*samples_per_frame+i])
 
             current_sample += samples_per_frame
             current_octet  += jesd_settings.octets_per_lane
 
+        # Pipeline stages
+        outputs = Cat(valid, source.raw_bits(), source_ctrl.raw_bits() if cs else Cat())
+        for i in range(pipeline_stages):
+            outputs_r = Signal(len(outputs))
+            self.sync += outputs_r.eq(outputs)
+            outputs = outputs_r
+        self.comb += Cat(self.valid, self.source.raw_bits(),
+            self.source_ctrl.raw_bits() if cs else Cat()).eq(outputs)
+
 # STPL Generator (TX) ------------------------------------------------------------------------------
 
 class LiteJESD204BSTPLGenerator(Module):
@@ -180,23 +319,35 @@ class LiteJESD204BSTPLGenerator(Module):
 class LiteJESD204BSTPLChecker(Module):
     """Simple Transport Layer Pattern Checker
     cf section 5.1.6.2
+
+    Errors count the clocks with mismatching samples. With pipeline_stages (reported in latency),
+    samples' comparisons are registered on the first stage and reduced on the next ones.
     """
-    def __init__(self, jesd_settings, converter_data_width, random=True):
+    def __init__(self, jesd_settings, converter_data_width, random=True, pipeline_stages=0):
         self.sink = Record([("converter"+str(i), converter_data_width)
             for i in range(jesd_settings.nconverters)])
-        self.errors = Signal(32)
+        self.errors  = Signal(32)
+        self.latency = pipeline_stages
 
         # # #
 
         samples_per_clock = converter_data_width//jesd_settings.phy.n
         samples_per_frame = jesd_settings.transport.s
 
+        # Samples' comparisons
+        mismatches = []
         for i in range(jesd_settings.nconverters):
             converter = getattr(self.sink, "converter"+str(i))
             for j in range(samples_per_clock):
                 data = seed_to_data((i << 8) | j%samples_per_frame, random)
-                self.sync += [
-                    If(converter[j*jesd_settings.phy.n:(j+1)*jesd_settings.phy.n] != data,
-                        self.errors.eq(self.errors + 1)
-                    )
-                ]
+                mismatches.append(converter[j*jesd_settings.phy.n:(j+1)*jesd_settings.phy.n] != data)
+        errors = Cat(*mismatches)
+
+        # Pipeline stages (registered comparisons, then their reduction)
+        for i in range(pipeline_stages):
+            errors_r = Signal(len(errors) if i == 0 else 1)
+            self.sync += errors_r.eq(errors if i == 0 else (errors != 0))
+            errors = errors_r
+
+        # Errors counting
+        self.sync += If(errors != 0, self.errors.eq(self.errors + 1))
@@ -64,7 +64,8 @@ def long_test_pattern(nconverters, nbits, samples_per_frame, frame_per_multifram
     return samples
 
 
-def samples_to_lanes(samples_per_frame, nlanes, nconverters, nbits, samples):
+def samples_to_lanes(samples_per_frame, nlanes, nconverters, nbits, samples,
+    nbits_per_word=None, control_bits=0, control_words=0, controls=None):
     """
     inputs:
     - samples_per_frame: Number of samples per frame
@@ -73,6 +74,11 @@ def samples_to_lanes(samples_per_frame, nlanes, nconverters, nbits, samples):
     - nbits:             Number of convertion bits
     - samples:           Samples from converters:
                          samples[i][j]: sample j of converter i
+    - nbits_per_word:    Number of bits per word (N', default to nbits)
+    - control_bits:      Number of control bits per sample (CS)
+    - control_words:     Number of control words per frame (CF)
+    - controls:          Control bits from converters:
+                         controls[i][j]: control bits of sample j of converter i
     output:
     - lanes: Lanes' octets organized in frames
              lanes[i][j][k]: octet k of frame j of lane i
@@ -81,35 +87,53 @@ def samples_to_lanes(samples_per_frame, nlanes, nconverters, nbits, samples):
     """
     assert nconverters == len(samples)
 
-    nibbles_per_word = ceil(nbits//4)
-    octets_per_frame = samples_per_frame*nibbles_per_word//2
-    octets_per_lane = octets_per_frame*nconverters//nlanes
+    nbits_per_word = nbits if nbits_per_word is None else nbits_per_word
+    words_per_frame = nconverters*samples_per_frame + control_words
+    octets_per_lane = words_per_frame*nbits_per_word//(8*nlanes)
     assert octets_per_lane > 0
 
     lanes = [[]]*nlanes
     n = 0
 
     while n < len(samples[0]):
-        # frame's samples
-        frame_samples = []
+        # frame's samples (and control bits)
+        frame_samples  = []
+        frame_controls = []
         for j in range(nconverters):
             for i in range(samples_per_frame):
                 frame_samples.append(samples[j][n+i])
+                frame_controls.append(controls[j][n+i] if control_bits else 0)
         n += samples_per_frame
 
-        # frame's words
-        frame_words = frame_samples # no control bits
+        # frame's words: sample + control bits (when not in control words) + tail bits
+        frame_words = []
+        for sample, control in zip(frame_samples, frame_controls):
+            word = sample << (nbits_per_word - nbits)
+            if control_words == 0:
+                word |= control << (nbits_per_word - nbits - control_bits)
+            frame_words.append(word)
 
-        # frame's nibbles
-        frame_nibbles = []
+        # frame's control words: control bits of M/CF converters + tail bits
+        controls_per_word = len(frame_controls)//max(control_words, 1)
+        for i in range(control_words):
+            word = 0
+            for control in frame_controls[i*controls_per_word:(i+1)*controls_per_word]:
+                word = (word << control_bits) | control
+            word <<= nbits_per_word - control_bits*controls_per_word
+            frame_words.append(word)
+
+        # frame's bits (words are sent MSB first)
+        frame_bits = []
         for word in frame_words:
-            for i in reversed(range(nibbles_per_word)):
-                frame_nibbles.append((word>>4*i) & 0xf)
+            for i in reversed(range(nbits_per_word)):
+                frame_bits.append((word >> i) & 0b1)
 
         # frame's octets
         frame_octets = []
-        for i in range(len(frame_nibbles)//2):
-            octet = (frame_nibbles[2*i]<<4) + frame_nibbles[2*i+1]
+        for i in range(len(frame_bits)//8):
+            octet = 0
+            for bit in frame_bits[8*i:8*(i+1)]:
+                octet = (octet << 1) | bit
             frame_octets.append(octet)
 
         # lanes' octets for a frame
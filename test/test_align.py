@@ -67,3 +67,40 @@ class TestAlign(unittest.TestCase):
         run_simulation(dut, [generator(dut), checker(dut)])
         self.assertEqual(dut.errors, 0)
 
+
+    def aligner_test(self, data_width, offset):
+        octets_per_clock = data_width//8
+        dut = Aligner(data_width)
+
+        # Octet stream with a /R/ control character at the given offset of the third word.
+        position = 2*octets_per_clock + offset
+        octets   = [i & 0xff for i in range(16*octets_per_clock)]
+        octets[position] = control_characters["R"]
+
+        output = []
+
+        def generator(dut):
+            for i in range(len(octets)//octets_per_clock):
+                word = octets[i*octets_per_clock:(i+1)*octets_per_clock]
+                yield dut.sink.data.eq(int.from_bytes(bytes(word), byteorder="little"))
+                yield dut.sink.ctrl.eq(int(position//octets_per_clock == i) << offset)
+                yield
+                output.append(((yield dut.source.data), (yield dut.source.ctrl)))
+
+        run_simulation(dut, generator(dut))
+
+        # Once aligned, /R/ is on the first octet and following octets are contiguous.
+        ctrls = [ctrl for data, ctrl in output]
+        self.assertIn(0b1, ctrls)
+        start = ctrls.index(0b1)
+        for i, (data, ctrl) in enumerate(output[start:-1]):
+            reference = octets[position + i*octets_per_clock:position + (i+1)*octets_per_clock]
+            self.assertEqual(list(data.to_bytes(octets_per_clock, byteorder="little")), reference)
+
+    def test_aligner_32(self):
+        for offset in range(4):
+            self.aligner_test(32, offset)
+
+    def test_aligner_64(self):
+        for offset in range(8):
+            self.aligner_test(64, offset)
@@ -0,0 +1,139 @@
+#
+# This file is part of LiteJESD204B
+#
+# Copyright (c) 2016-2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from migen import *
+
+from litejesd204b.core import GearboxBuffer, ConverterGearboxTX, ConverterGearboxRX
+
+
+class TestCDC(unittest.TestCase):
+    def gearbox_test(self, iwidth, owidth, depth=4, reset_delay=0):
+        # Clock periods respecting iwidth*ifreq == owidth*ofreq, rising edges aligned (on multiples
+        # of the periods).
+        iperiod = 8*iwidth//min(iwidth, owidth)
+        operiod = 8*owidth//min(iwidth, owidth)
+        # Reset delay (in wide words, to keep the symbols at the same position in the wide words).
+        reset_delay *= max(owidth//iwidth, 1)
+
+        class DUT(Module):
+            def __init__(self):
+                self.clock_domains.cd_jesd = ClockDomain("jesd")
+                self.clock_domains.cd_phy  = ClockDomain("phy")
+                self.submodules.gearbox = GearboxBuffer(iwidth, owidth, depth, "jesd", "phy")
+
+        dut = DUT()
+
+        # Stream of 9-bit symbols (a counter), packed in iwidth words.
+        symbols  = [i for i in range(256)]
+        iwords   = [sum(symbols[i*iwidth//9 + j] << 9*j for j in range(iwidth//9))
+            for i in range(len(symbols)*9//iwidth)]
+        osymbols = []
+        itimes   = {} # Input symbol -> time (of the clock edge sampling it).
+        otimes   = {} # Output symbol -> time (of the clock edge sampling it).
+        firsts   = [] # First symbols of the wide words.
+
+        # Generators steps run on the clock edges (the n-th one at (n + 1)*period), reading the values
+        # sampled on the edge (writes being sampled on the next one).
+        def generator(dut):
+            yield dut.cd_jesd.rst.eq(1)
+            for i in range(128//iperiod + reset_delay):
+                yield
+            yield dut.cd_jesd.rst.eq(0)
+            for n, iword in enumerate(iwords + [0]):
+                iword_sampled = (yield dut.gearbox.din)
+                for j in range(iwidth//9):
+                    itimes.setdefault((iword_sampled >> 9*j) & 0x1ff, (128//iperiod + reset_delay + 1 + n)*iperiod)
+                if iwidth >= owidth:
+                    firsts.append(iword_sampled & 0x1ff)
+                yield dut.gearbox.din.eq(iword)
+                yield
+
+        def checker(dut):
+            yield dut.cd_phy.rst.eq(1)
+            for i in range(128//operiod):
+                yield
+            yield dut.cd_phy.rst.eq(0)
+            for i in range(len(iwords)*iwidth//owidth + 4*depth):
+                oword = (yield dut.gearbox.dout)
+                for j in range(owidth//9):
+                    osymbols.append((oword >> 9*j) & 0x1ff)
+                    otimes.setdefault(osymbols[-1], (128//operiod + 1 + i)*operiod)
+                if owidth > iwidth:
+                    firsts.append(oword & 0x1ff)
+                yield
+
+        run_simulation(dut, {"jesd": generator(dut), "phy": checker(dut)},
+            clocks={"jesd": (iperiod, iperiod//2), "phy": (operiod, operiod//2)})
+        # Output stream and latency (in output clocks, of the first symbol of a wide word).
+        symbol = min(s for s in firsts if s >= 64)
+        return osymbols, (otimes[symbol] - itimes[symbol])//operiod
+
+    def test_gearbox(self):
+        for depth in [4, 8]:
+            for iwidth, owidth in [(36, 36), (36, 18), (18, 36), (72, 18), (18, 72), (72, 36)]:
+                for reset_delay in range(4):
+                    osymbols, latency = self.gearbox_test(iwidth, owidth, depth, reset_delay)
+                    # Once running, output is the input stream delayed by the gearbox latency.
+                    start = osymbols.index(64)
+                    self.assertEqual(osymbols[start:start+128], list(range(64, 192)))
+                    # Latency is the reported one, whatever the reset release timing.
+                    self.assertEqual(latency, GearboxBuffer.get_latency(depth)*max(iwidth//owidth, 1))
+
+    def converter_gearbox_test(self, ratio, clocks_per_group):
+        # 2 converters, 1 8-bit sample per jesd clock (ratio samples per converter clock).
+        layout = [("converter0", 8*ratio), ("converter1", 8*ratio)]
+
+        class DUT(Module):
+            def __init__(self):
+                self.clock_domains.cd_jesd = ClockDomain("jesd")
+                self.clock_domains.cd_conv = ClockDomain("conv")
+                self.submodules.tx = ConverterGearboxTX(layout, ratio, clocks_per_group, "conv")
+                self.submodules.rx = ConverterGearboxRX(layout, ratio, clocks_per_group, "conv")
+                # Transport loopback (groups received every clocks_per_group clocks and held).
+                counter = Signal(max=clocks_per_group + 1)
+                self.sync.jesd += [
+                    counter.eq(counter + 1),
+                    If(counter == (clocks_per_group - 1),
+                        counter.eq(0),
+                        self.rx.sink.eq(self.tx.source)
+                    ),
+                    self.rx.valid.eq(counter == (clocks_per_group - 1))
+                ]
+
+        dut = DUT()
+        osamples = [[], []]
+
+        def generator(dut):
+            yield dut.cd_conv.rst.eq(1)
+            for i in range(8):
+                yield
+            yield dut.cd_conv.rst.eq(0)
+            for i in range(256//ratio):
+                for j in range(2):
+                    yield getattr(dut.tx.sink, "converter"+str(j)).eq(
+                        sum(((i*ratio + k + 128*j) & 0xff) << 8*k for k in range(ratio)))
+                yield
+
+        def checker(dut):
+            for i in range(256//ratio):
+                for j in range(2):
+                    data = (yield getattr(dut.rx.source, "converter"+str(j)))
+                    osamples[j].extend([(data >> 8*k) & 0xff for k in range(ratio)])
+                yield
+
+        run_simulation(dut, {"conv": [generator(dut), checker(dut)]},
+            clocks={"jesd": 8, "conv": 8*ratio})
+        return osamples
+
+    def test_converter_gearbox(self):
+        for ratio, clocks_per_group in [(1, 2), (2, 1), (2, 2), (4, 1), (4, 2), (4, 4)]:
+            osamples = self.converter_gearbox_test(ratio, clocks_per_group)
+            # Once running, samples are continuous (and converters aligned).
+            start = osamples[0].index(64)
+            self.assertEqual(osamples[0][start:start+128], list(range(64, 192)))
+            self.assertEqual(osamples[1][start:start+128], list(range(192, 256)) + list(range(0, 64)))
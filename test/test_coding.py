@@ -0,0 +1,81 @@
+#
+# This file is part of LiteJESD204B
+#
+# Copyright (c) 2016-2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+import random
+
+from migen import *
+
+from litejesd204b.coding import encode_8b10b, k_characters
+from litejesd204b.coding import LiteJESD204BCodingTX, LiteJESD204BCodingRX
+
+
+class TestCoding(unittest.TestCase):
+    def test_model(self):
+        # K28.5 (RD-/RD+), D21.5 (balanced, running disparity unchanged).
+        self.assertEqual(encode_8b10b(0xbc, 1, 0), (0b0101111100, 1))
+        self.assertEqual(encode_8b10b(0xbc, 1, 1), (0b1010000011, 0))
+        self.assertEqual(encode_8b10b(0xb5, 0, 0), (0b0101010101, 0))
+
+    def coding_test(self, data_width, offset, errors=[]):
+        nsymbols = data_width//8
+        width    = 10*nsymbols
+        random.seed(data_width + offset)
+        # Commas (alignment) then random data/control characters.
+        octets = [(0xbc, 1)]*4*nsymbols
+        for i in range(32*nsymbols):
+            if random.random() < 0.2:
+                octets.append((random.choice(k_characters), 1))
+            else:
+                octets.append((random.randrange(256), 0))
+        words = [octets[i:i+nsymbols] for i in range(0, len(octets), nsymbols)]
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.tx = tx = LiteJESD204BCodingTX(data_width)
+                self.submodules.rx = rx = LiteJESD204BCodingRX(data_width)
+                # Raw loopback, symbols shifted by offset bits (and errors injected on symbols bits).
+                self.error  = Signal(width)
+                last_source = Signal(width)
+                self.sync += last_source.eq(tx.source)
+                self.comb += [
+                    rx.align.eq(1),
+                    rx.sink.eq(Cat(last_source, tx.source)[width-offset:2*width-offset] ^ self.error)
+                ]
+        dut = DUT()
+        received     = []
+        code_errors  = []
+
+        def generator(dut):
+            for i, word in enumerate(words + [[(0, 0)]*nsymbols]*8):
+                yield dut.tx.sink.data.eq(sum(d << 8*j for j, (d, k) in enumerate(word)))
+                yield dut.tx.sink.ctrl.eq(sum(k << j for j, (d, k) in enumerate(word)))
+                yield dut.error.eq(sum(e << (10*j + 3) for j, (n, e) in enumerate(errors) if n == i))
+                yield
+                data = (yield dut.rx.source.data)
+                ctrl = (yield dut.rx.source.ctrl)
+                received.extend([((data >> 8*j) & 0xff, (ctrl >> j) & 0b1) for j in range(nsymbols)])
+                code_errors.append(((yield dut.rx.disparity_errors), (yield dut.rx.not_in_table_errors)))
+
+        run_simulation(dut, generator(dut))
+        return octets, received, code_errors
+
+    def test_coding_loopback(self):
+        for data_width in [16, 32, 64]:
+            for offset in [0, 3, 10 + 7]:
+                octets, received, code_errors = self.coding_test(data_width, offset)
+                # Octets following the commas received (shifted by the symbols offset), without
+                # errors once aligned.
+                octets = octets[4*data_width//8:]
+                self.assertTrue(any(received[i:i + len(octets)] == octets for i in range(len(received))))
+                self.assertEqual(code_errors[8:], [(0, 0)]*(len(code_errors) - 8))
+
+    def test_coding_errors(self):
+        # Bit errors on symbols are reported as disparity or not-in-table errors.
+        octets, received, code_errors = self.coding_test(32, 0, errors=[(20, 1), (40, 1)])
+        self.assertEqual(code_errors[8:20], [(0, 0)]*12)
+        self.assertNotEqual(code_errors[20:24], [(0, 0)]*4)
+        self.assertNotEqual(code_errors[40:44], [(0, 0)]*4)
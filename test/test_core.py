@@ -0,0 +1,818 @@
+#
+# This file is part of LiteJESD204B
+#
+# Copyright (c) 2016-2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+
+from migen import *
+
+from litex.soc.interconnect import stream
+
+from litejesd204b.common import *
+from litejesd204b.core import LiteJESD204BCoreTX, LiteJESD204BCoreRX
+from litejesd204b.core import LiteJESD204BMultiLinkCoreTX, LiteJESD204BMultiLinkCoreRX
+from litejesd204b.core import LiteJESD204BRXSyncGroup, LMFC
+from litejesd204b.core import LiteJESD204BCoreControl, LiteJESD204BSYSREFControl
+from litejesd204b.core import link_profiler_layout, lmfc_monitor_layout
+from litejesd204b.link import test_modes
+
+
+class PHY(Module):
+    def __init__(self, n, data_width=32):
+        self.n        = n
+        self.sink     = stream.Endpoint([("data", data_width), ("ctrl", data_width//8)])
+        self.source   = stream.Endpoint([("data", data_width), ("ctrl", data_width//8)])
+        self.rx_align = Signal()
+
+
+def get_jesd_settings(nlanes, nconverters, n, samples_per_frame, frames_per_multiframe):
+    ps = JESD204BPhysicalSettings(l=nlanes, m=nconverters, n=n, np=n)
+    ts = JESD204BTransportSettings(f=2, s=samples_per_frame, k=frames_per_multiframe, cs=0)
+    return JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+
+
+class CoreLoopback(Module):
+    """TX/RX cores with their lanes looped back, the TX sending converters' counters (incremented on
+    consumption). With phy_cdc, PHYs of phy_data_width (in links' bits) are clocked from their own
+    clock domains (at the frequency of their data width, phase aligned with the jesd clock)."""
+    def __init__(self, jesd_settings, samples_per_clock, converter_ratio=1, link_data_width=32,
+        phy_cdc=False, phy_data_width=None, fabric_8b10b=False, link_mode="8b10b", test_mode=None, rbd=0,
+        lane_recovery=False, rx_kwargs={}, **kwargs):
+        self.jesd_settings     = jesd_settings
+        self.samples_per_clock = samples_per_clock
+        self.converter_ratio   = converter_ratio
+        self.converter_cd      = converter_cd = "jesd" if converter_ratio == 1 else "converter"
+        nlanes = jesd_settings.nlanes
+        n      = jesd_settings.phy.n
+        converter_data_width = samples_per_clock*n
+        if phy_data_width is None:
+            phy_data_width = link_data_width
+
+        self.clock_domains.cd_jesd      = ClockDomain("jesd")
+        self.clock_domains.cd_converter = ClockDomain("converter")
+        jesd_period = 10*max(link_data_width//phy_data_width, 1)
+        phy_period  = jesd_period*phy_data_width//link_data_width
+        # Clocks derived from the same reference (rising edges aligned with the jesd ones).
+        def clock(period):
+            return (period, (period//2 - jesd_period//2)%period)
+        self.clocks = {
+            "jesd"      : jesd_period,
+            "converter" : clock(jesd_period*converter_ratio),
+        }
+        self.phys = phys = []
+        for i in range(nlanes):
+            for direction in ["tx", "rx"]:
+                name = "jesd_phy{}_{}".format(i, direction)
+                setattr(self.clock_domains, "cd_" + name, ClockDomain(name))
+                self.clocks[name] = clock(phy_period)
+            phys.append(PHY(i, {
+                "8b10b"  : 10*phy_data_width//8 if fabric_8b10b else phy_data_width,
+                "64b66b" : 66*phy_data_width//64}[link_mode]))
+        self.submodules += phys
+        core_kwargs = dict(
+            link_data_width = link_data_width,
+            phy_cdc         = phy_cdc,
+            fabric_8b10b    = fabric_8b10b,
+            link_mode       = link_mode,
+            test_patterns   = test_mode is not None,
+            converter_ratio = converter_ratio,
+            converter_cd    = converter_cd,
+            **kwargs)
+        self.submodules.tx = tx = LiteJESD204BCoreTX(phys, jesd_settings, converter_data_width, **core_kwargs)
+        self.submodules.rx = rx = LiteJESD204BCoreRX(phys, jesd_settings, converter_data_width,
+            **rx_kwargs, **core_kwargs)
+        self.comb += rx.rbd.eq(rbd)
+        if hasattr(rx, "lane_recovery"):
+            self.comb += rx.lane_recovery.eq(lane_recovery)
+        if test_mode is not None:
+            self.comb += [
+                tx.test_mode.eq(test_modes[test_mode]),
+                rx.test_mode.eq(test_modes[test_mode])
+            ]
+
+        # Control / SYSREF (period multiple of the LMFC period).
+        jsync = Signal()
+        self.jref = jref = Signal()
+        for core in [tx, rx]:
+            core.register_jsync(jsync)
+            core.register_jref(jref)
+            self.comb += core.enable.eq(1)
+        jref_counter = Signal(16)
+        self.sync.jesd += [
+            jref_counter.eq(jref_counter + 1),
+            If(jref_counter == (8*jesd_settings.get_lmfc_cycles(link_data_width) - 1),
+                jref_counter.eq(0)
+            ),
+            jref.eq(jref_counter == 0)
+        ]
+
+        # Lanes loopback (with 2 cycles of latency, raw symbols/blocks shifted by 3 bits with
+        # fabric 8b/10b/64b66b: symbols are LSB first, blocks MSB first).
+        for phy in phys:
+            sync_phy = getattr(self.sync, "jesd_phy{}_rx".format(phy.n)) if phy_cdc else self.sync.jesd
+            self.comb += phy.sink.ready.eq(1)
+            sync_phy += [
+                phy.source.valid.eq(1),
+                phy.source.data.eq(phy.sink.data),
+                phy.source.ctrl.eq(phy.sink.ctrl)
+            ]
+            if fabric_8b10b or link_mode == "64b66b":
+                last_data = Signal(len(phy.sink.data))
+                sync_phy += last_data.eq(phy.sink.data)
+                if fabric_8b10b:
+                    sync_phy += phy.source.data.eq(Cat(last_data, phy.sink.data)[len(last_data)-3:-3])
+                else:
+                    sync_phy += phy.source.data.eq(Cat(phy.sink.data, last_data)[3:len(last_data)+3])
+
+        # Samples: counter incremented on consumption.
+        self.counter = counter = Signal(n)
+        sync_converter = getattr(self.sync, converter_cd)
+        sync_converter += If(tx.sink.ready, counter.eq(counter + samples_per_clock))
+        for i in range(jesd_settings.nconverters):
+            self.comb += getattr(tx.sink, "converter"+str(i)).eq(
+                Cat(*[(counter + j + 64*i)[:n] for j in range(samples_per_clock)]))
+
+
+class CoreLoopbackControlErrors(CoreLoopback):
+    """Core loopback with /K/ injected on the first octets of each lane while its control_error bit."""
+    def __init__(self, jesd_settings, *args, octets=1, **kwargs):
+        CoreLoopback.__init__(self, jesd_settings, *args, **kwargs)
+        self.control_error = Signal(jesd_settings.nlanes)
+        for n, phy in enumerate(self.phys):
+            self.sync.jesd += If(self.control_error[n],
+                phy.source.data[:8*octets].eq(Replicate(Constant(control_characters["K"], 8), octets)),
+                phy.source.ctrl[:octets].eq(2**octets - 1)
+            )
+
+
+class CoreLoopbackLaneFaults(CoreLoopback):
+    """Core loopback with the last lane restarted by the TX on lane_restart, or failing (/K/ words,
+    CGS seen by its link, not restarted by the TX) while lane_failure."""
+    def __init__(self, jesd_settings, *args, **kwargs):
+        CoreLoopback.__init__(self, jesd_settings, *args, **kwargs)
+        octets = len(self.phys[-1].source.ctrl)
+        self.lane_restart = Signal()
+        self.lane_failure = Signal()
+        self.comb += self.tx.lane_restart.eq(self.lane_restart << (jesd_settings.nlanes - 1))
+        self.sync.jesd += If(self.lane_failure,
+            self.phys[-1].source.data.eq(Replicate(Constant(control_characters["K"], 8), octets)),
+            self.phys[-1].source.ctrl.eq(2**octets - 1)
+        )
+
+
+class TestCore(unittest.TestCase):
+    def loopback_test(self, dut, cycles, stimulus=None, status=None):
+        # Runs the core loopback, with stimulus(dut, cycle) applied on each converter cycle and
+        # status(dut) collected at the end. Received samples and RX ready drops are recorded.
+        jesd_settings = dut.jesd_settings
+        n = jesd_settings.phy.n
+        received = []
+
+        def checker(dut):
+            self.ready_drops = 0
+            ready = 0
+            for i in range(cycles//dut.converter_ratio):
+                if stimulus is not None:
+                    yield from stimulus(dut, i)
+                self.ready_drops += ready & ~(yield dut.rx.ready) & 0b1
+                ready = (yield dut.rx.ready)
+                if (yield dut.rx.source.valid):
+                    samples = []
+                    for j in range(jesd_settings.nconverters):
+                        data = (yield getattr(dut.rx.source, "converter"+str(j)))
+                        samples.append([(data >> n*k) & (2**n - 1) for k in range(dut.samples_per_clock)])
+                    received.append(((yield dut.rx.source.first), (yield dut.rx.source.last), samples))
+                yield
+            if status is not None:
+                yield from status(dut)
+
+        run_simulation(dut, {dut.converter_cd: checker(dut)}, clocks=dut.clocks)
+        return received
+
+    def core_loopback_test(self, nlanes, nconverters, n, samples_per_frame, frames_per_multiframe,
+        samples_per_clock, converter_ratio=1, link_data_width=32, phy_cdc=False, phy_data_width=None, rbd=0,
+        skew_fifo_depth=None, skew_fifo_buffered=False, transport_pipeline_stages=0, link_pipeline_stages=0,
+        fabric_8b10b=False, link_mode="8b10b", cycles=200):
+        jesd_settings = get_jesd_settings(nlanes, nconverters, n, samples_per_frame, frames_per_multiframe)
+        dut = CoreLoopback(jesd_settings, samples_per_clock,
+            converter_ratio           = converter_ratio,
+            link_data_width           = link_data_width,
+            phy_cdc                   = phy_cdc,
+            phy_data_width            = phy_data_width,
+            fabric_8b10b              = fabric_8b10b,
+            link_mode                 = link_mode,
+            rbd                       = rbd,
+            transport_pipeline_stages = transport_pipeline_stages,
+            link_pipeline_stages      = link_pipeline_stages,
+            rx_kwargs                 = dict(
+                skew_fifo_depth    = skew_fifo_depth,
+                skew_fifo_buffered = skew_fifo_buffered))
+
+        def status(dut):
+            self.skew_fifo_level = (yield dut.rx.skew_fifo_levels[0])
+            self.assertEqual(self.skew_fifo_level, (yield dut.rx.skew_fifos[0].level))
+
+        return self.loopback_test(dut, cycles, status=status)
+
+    def phy_cdc_latency_test(self, phy_cdc, phy_data_width=32, phy_reset_delay=0, cycles=240):
+        # 2 lanes/converters, 2 samples per clock, PHYs' clock domains released phy_reset_delay jesd
+        # clocks after the jesd one. Returns the phase (to SYSREF, in jesd clocks) of the ILAS
+        # multiframes (/R/) sent on the PHYs and the samples latency (in jesd clocks).
+        jesd_settings = get_jesd_settings(2, 2, 16, 1, 16)
+        lmfc_cycles   = jesd_settings.get_lmfc_cycles(32)
+        dut = CoreLoopback(jesd_settings, 2, phy_cdc=phy_cdc, phy_data_width=phy_data_width,
+            rx_kwargs=dict(skew_fifo_depth=16))
+        # Time, in cycles of the fastest clock (jesd or PHYs').
+        ratio = max(32//phy_data_width, 1)
+        dut.time  = Signal(32, reset_less=True)
+        sync_time = getattr(dut.sync, "jesd" if ratio == 1 else "jesd_phy0_tx")
+        sync_time += dut.time.eq(dut.time + 1)
+        phy_cds    = [cd for cd in dut.clocks if cd.startswith("jesd_phy")]
+        jref_times = []
+        ilas_times = []
+        tx_times   = {}
+        rx_times   = {}
+
+        def generator(dut):
+            for cd in phy_cds:
+                yield getattr(dut, "cd_" + cd).rst.eq(1)
+            for i in range(cycles):
+                if i == phy_reset_delay:
+                    for cd in phy_cds:
+                        yield getattr(dut, "cd_" + cd).rst.eq(0)
+                time = (yield dut.time)
+                if (yield dut.jref):
+                    jref_times.append(time)
+                if (yield dut.tx.sink.ready):
+                    tx_times.setdefault((yield dut.counter), time)
+                if (yield dut.rx.source.valid):
+                    rx_times.setdefault((yield dut.rx.source.converter0) & 0xffff, time)
+                yield
+
+        def phy_monitor(dut):
+            phy = dut.phys[0]
+            for i in range(cycles*dut.clocks["jesd"]//dut.clocks["jesd_phy0_tx"][0]):
+                data = (yield phy.sink.data)
+                ctrl = (yield phy.sink.ctrl)
+                for j in range(len(phy.sink.ctrl)):
+                    if (ctrl >> j) & 0b1 and ((data >> 8*j) & 0xff) == control_characters["R"]:
+                        ilas_times.append((yield dut.time) + j*8//32*ratio)
+                yield
+
+        run_simulation(dut, {"jesd": generator(dut), "jesd_phy0_tx": phy_monitor(dut)}, clocks=dut.clocks)
+        return ((ilas_times[0] - jref_times[0])%(lmfc_cycles*ratio)/ratio,
+            (rx_times[128] - tx_times[128])/ratio)
+
+    def control_errors_test(self, control_errors, cycles=256, test_mode=None, octets=1, latches=[]):
+        # 2 lanes/converters, 2 samples per clock, control_errors cycles per lane, error counters
+        # latched on latches cycles.
+        dut = CoreLoopbackControlErrors(get_jesd_settings(2, 2, 16, 1, 16), 2, test_mode=test_mode,
+            octets=octets)
+
+        def stimulus(dut, i):
+            yield dut.control_error.eq(sum((i in errors) << n for n, errors in enumerate(control_errors)))
+            yield dut.rx.error_counters_latch.eq(0b11 if i in latches else 0b00)
+            yield dut.tx.sync_error_reports_latch.eq(i in latches)
+            if test_mode is not None:
+                yield dut.rx.test_errors_latch.eq(0b11 if i in latches else 0b00)
+
+        def status(dut):
+            self.error_counters         = []
+            self.error_counters_latched = []
+            for error_counters, error_counters_latched in zip(dut.rx.error_counters, dut.rx.error_counters_latched):
+                self.error_counters.append({})
+                self.error_counters_latched.append({})
+                for name, _ in error_counters.layout:
+                    self.error_counters[-1][name]         = (yield getattr(error_counters, name))
+                    self.error_counters_latched[-1][name] = (yield getattr(error_counters_latched, name))
+            self.sync_error_reports         = (yield dut.tx.sync_error_reports)
+            self.sync_error_reports_latched = (yield dut.tx.sync_error_reports_latched)
+            if test_mode is not None:
+                self.test_errors         = []
+                self.test_errors_latched = []
+                for test_errors, test_errors_latched in zip(dut.rx.test_errors, dut.rx.test_errors_latched):
+                    self.test_errors.append((yield test_errors))
+                    self.test_errors_latched.append((yield test_errors_latched))
+
+        self.loopback_test(dut, cycles, stimulus, status)
+
+    def lane_faults_test(self, cycles, lane_recovery=False, lane_restarts=[], lane_failures=[]):
+        # 2 lanes/converters, 2 samples per clock, faults on the last lane.
+        dut = CoreLoopbackLaneFaults(get_jesd_settings(2, 2, 16, 1, 16), 2, lane_recovery=lane_recovery,
+            profilers=True, rx_kwargs={"lane_restart_recovery": True})
+
+        self.tx_ready_drops = 0
+        self.masked_cycles  = 0
+        self.masked_valids  = 0
+        tx_ready = 0
+
+        def stimulus(dut, i):
+            nonlocal tx_ready
+            yield dut.lane_restart.eq(i in lane_restarts)
+            yield dut.lane_failure.eq(i in lane_failures)
+            self.tx_ready_drops += tx_ready & ~(yield dut.tx.ready) & 0b1
+            tx_ready = (yield dut.tx.ready)
+            if (yield dut.rx.lanes_masked):
+                self.masked_cycles += 1
+                self.masked_valids += (yield dut.rx.source.valid)
+
+        def status(dut):
+            self.skew_fifo_levels = []
+            self.lane_recoveries  = []
+            for skew_fifo_level, lane_recovery in zip(dut.rx.skew_fifo_levels, dut.rx.lane_recoveries):
+                self.skew_fifo_levels.append((yield skew_fifo_level))
+                self.lane_recoveries.append(((yield lane_recovery.count), (yield lane_recovery.time)))
+            self.profilers = []
+            for profiler in [dut.rx.profiler] + dut.rx.lane_profilers:
+                self.profilers.append({})
+                for name, _ in link_profiler_layout:
+                    self.profilers[-1][name] = (yield getattr(profiler.status, name))
+                for state, counters in profiler.states.items():
+                    self.profilers[-1][state] = ((yield counters.dwell), (yield counters.entries))
+            # Profilers latched together, latched copies stable while the counters run.
+            profiler = dut.rx.profiler
+            yield dut.rx.profiler_latch.eq(1)
+            yield
+            yield dut.rx.profiler_latch.eq(0)
+            yield
+            self.profiler_latches = []
+            for i in range(4):
+                self.profiler_latches.append(((yield profiler.latched_status.link_up),
+                    (yield profiler.status.link_up)))
+                yield
+
+        return self.loopback_test(dut, cycles, stimulus, status)
+
+    def check_loopback(self, received, nconverters, n, samples_per_multiframe, aligned=True,
+        sent_before=False):
+        self.assertGreater(len(received), 32)
+        samples = [[s for first, last, c in received for s in c[j]] for j in range(nconverters)]
+        # Samples are continuous from the first consumed one (zeros are received before when not
+        # aligned on multiframes, or from the first received one when sent_before the RX links were
+        # ready) and converters are aligned.
+        start = 0 if aligned else samples[0].index(1) - 1
+        base  = samples[0][0] if sent_before else 0
+        for j in range(nconverters):
+            self.assertEqual(samples[j][start:],
+                [(base + i + 64*j) % 2**n for i in range(len(samples[0]) - start)])
+        # First/Last on multiframes boundaries.
+        if aligned:
+            for first, last, c in received:
+                self.assertEqual(first, c[0][0] % samples_per_multiframe == 0)
+                self.assertEqual(last, (c[0][-1] + 1) % samples_per_multiframe == 0)
+        else:
+            firsts = [i for i, (first, last, c) in enumerate(received) if first]
+            words_per_multiframe = samples_per_multiframe//len(received[0][2][0])
+            self.assertEqual(firsts[0], 0)
+            self.assertEqual(firsts, list(range(0, len(received), words_per_multiframe)))
+
+    def test_core_stream(self):
+        # 1 frame per clock.
+        received = self.core_loopback_test(1, 2, 16, 1, 8, 1)
+        self.check_loopback(received, 2, 16, 8)
+        # Frames over 2 clocks (converter gearbox).
+        received = self.core_loopback_test(1, 2, 16, 2, 4, 1)
+        self.check_loopback(received, 2, 16, 8)
+        # Group of frames provided directly (F=3).
+        received = self.core_loopback_test(1, 2, 12, 1, 8, 4)
+        self.check_loopback(received, 2, 12, 8)
+
+    def test_core_converter_ratio(self):
+        for converter_ratio in [2, 4]:
+            received = self.core_loopback_test(1, 2, 16, 1, 8, converter_ratio, converter_ratio, cycles=300)
+            self.check_loopback(received, 2, 16, 8, aligned=False)
+
+    def test_core_rbd(self):
+        # Skew FIFOs released RBD cycles after the LMFC: same samples, lower skew FIFO level.
+        levels = {}
+        for rbd in [0, 3, 9]:
+            received = self.core_loopback_test(1, 2, 16, 1, 16, 1, rbd=rbd)
+            self.check_loopback(received, 2, 16, 16)
+            levels[rbd] = self.skew_fifo_level
+        for rbd in [3, 9]:
+            self.assertEqual(levels[rbd], (levels[0] + rbd)%16)
+
+    def test_core_skew_fifo(self):
+        # Skew FIFOs sized to the lanes' level on release (trimmed with the RBD), with asynchronous
+        # or registered reads.
+        for skew_fifo_buffered in [False, True]:
+            received = self.core_loopback_test(1, 2, 16, 1, 16, 1, rbd=3,
+                skew_fifo_depth=4, skew_fifo_buffered=skew_fifo_buffered)
+            self.check_loopback(received, 2, 16, 16)
+            self.assertEqual(self.skew_fifo_level, 2)
+
+    def test_core_pipeline(self):
+        # Transport/Link pipeline stages: same samples, first/last still on multiframes boundaries.
+        for transport_pipeline_stages, link_pipeline_stages in [(2, 0), (1, 3)]:
+            kwargs = dict(
+                transport_pipeline_stages = transport_pipeline_stages,
+                link_pipeline_stages      = link_pipeline_stages)
+            received = self.core_loopback_test(1, 2, 16, 1, 8, 1, **kwargs)
+            self.check_loopback(received, 2, 16, 8)
+            received = self.core_loopback_test(1, 2, 16, 2, 4, 1, **kwargs)
+            self.check_loopback(received, 2, 16, 8)
+            received = self.core_loopback_test(1, 2, 12, 1, 8, 4, **kwargs)
+            self.check_loopback(received, 2, 12, 8)
+
+    def test_core_fabric_8b10b(self):
+        # Raw 10-bit symbols PHYs (comma alignment and 8b/10b coding in fabric).
+        received = self.core_loopback_test(1, 2, 16, 1, 8, 1, fabric_8b10b=True)
+        self.check_loopback(received, 2, 16, 8)
+        received = self.core_loopback_test(1, 2, 16, 1, 8, 2, link_data_width=64, fabric_8b10b=True)
+        self.check_loopback(received, 2, 16, 8)
+
+    def test_core_phy_cdc(self):
+        # PHYs clocked from their own clock domains, through the PHYs' CDCs (with width conversion,
+        # skew FIFOs sized for the latency of the loopback in the PHYs' clock domains). The CDCs'
+        # gearboxes are tested on their own (cf test_cdc), lanes' alignment in phy_cdc_latency.
+        for phy_data_width in [16, 32, 64]:
+            received = self.core_loopback_test(1, 2, 16, 1, 8, 1, phy_cdc=True, phy_data_width=phy_data_width,
+                skew_fifo_depth=16)
+            self.check_loopback(received, 2, 16, 8)
+        # Raw 10-bit symbols PHYs (raw words through the CDCs, 8b/10b coding in the jesd clock domain).
+        received = self.core_loopback_test(1, 2, 16, 1, 8, 1, phy_cdc=True, phy_data_width=64,
+            skew_fifo_depth=16, fabric_8b10b=True)
+        self.check_loopback(received, 2, 16, 8)
+
+    def test_core_phy_cdc_latency(self):
+        # Deterministic latency through the PHYs' CDCs: ILAS multiframes sent on the PHYs on the same
+        # phase of SYSREF as without the CDCs (LMFC compensating their latency) and samples latency
+        # independent of the PHYs' reset release (gearboxes' latency checked on all the reset release
+        # timings in test_cdc).
+        ilas_phase, _ = self.phy_cdc_latency_test(phy_cdc=False)
+        for phy_data_width in [16, 64]:
+            latencies = []
+            for phy_reset_delay in [0, 3]:
+                phase, latency = self.phy_cdc_latency_test(True, phy_data_width, phy_reset_delay)
+                self.assertEqual(phase, ilas_phase)
+                latencies.append(latency)
+            self.assertEqual(len(set(latencies)), 1)
+
+    def test_core_error_counters(self):
+        # Unexpected control character injected on lane 0 once the links are up.
+        self.control_errors_test(control_errors=[[156]])
+        self.assertEqual(self.error_counters[0], {"unexpected_control": 1, "frame_align": 0, "lane_align": 0})
+        self.assertEqual(self.error_counters[1], {"unexpected_control": 0, "frame_align": 0, "lane_align": 0})
+        # Error reported over SYNC~ without re-synchronization.
+        self.assertEqual(self.sync_error_reports, 1)
+        self.assertEqual(self.ready_drops, 0)
+        # Errors on both lanes in the same frames window: reported once.
+        self.control_errors_test(control_errors=[[156], [157]])
+        self.assertEqual(self.error_counters[0]["unexpected_control"], 1)
+        self.assertEqual(self.error_counters[1]["unexpected_control"], 1)
+        self.assertEqual(self.sync_error_reports, 1)
+        self.assertEqual(self.ready_drops, 0)
+        # Errors counted in octets.
+        self.control_errors_test(control_errors=[[156]], octets=2)
+        self.assertEqual(self.error_counters[0]["unexpected_control"], 2)
+        self.assertEqual(self.sync_error_reports, 1)
+        # Counters latched and cleared together: errors before the latch in the latched copy, errors
+        # after it in the new count.
+        self.control_errors_test(control_errors=[[156, 196]], latches=[176])
+        self.assertEqual(self.error_counters_latched[0]["unexpected_control"], 1)
+        self.assertEqual(self.error_counters[0]["unexpected_control"], 1)
+        self.assertEqual(self.error_counters_latched[1]["unexpected_control"], 0)
+        self.assertEqual(self.sync_error_reports_latched, 1)
+        self.assertEqual(self.sync_error_reports, 1)
+        # Code errors counted when known to the core (fabric 8b/10b/64b66b), 16-bit counters.
+        for nlanes, frames_per_multiframe, phy_data_width, kwargs, code in [
+            (2, 16, 32, {},                                               False),
+            (2, 16, 40, {"fabric_8b10b": True},                           True),
+            (1, 64, 66, {"link_mode": "64b66b", "link_data_width": 64},  True)]:
+            jesd_settings = get_jesd_settings(nlanes, 2, 16, 1, frames_per_multiframe)
+            phys = [PHY(i, phy_data_width) for i in range(nlanes)]
+            rx = LiteJESD204BCoreRX(phys, jesd_settings, 32, phy_cdc=False, **kwargs)
+            control = LiteJESD204BCoreControl(rx, 100e6)
+            self.assertFalse(hasattr(control, "profiler"))     # Profilers opt-in.
+            self.assertFalse(hasattr(control, "lanes_masked")) # Lane recovery opt-in.
+            fields = control.lane0_errors.fields
+            self.assertEqual(hasattr(fields, "code"), code)
+            self.assertEqual(len(fields.unexpected_control), 16)
+            self.assertEqual(len(control.lane0_errors.status), 16*len(rx.error_counters[0].layout))
+
+    def test_core_lane_recovery(self):
+        # Last lane restarted by the TX: recovered on its own, with the same skew FIFO level on
+        # release and the samples flow kept.
+        received = self.lane_faults_test(cycles=396, lane_recovery=True, lane_restarts=[146])
+        self.assertEqual(self.ready_drops, 0)
+        # Samples not valid while the lane is masked (zeroed samples not received).
+        self.assertNotEqual(self.masked_cycles, 0)
+        self.assertEqual(self.masked_valids, 0)
+        # TX not ready during the restart: samples not consumed meanwhile and none lost (received
+        # samples only interrupted by the restarted lane's characters until the RX drops it).
+        self.assertEqual(self.tx_ready_drops, 1)
+        for j in range(2):
+            samples = [s for first, last, c in received for s in c[j] if s != 0]
+            samples = [s for s in samples if samples[0] <= s <= samples[-1]]
+            self.assertEqual(samples, list(range(samples[0], samples[-1] + 1)))
+        self.assertEqual(self.lane_recoveries[0][0], 0)
+        self.assertEqual(self.lane_recoveries[1][0], 1)
+        self.assertNotEqual(self.lane_recoveries[1][1], 0)
+        self.assertEqual(self.skew_fifo_levels[1], self.skew_fifo_levels[0])
+        self.check_loopback(received[-64:], 2, 16, 16, sent_before=True)
+        # Core not dropped, last lane dropped and re-synchronized (profilers: core, then lanes).
+        latched, link_ups = zip(*self.profiler_latches)
+        self.assertNotEqual(latched[0], 0)
+        self.assertEqual(len(set(latched)), 1)
+        self.assertEqual(list(link_ups), [link_ups[0] + i for i in range(4)])
+        self.assertEqual(self.profilers[0]["drops"], 0)
+        self.assertEqual(self.profilers[1]["drops"], 0)
+        self.assertEqual(self.profilers[1]["RECEIVE-DATA"][1], 1)
+        self.assertEqual(self.profilers[2]["drops"], 1)
+        self.assertEqual(self.profilers[2]["RECEIVE-CGS"][1],  2)
+        self.assertEqual(self.profilers[2]["RECEIVE-DATA"][1], 2)
+        # Without lane recovery, all the lanes are re-synchronized.
+        self.lane_faults_test(cycles=396, lane_restarts=[146])
+        self.assertNotEqual(self.ready_drops, 0)
+        self.assertEqual(self.lane_recoveries[1][0], 0)
+        self.assertEqual(self.profilers[0]["drops"], 1)
+        self.assertEqual(self.profilers[1]["RECEIVE-DATA"][1], 2)
+        self.assertNotEqual(self.profilers[0]["bring_up"], 0)
+        self.assertNotEqual(self.profilers[0]["link_up"], 0)
+        # Last lane failing without TX restart: recovery timeout and full re-initialization.
+        received = self.lane_faults_test(cycles=696, lane_recovery=True, lane_failures=[146])
+        self.assertEqual(self.ready_drops, 1)
+        self.assertEqual(self.lane_recoveries[1][0], 1)
+        samples = [s for first, last, c in received[-64:] for s in c[0]]
+        self.assertEqual(samples, [(samples[0] + i) % 2**16 for i in range(len(samples))])
+
+    def test_core_test_patterns(self):
+        # PRBS15 on the lanes, /K/ injected on lane 0 (8 bit errors with the next octet's check),
+        # bit errors latched and cleared after the injection.
+        self.control_errors_test(control_errors=[], cycles=200, test_mode="prbs15")
+        self.assertEqual(self.test_errors, [0, 0])
+        self.control_errors_test(control_errors=[[100]], cycles=200, test_mode="prbs15", latches=[150])
+        self.assertNotEqual(self.test_errors_latched[0], 0)
+        self.assertEqual(self.test_errors_latched[1], 0)
+        self.assertEqual(self.test_errors, [0, 0])
+
+    def test_core_64b66b(self):
+        # JESD204C 64b/66b links (raw 66-bit blocks PHYs, extended multiblocks on the multiframes).
+        # Without SYNC~, TX sends samples before RX is locked.
+        received = self.core_loopback_test(1, 2, 16, 1, 64, 2, link_data_width=64, link_mode="64b66b",
+            cycles=1000)
+        self.check_loopback(received, 2, 16, 64, sent_before=True)
+
+    def test_core_multilink(self):
+        # 2 links with different settings (and LMFC periods) sharing the LMFC.
+        links = [
+            # nlanes, nconverters, frames_per_multiframe, samples_per_clock
+            (1, 2, 16, 1), # F=4, 16 cycles per multiframe.
+            (2, 2,  8, 2), # F=2,  4 cycles per multiframe.
+        ]
+        jesd_settings = []
+        for nlanes, nconverters, frames_per_multiframe, samples_per_clock in links:
+            ps = JESD204BPhysicalSettings(l=nlanes, m=nconverters, n=16, np=16)
+            ts = JESD204BTransportSettings(f=2, s=1, k=frames_per_multiframe, cs=0)
+            jesd_settings.append(JESD204BSettings(ps, ts, did=0x5a, bid=0x5))
+        nlanes = sum(link[0] for link in links)
+
+        class DUT(Module):
+            def __init__(self):
+                self.clock_domains.cd_jesd = ClockDomain("jesd")
+                phys = []
+                for i in range(nlanes):
+                    for direction in ["tx", "rx"]:
+                        name = "jesd_phy{}_{}".format(i, direction)
+                        setattr(self.clock_domains, "cd_" + name, ClockDomain(name))
+                    phys.append(PHY(i))
+                self.submodules += phys
+                links_phys = [phys[:1], phys[1:]]
+                converter_data_width = [16*link[3] for link in links]
+                self.submodules.tx = tx = LiteJESD204BMultiLinkCoreTX(links_phys, jesd_settings, converter_data_width, phy_cdc=False,
+                    sink_valid=True)
+                self.submodules.rx = rx = LiteJESD204BMultiLinkCoreRX(links_phys, jesd_settings, converter_data_width, phy_cdc=False)
+
+                # Control / SYSREF (period multiple of the shared LMFC period).
+                jref = Signal()
+                tx.register_jref(jref)
+                rx.register_jref(jref)
+                jref_counter = Signal(8)
+                self.sync.jesd += [
+                    jref_counter.eq(jref_counter + 1),
+                    jref.eq(jref_counter == 0)
+                ]
+                for tx_core, rx_core in zip(tx.cores, rx.cores):
+                    jsync = Signal()
+                    tx_core.register_jsync(jsync)
+                    rx_core.register_jsync(jsync)
+                    self.comb += [tx_core.enable.eq(1), rx_core.enable.eq(1)]
+
+                # Lanes loopback.
+                for phy in phys:
+                    self.comb += phy.sink.ready.eq(1)
+                    self.sync.jesd += [
+                        phy.source.valid.eq(1),
+                        phy.source.data.eq(phy.sink.data),
+                        phy.source.ctrl.eq(phy.sink.ctrl)
+                    ]
+
+                # Samples: counters incremented on consumption.
+                for core, (_, nconverters, _, samples_per_clock) in zip(tx.cores, links):
+                    counter = Signal(16)
+                    self.sync.jesd += If(core.sink.ready, counter.eq(counter + samples_per_clock))
+                    self.comb += core.sink.valid.eq(1)
+                    for i in range(nconverters):
+                        self.comb += getattr(core.sink, "converter"+str(i)).eq(
+                            Cat(*[(counter + j + 64*i)[:16] for j in range(samples_per_clock)]))
+
+        dut = DUT()
+        received = [[] for link in links]
+
+        def checker(dut):
+            for i in range(400):
+                for n, (core, (_, nconverters, _, samples_per_clock)) in enumerate(zip(dut.rx.cores, links)):
+                    if (yield core.source.valid):
+                        samples = []
+                        for j in range(nconverters):
+                            data = (yield getattr(core.source, "converter"+str(j)))
+                            samples.append([(data >> 16*k) & 0xffff for k in range(samples_per_clock)])
+                        received[n].append(((yield core.source.first), (yield core.source.last), samples))
+                yield
+
+        clocks = {"jesd": 10}
+        for i in range(nlanes):
+            clocks["jesd_phy{}_tx".format(i)] = 10
+            clocks["jesd_phy{}_rx".format(i)] = 10
+        run_simulation(dut, {"jesd": checker(dut)}, clocks=clocks)
+        for n, (_, nconverters, frames_per_multiframe, _) in enumerate(links):
+            self.check_loopback(received[n], nconverters, 16, frames_per_multiframe)
+
+    def test_core_rx_sync_group(self):
+        # 2 devices sharing SYSREF, the second one enabled later and with 3 more cycles of latency.
+        ps = JESD204BPhysicalSettings(l=1, m=2, n=16, np=16)
+        ts = JESD204BTransportSettings(f=2, s=1, k=16, cs=0)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+        latencies = [1, 4]
+
+        class DUT(Module):
+            def __init__(self):
+                self.clock_domains.cd_jesd = ClockDomain("jesd")
+                jref = Signal()
+                jref_counter = Signal(8)
+                self.sync.jesd += [
+                    jref_counter.eq(jref_counter + 1),
+                    jref.eq(jref_counter == 0)
+                ]
+                enable_counter = Signal(8)
+                self.sync.jesd += If(enable_counter != 255, enable_counter.eq(enable_counter + 1))
+                self.txs, self.rxs = [], []
+                for i, latency in enumerate(latencies):
+                    for direction in ["tx", "rx"]:
+                        name = "jesd_phy{}_{}".format(i, direction)
+                        setattr(self.clock_domains, "cd_" + name, ClockDomain(name))
+                    phy = PHY(i)
+                    tx = LiteJESD204BCoreTX([phy], jesd_settings, 16, phy_cdc=False)
+                    rx = LiteJESD204BCoreRX([phy], jesd_settings, 16, phy_cdc=False)
+                    self.submodules += phy, tx, rx
+                    self.txs.append(tx)
+                    self.rxs.append(rx)
+                    jsync = Signal()
+                    tx.register_jsync(jsync)
+                    rx.register_jsync(jsync)
+                    for core in [tx, rx]:
+                        core.register_jref(jref)
+                        self.comb += core.enable.eq(enable_counter >= 100*i)
+
+                    # Lane loopback.
+                    data = [phy.sink.data] + [Signal(32) for _ in range(latency)]
+                    ctrl = [phy.sink.ctrl] + [Signal(4) for _ in range(latency)]
+                    for j in range(latency):
+                        self.sync.jesd += data[j+1].eq(data[j]), ctrl[j+1].eq(ctrl[j])
+                    self.comb += [
+                        phy.sink.ready.eq(1),
+                        phy.source.valid.eq(1),
+                        phy.source.data.eq(data[-1]),
+                        phy.source.ctrl.eq(ctrl[-1])
+                    ]
+
+                    # Samples: counter incremented on consumption.
+                    counter = Signal(16)
+                    self.sync.jesd += If(tx.sink.ready, counter.eq(counter + 1))
+                    self.comb += [
+                        tx.sink.valid.eq(1),
+                        tx.sink.converter0.eq(counter),
+                        tx.sink.converter1.eq(counter + 64),
+                    ]
+                self.submodules.group = LiteJESD204BRXSyncGroup(self.rxs)
+
+        dut = DUT()
+        received = [[] for _ in latencies]
+        ready    = [[] for _ in latencies]
+
+        def checker(dut):
+            for i in range(800):
+                for n, rx in enumerate(dut.rxs):
+                    ready[n].append((yield rx.ready))
+                    if (yield rx.source.valid):
+                        received[n].append((i, (yield rx.source.converter0)))
+                yield
+            self.assertEqual((yield dut.group.ready), 1)
+            self.assertEqual((yield dut.group.skew), 3)
+            # Skew sized from the skew FIFOs' levels (no wrap up to the FIFOs' depth).
+            self.assertEqual(len(dut.group.skew), len(dut.rxs[0].skew_fifos[0].level))
+
+        clocks = {"jesd": 10}
+        for i in range(len(latencies)):
+            clocks["jesd_phy{}_tx".format(i)] = 10
+            clocks["jesd_phy{}_rx".format(i)] = 10
+        run_simulation(dut, {"jesd": checker(dut)}, clocks=clocks)
+        # Devices released on the same cycle and samples aligned across devices.
+        self.assertEqual(ready[0], ready[1])
+        self.assertGreater(len(received[0]), 32)
+        self.assertEqual(received[0], received[1])
+
+    def test_core_latency(self):
+        # Latency reported per stage and LMFC loads derived from the PHYs' CDCs latency.
+        ps = JESD204BPhysicalSettings(l=2, m=2, n=16, np=16)
+        ts = JESD204BTransportSettings(f=2, s=1, k=16, cs=0)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+        lmfc_cycles = jesd_settings.get_lmfc_cycles(32)
+        for phy_data_width, fabric_8b10b, cdc_latency, coding_latency in [
+            (32, False, 3, 0),
+            (64, False, 6, 0),
+            (40, True,  3, 2)]:
+            phys = [PHY(i, phy_data_width) for i in range(2)]
+            kwargs = dict(transport_pipeline_stages=2, link_pipeline_stages=1, fabric_8b10b=fabric_8b10b)
+            tx = LiteJESD204BCoreTX(phys, jesd_settings, 32, **kwargs)
+            rx = LiteJESD204BCoreRX(phys, jesd_settings, 32, **kwargs)
+            self.assertEqual(tx.latency_stages,
+                {"converter_gearbox": 0, "transport": 2, "link": 2, "coding": coding_latency, "cdc": cdc_latency})
+            self.assertEqual(rx.latency_stages,
+                {"cdc": cdc_latency, "coding": coding_latency, "link": 2, "transport": 2, "converter_gearbox": 0})
+            phys_latency = coding_latency + cdc_latency
+            self.assertEqual(tx.latency, 4 + phys_latency)
+            self.assertEqual(rx.latency, 4 + phys_latency)
+            self.assertEqual(tx.lmfc.load.reset.value, 1 + phys_latency)
+            self.assertEqual(rx.lmfc.load.reset.value, lmfc_cycles - 1 - phys_latency)
+            # Latency budget checked at build time.
+            LiteJESD204BCoreTX(phys, jesd_settings, 32, max_latency=4 + phys_latency, **kwargs)
+            with self.assertRaises(AssertionError):
+                LiteJESD204BCoreRX(phys, jesd_settings, 32, max_latency=3 + phys_latency, **kwargs)
+        # Latency CSR fields sized from the largest stage.
+        phys = [PHY(i) for i in range(2)]
+        tx = LiteJESD204BCoreTX(phys, jesd_settings, 32, transport_pipeline_stages=300)
+        control = LiteJESD204BCoreControl(tx, 100e6)
+        self.assertEqual(control.latency.fields.transport.reset.value, 300)
+        self.assertEqual(control.latency.fields.total.reset.value, tx.latency)
+
+    def lmfc_sysref_test(self, shots, edges, latches=[]):
+        lmfc = LMFC(16)
+
+        def generator(dut):
+            yield dut.shots.eq(shots)
+            for i in range(400):
+                yield dut.jref.eq(i in edges)
+                yield dut.monitor_latch.eq(i in latches)
+                yield
+            self.lmfc_monitor         = {}
+            self.lmfc_monitor_latched = {}
+            for name, _ in lmfc_monitor_layout:
+                self.lmfc_monitor[name]         = (yield getattr(dut.monitor, name))
+                self.lmfc_monitor_latched[name] = (yield getattr(dut.monitor_latched, name))
+
+        run_simulation(lmfc, generator(lmfc))
+
+    def test_lmfc_sysref(self):
+        # SYSREF every 4 LMFC periods with a glitch (first edge aligning the LMFC, then in phase).
+        edges = [10, 74, 138, 202, 207, 266, 330]
+        # Continuous: LMFC shifted by the glitch and re-aligned by the next edge.
+        self.lmfc_sysref_test(0, edges)
+        self.assertEqual(self.lmfc_monitor, {"count": 15, "edges": 7, "off_phase": 3})
+        # One-shot: glitch ignored (but reported), LMFC kept in phase.
+        self.lmfc_sysref_test(1, edges)
+        self.assertEqual(self.lmfc_monitor, {"count": 15, "edges": 7, "off_phase": 2})
+        # N-shot (5): glitch loaded as the last shot, following edges ignored and off-phase.
+        self.lmfc_sysref_test(5, edges)
+        self.assertEqual(self.lmfc_monitor["edges"],     7)
+        self.assertEqual(self.lmfc_monitor["off_phase"], 4)
+        self.assertNotEqual(self.lmfc_monitor["count"],  15)
+        # Latched and cleared together before the glitch: edges before in the latched copy, edges after
+        # in the new count.
+        self.lmfc_sysref_test(0, edges, latches=[205])
+        self.assertEqual(self.lmfc_monitor_latched, {"count": 15, "edges": 4, "off_phase": 1})
+        self.assertEqual(self.lmfc_monitor, {"count": 15, "edges": 3, "off_phase": 2})
+
+    def test_sysref_control(self):
+        # Capture modes: continuous (0 shots), one-shot, N-shot, reserved (continuous).
+        class DUT(Module):
+            def __init__(self):
+                self.clock_domains.cd_jesd = ClockDomain("jesd")
+                self.submodules.lmfc    = ClockDomainsRenamer("jesd")(LMFC(16))
+                self.submodules.control = LiteJESD204BSYSREFControl(self.lmfc)
+
+        dut   = DUT()
+        shots = []
+
+        def generator(dut):
+            for mode in range(4):
+                yield dut.control.control.fields.mode.eq(mode)
+                yield dut.control.control.fields.shots.eq(5)
+                for i in range(8):
+                    yield
+                shots.append((yield dut.lmfc.shots))
+
+        run_simulation(dut, {"sys": generator(dut)}, clocks={"sys": 10, "jesd": 10})
+        self.assertEqual(shots, [0, 1, 5, 0])
@@ -11,7 +11,7 @@ from migen import *
 from test.model.common import swap_bytes
 
 from litejesd204b.common import *
-from litejesd204b.link import ILASGenerator, ILASChecker
+from litejesd204b.link import ILAS, ILASGenerator, ILASChecker
 
 # ILAS reference sequence (from a validated core)
 def ilas_datas_reference():
@@ -99,6 +99,66 @@ class TestILAS(unittest.TestCase):
         self.assertEqual(ilas_datas_reference(), ilas_datas_output)
         self.assertEqual(ilas_ctrls_reference(), ilas_ctrls_output)
 
+    def test_ilas_generator_64(self):
+        ps = JESD204BPhysicalSettings(l=4, m=4, n=14, np=16)
+        ts = JESD204BTransportSettings(f=2, s=1, k=32, cs=2)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x55, bid=0xa)
+
+        dut = ILASGenerator(64, 2, 32, jesd_settings.get_configuration_data())
+
+        # 64-bit words are the concatenation of two consecutive 32-bit reference words.
+        datas = ilas_datas_reference()
+        ctrls = ilas_ctrls_reference()
+        _ilas_datas_reference = [datas[2*i] | (datas[2*i+1] << 32) for i in range(len(datas)//2)]
+        _ilas_ctrls_reference = [ctrls[2*i] | (ctrls[2*i+1] <<  4) for i in range(len(ctrls)//2)]
+
+        ilas_datas_output = []
+        ilas_ctrls_output = []
+
+        def checker(dut):
+            yield dut.reset.eq(1)
+            yield
+            yield dut.reset.eq(0)
+            while (yield dut.source.last) == 0:
+                yield
+                ilas_datas_output.append((yield dut.source.data))
+                ilas_ctrls_output.append((yield dut.source.ctrl))
+
+        run_simulation(dut, checker(dut))
+        self.assertEqual(_ilas_datas_reference, ilas_datas_output)
+        self.assertEqual(_ilas_ctrls_reference, ilas_ctrls_output)
+
+    def test_ilas_generator_configurations(self):
+        # Words generated on the fly are identical to the reference ones.
+        configurations = [
+            # data_width, octets_per_frame, frames_per_multiframe, with_counter
+            (32, 1, 32, True),
+            (32, 3,  8, True),
+            (32, 8, 32, True),
+            (64, 4,  4, True),
+            (64, 1, 32, False),
+        ]
+        for data_width, octets_per_frame, frames_per_multiframe, with_counter in configurations:
+            configuration_data = [(0x11*i + octets_per_frame) & 0xff for i in range(14)]
+            reference = ILAS(data_width, octets_per_frame, frames_per_multiframe, configuration_data, with_counter)
+            dut = ILASGenerator(data_width, octets_per_frame, frames_per_multiframe, configuration_data, with_counter)
+
+            ilas_datas_output = []
+            ilas_ctrls_output = []
+
+            def checker(dut):
+                yield dut.reset.eq(1)
+                yield
+                yield dut.reset.eq(0)
+                while (yield dut.source.last) == 0:
+                    yield
+                    ilas_datas_output.append((yield dut.source.data))
+                    ilas_ctrls_output.append((yield dut.source.ctrl))
+
+            run_simulation(dut, checker(dut))
+            self.assertEqual(reference.data_words, ilas_datas_output)
+            self.assertEqual(reference.ctrl_words, ilas_ctrls_output)
+
     def test_ilas_checker(self):
         ps = JESD204BPhysicalSettings(l=4, m=4, n=14, np=16)
         ts = JESD204BTransportSettings(f=2, s=1, k=32, cs=2)
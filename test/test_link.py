@@ -9,8 +9,12 @@ import random
 
 from migen import *
 
+from litejesd204b.common import *
 from litejesd204b.link import link_layout
+from litejesd204b.link import Framer
 from litejesd204b.link import LiteJESD204BLinkTXDatapath, LiteJESD204BLinkRXDatapath
+from litejesd204b.link import test_modes, rpat_octets, PatternGenerator, PatternChecker
+from litejesd204b.link import LiteJESD204BLinkTX, LiteJESD204BLinkRX
 
 from test.model.common import Control
 from test.model.link import scramble_lanes, descramble_lanes
@@ -24,23 +28,24 @@ def flatten_lane(lane):
 
 
 class TestLink(unittest.TestCase):
-    def test_link_tx(self, nlanes=4, data_width=32):
+    def test_link_tx(self, nlanes=4, data_width=32, octets_per_frame=2, frames_per_multiframe=4):
         prng = random.Random(6)
-        input_lane = [[prng.randrange(256), prng.randrange(256)]
-            for _ in range(2048)]
+        input_lane = [[prng.randrange(256) for _ in range(octets_per_frame)]
+            for _ in range(4096//octets_per_frame)]
         output_lanes = scramble_lanes([input_lane])
-        output_lanes = insert_alignment_characters(frames_per_multiframe=4,
+        output_lanes = insert_alignment_characters(frames_per_multiframe=frames_per_multiframe,
                                                    scrambled=True,
                                                    lanes=output_lanes)
         link = ResetInserter()(LiteJESD204BLinkTXDatapath(data_width,
-            octets_per_frame=2,
-            frames_per_multiframe=4))
+            octets_per_frame      = octets_per_frame,
+            frames_per_multiframe = frames_per_multiframe))
         link.output_lane = []
 
         octets_per_cycle = data_width//8
+        flat_input_lane  = flatten_lane(input_lane)
+        cycles = len(flat_input_lane)//octets_per_cycle
 
-        def get_lane_data(lane, cycle):
-            flat_lane = flatten_lane(lane)
+        def get_lane_data(flat_lane, cycle):
             data = flat_lane[octets_per_cycle*cycle:octets_per_cycle*(cycle+1)]
             return int.from_bytes(data, byteorder='little') if data != [] else None
 
@@ -48,8 +53,8 @@ class TestLink(unittest.TestCase):
             yield dut.reset.eq(1)
             yield
             yield dut.reset.eq(0)
-            for i in range(2048):
-                sink_data = get_lane_data(input_lane, i)
+            for i in range(cycles):
+                sink_data = get_lane_data(flat_input_lane, i)
                 if sink_data is not None:
                     yield dut.sink.data.eq(sink_data)
                 yield
@@ -57,7 +62,7 @@ class TestLink(unittest.TestCase):
         def checker(dut):
             for i in range(2 + dut.latency):
                 yield
-            for i in range(2048):
+            for i in range(cycles):
                 source_data = (yield dut.source.data)
                 source_ctrl = (yield dut.source.ctrl)
                 data = list(source_data.to_bytes(octets_per_cycle,
@@ -72,6 +77,50 @@ class TestLink(unittest.TestCase):
         reference = flatten_lane(output_lanes[0])
         self.assertEqual(link.output_lane[:len(reference)], reference)
 
+    def framer_test(self, data_width, octets_per_frame, frames_per_multiframe):
+        dut = Framer(data_width, octets_per_frame, frames_per_multiframe)
+
+        octets_per_clock      = data_width//8
+        octets_per_multiframe = octets_per_frame*frames_per_multiframe
+
+        frame_lasts      = []
+        multiframe_lasts = []
+
+        def generator(dut):
+            yield dut.reset.eq(1)
+            yield
+            yield dut.reset.eq(0)
+            for i in range(4*octets_per_multiframe//octets_per_clock):
+                yield
+                frame_lasts.append((yield dut.source.frame_last))
+                multiframe_lasts.append((yield dut.source.multiframe_last))
+
+        run_simulation(dut, generator(dut))
+
+        # Expand per-clock patterns to per-octet flags and compare with frame/multiframe ends.
+        for octet in range(len(frame_lasts)*octets_per_clock):
+            cycle, position = octet//octets_per_clock, octet%octets_per_clock
+            frame_last      = (frame_lasts[cycle]      >> position) & 0b1
+            multiframe_last = (multiframe_lasts[cycle] >> position) & 0b1
+            self.assertEqual(frame_last,      int((octet + 1)%octets_per_frame      == 0))
+            self.assertEqual(multiframe_last, int((octet + 1)%octets_per_multiframe == 0))
+
+    def test_framer(self):
+        self.framer_test(data_width=32, octets_per_frame=1,  frames_per_multiframe=32)
+        self.framer_test(data_width=32, octets_per_frame=2,  frames_per_multiframe=16)
+        self.framer_test(data_width=32, octets_per_frame=3,  frames_per_multiframe=8)
+        self.framer_test(data_width=32, octets_per_frame=8,  frames_per_multiframe=4)
+        self.framer_test(data_width=64, octets_per_frame=2,  frames_per_multiframe=16)
+        self.framer_test(data_width=64, octets_per_frame=3,  frames_per_multiframe=8)
+        self.framer_test(data_width=64, octets_per_frame=16, frames_per_multiframe=4)
+
+    def test_link_tx_64(self):
+        self.test_link_tx(data_width=64)
+
+    def test_link_tx_multi_cycle_frames(self):
+        self.test_link_tx(data_width=32, octets_per_frame=8,  frames_per_multiframe=4)
+        self.test_link_tx(data_width=64, octets_per_frame=16, frames_per_multiframe=4)
+
 
     def test_link_loopback(self, nlanes=4, data_width=32):
         prng = random.Random(6)
@@ -80,9 +129,10 @@ class TestLink(unittest.TestCase):
         output_lane = input_lane
 
         octets_per_cycle = data_width//8
+        flat_input_lane  = flatten_lane(input_lane)
+        cycles = len(flat_input_lane)//octets_per_cycle
 
-        def get_lane_data(lane, cycle):
-            flat_lane = flatten_lane(lane)
+        def get_lane_data(flat_lane, cycle):
             data = flat_lane[octets_per_cycle*cycle:octets_per_cycle*(cycle+1)]
             return int.from_bytes(data, byteorder='little') if data != [] else None
 
@@ -105,8 +155,8 @@ class TestLink(unittest.TestCase):
             yield dut.tx.reset.eq(1)
             yield
             yield dut.tx.reset.eq(0)
-            for i in range(2048):
-                sink_data = get_lane_data(input_lane, i)
+            for i in range(cycles):
+                sink_data = get_lane_data(flat_input_lane, i)
                 if sink_data is not None:
                     yield dut.tx.sink.data.eq(sink_data)
                 yield
@@ -118,12 +168,263 @@ class TestLink(unittest.TestCase):
             yield dut.rx.reset.eq(0)
             yield
             yield
-            for i in range(2048):
-                source_data = get_lane_data(input_lane, i)
+            for i in range(cycles):
+                source_data = get_lane_data(flat_input_lane, i)
                 if source_data is not None:
                     if (yield dut.rx.source.data) != source_data:
                         dut.errors += 1
                 yield
 
         run_simulation(dut, [generator(dut), checker(dut)])
-        self.assertEqual(dut.errors, 0)
\ No newline at end of file
+        self.assertEqual(dut.errors, 0)
+
+    def test_link_loopback_64(self):
+        self.test_link_loopback(data_width=64)
+
+    def link_alignment_test(self, data_width, octets_per_frame, frames_per_multiframe, rx_delay):
+        class DUT(Module):
+            def __init__(self):
+                tx = ResetInserter()(LiteJESD204BLinkTXDatapath(data_width,
+                    octets_per_frame      = octets_per_frame,
+                    frames_per_multiframe = frames_per_multiframe))
+                self.submodules.tx = tx
+                rx = ResetInserter()(LiteJESD204BLinkRXDatapath(data_width,
+                    octets_per_frame      = octets_per_frame,
+                    frames_per_multiframe = frames_per_multiframe))
+                self.submodules.rx = rx
+                self.comb += [
+                    # Without scrambling, constant data is replaced by alignment characters at the
+                    # end of each frame/multiframe.
+                    tx.scrambler.enable.eq(0),
+                    rx.descrambler.enable.eq(0),
+                    rx.sink.eq(tx.source)
+                ]
+
+        dut = DUT()
+        dut.data_errors       = 0
+        dut.align_characters  = 0
+        dut.frame_align_errors = 0
+        dut.lane_align_errors  = 0
+
+        data = int.from_bytes(bytes([0x5a]*(data_width//8)), byteorder="little")
+
+        def generator(dut):
+            yield dut.tx.sink.data.eq(data)
+            yield dut.tx.reset.eq(1)
+            yield dut.rx.reset.eq(1)
+            yield
+            yield dut.tx.reset.eq(0)
+            # Release RX on the first transmitted multiframe (TX framing starts when the scrambler
+            # is valid, 1 cycle after reset) + optional delay.
+            for i in range(1 + rx_delay):
+                yield
+            yield dut.rx.reset.eq(0)
+            for i in range(256):
+                yield
+                dut.align_characters   += ((yield dut.rx.sink.ctrl) != 0)
+                dut.frame_align_errors += bin((yield dut.rx.deframer.frame_align_error)).count("1")
+                dut.lane_align_errors  += bin((yield dut.rx.deframer.lane_align_error)).count("1")
+                if i > dut.rx.latency:
+                    dut.data_errors += ((yield dut.rx.source.data) != data)
+
+        run_simulation(dut, generator(dut))
+        return dut
+
+    def test_link_alignment(self):
+        for data_width, octets_per_frame, frames_per_multiframe in [
+            (32, 1, 32), (32, 2, 4), (32, 3, 8), (32, 8, 4), (64, 2, 4), (64, 16, 4)]:
+            dut = self.link_alignment_test(data_width, octets_per_frame, frames_per_multiframe, rx_delay=0)
+            self.assertNotEqual(dut.align_characters, 0)
+            self.assertEqual(dut.data_errors,        0)
+            self.assertEqual(dut.frame_align_errors, 0)
+            self.assertEqual(dut.lane_align_errors,  0)
+
+    def test_link_alignment_errors(self):
+        # RX frame/multiframe tracking one clock late: alignment characters are seen misplaced.
+        dut = self.link_alignment_test(32, 8, 4, rx_delay=1)
+        self.assertNotEqual(dut.frame_align_errors, 0)
+        self.assertNotEqual(dut.lane_align_errors,  0)
+
+    def pattern_test(self, data_width, mode, offset, errors=[]):
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.generator = generator = PatternGenerator(data_width)
+                self.submodules.checker   = checker   = PatternChecker(data_width)
+                self.comb += [
+                    generator.mode.eq(test_modes[mode]),
+                    checker.mode.eq(test_modes[mode])
+                ]
+                # Loopback, words shifted by offset octets (and errors injected).
+                self.error = Signal(data_width)
+                last_data = Signal(data_width)
+                last_ctrl = Signal(data_width//8)
+                self.sync += [
+                    last_data.eq(generator.source.data),
+                    last_ctrl.eq(generator.source.ctrl)
+                ]
+                self.comb += [
+                    checker.sink.data.eq(Cat(last_data, generator.source.data)[8*offset:] ^ self.error),
+                    checker.sink.ctrl.eq(Cat(last_ctrl, generator.source.ctrl)[offset:])
+                ]
+
+        dut = DUT()
+        dut.octets = []
+        dut.errors = 0
+
+        def generator(dut):
+            for i in range(128):
+                yield dut.error.eq(int(i in errors) << 5)
+                yield
+                data = (yield dut.generator.source.data)
+                dut.octets += list(data.to_bytes(data_width//8, byteorder="little"))
+                if i > 8:
+                    dut.errors += bin((yield dut.checker.errors)).count("1")
+
+        run_simulation(dut, generator(dut))
+        return dut
+
+    def test_pattern(self):
+        modes = [mode for mode in test_modes.keys() if mode != "off"]
+        for data_width, offset, mode in [(32, 1, mode) for mode in modes] + [(64, 5, "jspat")]:
+            dut = self.pattern_test(data_width, mode, offset)
+            self.assertEqual(dut.errors, 0)
+            if mode == "rpat":
+                start = dut.octets.index(rpat_octets[0])
+                self.assertEqual(dut.octets[start:start + 24], rpat_octets*2)
+            if mode == "jspat":
+                # RPAT scrambled (1 + x^14 + x^15) from the scrambler's seed, whatever the data width.
+                self.assertEqual(dut.octets[:24], [
+                    0xbf, 0xd4, 0xa3, 0xbc, 0xa2, 0x04, 0x7f, 0x0d, 0x5c, 0xd4, 0xff, 0xa3,
+                    0xbf, 0x1e, 0xa1, 0x00, 0xad, 0x8c, 0x5e, 0x3d, 0x9a, 0x76, 0x68, 0x6c])
+            if mode == "prbs7":
+                # First octet carrying the oldest bits, LSB first: x^7 + x^6 + 1.
+                bits = [(octet >> i) & 0b1 for octet in dut.octets[8:] for i in range(8)]
+                for i in range(7, len(bits)):
+                    self.assertEqual(bits[i], bits[i - 6] ^ bits[i - 7])
+
+    def test_pattern_errors(self):
+        for mode in ["prbs31", "rpat", "jspat", "k28_5"]:
+            dut = self.pattern_test(32, mode, 1, errors=[64])
+            self.assertNotEqual(dut.errors, 0)
+
+    def ilas_test(self, tx_did, rx_did, ilas_check=True):
+        ps = JESD204BPhysicalSettings(l=1, m=2, n=16, np=16)
+        ts = JESD204BTransportSettings(f=4, s=1, k=16, cs=0)
+        tx_settings = JESD204BSettings(ps, ts, did=tx_did, bid=0x5)
+        rx_settings = JESD204BSettings(ps, ts, did=rx_did, bid=0x5)
+        lmfc_cycles = tx_settings.get_lmfc_cycles()
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.tx = tx = LiteJESD204BLinkTX(32, tx_settings)
+                self.submodules.rx = rx = LiteJESD204BLinkRX(32, rx_settings, ilas_check=ilas_check)
+                # LMFC on the multiples of lmfc_cycles, RX looped back on TX.
+                cycle = Signal(32)
+                self.sync += cycle.eq(cycle + 1)
+                self.comb += [
+                    tx.lmfc_zero.eq(cycle[:log2_int(lmfc_cycles)] == 0),
+                    rx.lmfc_zero.eq(cycle[:log2_int(lmfc_cycles)] == 0),
+                    tx.jsync.eq(rx.jsync),
+                    rx.sink.eq(tx.source)
+                ]
+
+        dut = DUT()
+
+        def generator(dut):
+            for i in range(256): # Links ready within 100 cycles.
+                yield
+            dut.ready         = (yield dut.rx.ready)
+            dut.captured      = (yield dut.rx.ilas_captured)
+            dut.configuration = (yield dut.rx.ilas_configuration)
+            dut.mismatch      = (yield dut.rx.ilas_mismatch)
+
+        run_simulation(dut, generator(dut))
+        return dut, tx_settings
+
+    def test_ilas_capture(self):
+        fields = list(configuration_data_fields.keys())
+        # Matching configurations.
+        dut, tx_settings = self.ilas_test(0x5a, 0x5a)
+        configuration = int.from_bytes(bytes(tx_settings.get_configuration_data(0)), byteorder="little")
+        self.assertEqual(dut.ready,         1)
+        self.assertEqual(dut.captured,      1)
+        self.assertEqual(dut.configuration, configuration)
+        self.assertEqual(dut.mismatch,      0)
+        # DID mismatch: rejected ILAS still captured, DID and checksum reported.
+        dut, tx_settings = self.ilas_test(0x5a, 0xa5)
+        configuration = int.from_bytes(bytes(tx_settings.get_configuration_data(0)), byteorder="little")
+        self.assertEqual(dut.ready,         0)
+        self.assertEqual(dut.captured,      1)
+        self.assertEqual(dut.configuration, configuration)
+        self.assertEqual(dut.mismatch, (1 << fields.index("did")) | (1 << fields.index("chksum")))
+        # Same without ILAS check: link ready with the mismatches reported.
+        dut, tx_settings = self.ilas_test(0x5a, 0xa5, ilas_check=False)
+        self.assertEqual(dut.ready,    1)
+        self.assertEqual(dut.mismatch, (1 << fields.index("did")) | (1 << fields.index("chksum")))
+
+    def error_report_test(self, octets_per_frame, errors, jsync_errors=[]):
+        ps = JESD204BPhysicalSettings(l=1, m=2, n=16, np=16)
+        ts = JESD204BTransportSettings(f=octets_per_frame, s=octets_per_frame//4, k=4, cs=0)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+        lmfc_cycles   = jesd_settings.get_lmfc_cycles()
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.tx = tx = LiteJESD204BLinkTX(32, jesd_settings)
+                self.submodules.rx = rx = LiteJESD204BLinkRX(32, jesd_settings)
+                # jsync de-asserted on the TX only (ex longer errors reports from another RX).
+                self.jsync_error = Signal()
+                # LMFC on the multiples of lmfc_cycles, RX looped back on TX.
+                cycle = Signal(32)
+                self.sync += cycle.eq(cycle + 1)
+                self.comb += [
+                    tx.lmfc_zero.eq(cycle[:log2_int(lmfc_cycles)] == 0),
+                    rx.lmfc_zero.eq(cycle[:log2_int(lmfc_cycles)] == 0),
+                    tx.jsync.eq(rx.jsync & ~self.jsync_error),
+                    rx.sink.eq(tx.source)
+                ]
+
+        dut = DUT()
+        dut.jsync_low      = 0
+        dut.error_reports  = 0
+        dut.ready_drops    = 0
+        dut.tx_ready_drops = 0
+
+        def generator(dut):
+            ready = 0
+            for i in range(320):
+                yield dut.rx.code_error.eq(i in errors)
+                yield dut.jsync_error.eq(i in jsync_errors)
+                yield
+                if ready:
+                    dut.jsync_low      += 1 - (yield dut.rx.jsync)
+                    dut.error_reports  += (yield dut.tx.error_report)
+                    dut.ready_drops    += 1 - (yield dut.rx.ready)
+                    dut.tx_ready_drops += 1 - (yield dut.tx.ready)
+                ready = ready | (yield dut.rx.ready)
+
+        run_simulation(dut, generator(dut))
+        return dut
+
+    def test_link_error_report(self):
+        # Errors reported by one frame jsync de-assertions, without re-synchronization (links ready
+        # within 100 cycles).
+        for octets_per_frame, clocks_per_frame in [(4, 1), (16, 4)]:
+            dut = self.error_report_test(octets_per_frame, errors=[200])
+            self.assertEqual(dut.jsync_low,     clocks_per_frame)
+            self.assertEqual(dut.error_reports, 1)
+            self.assertEqual(dut.ready_drops,   0)
+        # Errors during a report are part of it, errors in the following frame reported after it.
+        dut = self.error_report_test(8, errors=[200, 201])
+        self.assertEqual(dut.jsync_low,     2)
+        self.assertEqual(dut.error_reports, 1)
+        dut = self.error_report_test(8, errors=[200, 203])
+        self.assertEqual(dut.jsync_low,     4)
+        self.assertEqual(dut.error_reports, 2)
+        self.assertEqual(dut.ready_drops,   0)
+        # 2 frames jsync de-assertion (F=8: below 5 frames + 9 octets): error report, TX kept sending
+        # data.
+        dut = self.error_report_test(8, errors=[], jsync_errors=range(200, 204))
+        self.assertEqual(dut.error_reports,  1)
+        self.assertEqual(dut.tx_ready_drops, 0)
+        self.assertEqual(dut.ready_drops,    0)
@@ -0,0 +1,140 @@
+#
+# This file is part of LiteJESD204B
+#
+# Copyright (c) 2016-2019 Florent Kermarrec <florent@enjoy-digital.fr>
+# SPDX-License-Identifier: BSD-2-Clause
+
+import unittest
+import random
+
+from migen import *
+
+from litejesd204b.common import *
+from litejesd204b.link_64b66b import crc12, get_sync_header_stream
+from litejesd204b.link_64b66b import Scrambler64b66b, Descrambler64b66b, CRC12
+from litejesd204b.link_64b66b import LiteJESD204CLinkTX, LiteJESD204CLinkRX
+
+def get_bits(words):
+    # Transmission order: first octet first, MSB first.
+    bits = []
+    for word in words:
+        for octet in word.to_bytes(8, byteorder="little"):
+            bits += [(octet >> (7 - i)) & 0b1 for i in range(8)]
+    return bits
+
+class TestLink64b66b(unittest.TestCase):
+    def test_scrambling(self):
+        prng  = random.Random(7)
+        words = [prng.randrange(2**64) for _ in range(64)]
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.scrambler   = Scrambler64b66b()
+                self.submodules.descrambler = Descrambler64b66b()
+                self.comb += self.descrambler.sink.eq(self.scrambler.source)
+
+        dut = DUT()
+        scrambled    = []
+        descrambled  = []
+
+        def generator(dut):
+            for word in words + [0]*2:
+                yield dut.scrambler.sink.data.eq(word)
+                yield
+                scrambled.append((yield dut.scrambler.source.data))
+                descrambled.append((yield dut.descrambler.source.data))
+
+        run_simulation(dut, generator(dut))
+
+        # Scrambled bits follow 1 + x^39 + x^58 (on the previous scrambled bits).
+        data_bits      = get_bits(words)
+        scrambled_bits = get_bits(scrambled[1:len(words) + 1])
+        for i in range(58, len(data_bits)):
+            self.assertEqual(scrambled_bits[i],
+                data_bits[i] ^ scrambled_bits[i - 39] ^ scrambled_bits[i - 58])
+        # Descrambling restores the words (from the second one, once the state is synchronized).
+        self.assertEqual(descrambled[3:len(words) + 2], words[1:])
+
+    def test_crc(self):
+        prng  = random.Random(8)
+        words = [prng.randrange(2**64) for _ in range(64)]
+        dut   = CRC12()
+        crcs  = []
+
+        def generator(dut):
+            for i, word in enumerate(words):
+                yield dut.data.eq(word)
+                yield dut.first.eq(i%32 == 0)
+                yield dut.last.eq(i%32 == 31)
+                yield
+            yield
+            crcs.append((yield dut.value))
+
+        run_simulation(dut, generator(dut))
+        self.assertEqual(crcs, [crc12(get_bits(words[32:]))])
+
+    def test_sync_header_stream(self):
+        stream = get_sync_header_stream(crc=0b101100111000, cmd=0, eoemb=1)
+        self.assertEqual(len(stream), 32)
+        self.assertEqual(stream[:16], [1, 0, 1, 1, 1, 0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 1])
+        self.assertEqual(stream[25:], [1, 1, 0, 0, 0, 0, 1])
+
+    def link_loopback_test(self, nconverters, samples_per_frame, frames_per_multiframe, offset,
+        pipeline_stages=0, errors=[]):
+        ps = JESD204BPhysicalSettings(l=1, m=nconverters, n=16, np=16)
+        ts = JESD204BTransportSettings(f=2*nconverters*samples_per_frame, s=samples_per_frame,
+            k=frames_per_multiframe, cs=0)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+        lmfc_cycles   = jesd_settings.get_lmfc_cycles(64)
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.tx = tx = LiteJESD204CLinkTX(64, jesd_settings, pipeline_stages=pipeline_stages)
+                self.submodules.rx = rx = LiteJESD204CLinkRX(64, jesd_settings, pipeline_stages=pipeline_stages)
+                # Data: cycles counter (LMFC on its multiples of lmfc_cycles).
+                cycle = Signal(32)
+                self.sync += cycle.eq(cycle + 1)
+                self.comb += [
+                    tx.sink.data.eq(cycle),
+                    tx.lmfc_zero.eq(cycle[:log2_int(lmfc_cycles)] == 0)
+                ]
+                # Raw loopback, blocks shifted by offset bits (and errors injected).
+                self.error  = Signal(66)
+                last_source = Signal(66)
+                self.sync += last_source.eq(tx.source.data)
+                self.comb += rx.sink.data.eq(Cat(tx.source.data, last_source)[offset:66+offset] ^ self.error)
+
+        dut = DUT()
+        dut.received    = []
+        dut.crc_errors  = 0
+        dut.align_errors = 0
+
+        def generator(dut):
+            for i in range(640):
+                yield dut.error.eq(int(i in errors) << 20)
+                yield
+                dut.crc_errors   += (yield dut.rx.crc_error)
+                dut.align_errors += (yield dut.rx.lane_align_error)
+                if (yield dut.rx.ready):
+                    dut.received.append((yield dut.rx.source.data))
+
+        run_simulation(dut, generator(dut))
+        return dut, lmfc_cycles
+
+    def test_link_loopback(self):
+        for nconverters, samples_per_frame, frames_per_multiframe, offset, pipeline_stages in [
+            (2, 1, 64, 0, 0), (2, 1, 64, 37, 0), (4, 2, 32, 65, 0), (4, 2, 32, 5, 2)]:
+            dut, lmfc_cycles = self.link_loopback_test(nconverters, samples_per_frame,
+                frames_per_multiframe, offset, pipeline_stages)
+            # Data received in sequence from the first extended multiblock (sent on the LMFC, sink
+            # being sent pipeline_stages clocks earlier).
+            self.assertNotEqual(dut.received, [])
+            self.assertEqual(dut.received[0]%lmfc_cycles, (-pipeline_stages)%lmfc_cycles)
+            self.assertEqual(dut.received, list(range(dut.received[0], dut.received[0] + len(dut.received))))
+            self.assertEqual(dut.crc_errors,   0)
+            self.assertEqual(dut.align_errors, 0)
+
+    def test_link_crc_errors(self):
+        dut, lmfc_cycles = self.link_loopback_test(2, 1, 64, 11, errors=[500])
+        self.assertNotEqual(dut.crc_errors, 0)
+        self.assertEqual(dut.align_errors, 0)
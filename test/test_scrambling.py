@@ -15,10 +15,14 @@ from test.model.link import Scrambler as ScramblerModel
 from test.model.link import Descrambler as DescramblerModel
 
 
+def seed_to_word(i, random, data_width):
+    return sum(seed_to_data(data_width//32*i + j, random) << 32*j for j in range(data_width//32))
+
+
 class TestScrambling(unittest.TestCase):
-    def scrambler_test(self):
+    def scrambler_test(self, data_width=32):
         model = ScramblerModel()
-        dut = Scrambler(32)
+        dut = Scrambler(data_width)
         dut.errors = 0
 
         def generator(dut):
@@ -26,11 +30,11 @@ class TestScrambling(unittest.TestCase):
             yield
             yield dut.reset.eq(0)
             for i in range(512):
-                yield dut.sink.data.eq(swap_bytes(seed_to_data(i, True), 4))
+                yield dut.sink.data.eq(swap_bytes(seed_to_word(i, True, data_width), data_width//8))
                 yield
                 if i >= dut.latency:
-                    reference = model.scramble(seed_to_data(i-dut.latency, True), 32)
-                    reference = swap_bytes(reference, 4)
+                    reference = model.scramble(seed_to_word(i-dut.latency, True, data_width), data_width)
+                    reference = swap_bytes(reference, data_width//8)
                     if (yield dut.source.data) != reference:
                         dut.errors += 1
 
@@ -41,9 +45,13 @@ class TestScrambling(unittest.TestCase):
         errors = self.scrambler_test()
         self.assertEqual(errors, 0)
 
-    def descrambler_test(self):
+    def test_scrambler_64(self):
+        errors = self.scrambler_test(data_width=64)
+        self.assertEqual(errors, 0)
+
+    def descrambler_test(self, data_width=32):
         model = DescramblerModel()
-        dut = Descrambler(32)
+        dut = Descrambler(data_width)
         dut.errors = 0
 
         def generator(dut):
@@ -51,11 +59,11 @@ class TestScrambling(unittest.TestCase):
             yield
             yield dut.reset.eq(0)
             for i in range(512):
-                yield dut.sink.data.eq(swap_bytes(seed_to_data(i, False), 4))
+                yield dut.sink.data.eq(swap_bytes(seed_to_word(i, False, data_width), data_width//8))
                 yield
                 if i >= dut.latency:
-                    reference = model.descramble(seed_to_data(i-dut.latency, False), 32)
-                    reference = swap_bytes(reference, 4)
+                    reference = model.descramble(seed_to_word(i-dut.latency, False, data_width), data_width)
+                    reference = swap_bytes(reference, data_width//8)
                     if (yield dut.source.data) != reference:
                         dut.errors += 1
 
@@ -66,11 +74,15 @@ class TestScrambling(unittest.TestCase):
         errors = self.descrambler_test()
         self.assertEqual(errors, 0)
 
-    def test_scrambling_loopback(self):
+    def test_descrambler_64(self):
+        errors = self.descrambler_test(data_width=64)
+        self.assertEqual(errors, 0)
+
+    def test_scrambling_loopback(self, data_width=32):
         class DUT(Module):
             def __init__(self):
-                scrambler = Scrambler(32)
-                descrambler = Descrambler(32)
+                scrambler = Scrambler(data_width)
+                descrambler = Descrambler(data_width)
                 self.comb += descrambler.reset.eq(~scrambler.valid)
                 self.submodules += scrambler, descrambler
                 self.comb += descrambler.sink.eq(scrambler.source)
@@ -79,7 +91,7 @@ class TestScrambling(unittest.TestCase):
         dut = DUT()
         dut.errors = 0
 
-        datas = [seed_to_data(i, False) for i in range(512)]
+        datas = [seed_to_word(i, False, data_width) for i in range(512)]
 
         def generator(dut):
             for data in datas:
@@ -97,3 +109,6 @@ class TestScrambling(unittest.TestCase):
 
         run_simulation(dut, [generator(dut), checker(dut)])
         self.assertEqual(dut.errors, 0)
+
+    def test_scrambling_loopback_64(self):
+        self.test_scrambling_loopback(data_width=64)
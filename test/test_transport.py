@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import unittest
+import random
 from math import ceil
 
 from migen import *
@@ -154,6 +155,207 @@ class TestTransport(unittest.TestCase):
             reference, output = self.transport_loopback_test(nlanes, 4, 64)
             self.assertEqual(reference, output)
 
+    def transport_control_test(self, nlanes, nconverters, n, np, s, cs, cf):
+        ps = JESD204BPhysicalSettings(l=nlanes, m=nconverters, n=n, np=np)
+        ts = JESD204BTransportSettings(f=2, s=s, k=16, cs=cs, cf=cf)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+
+        samples_per_clock    = 2*s
+        converter_data_width = samples_per_clock*n
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.tx = LiteJESD204BTransportTX(jesd_settings, converter_data_width)
+                self.submodules.rx = LiteJESD204BTransportRX(jesd_settings, converter_data_width)
+                self.comb += self.rx.sink.eq(self.tx.source)
+
+        dut = DUT()
+        prng = random.Random(42)
+        input_samples  = [[prng.randrange(2**n)  for j in range(4*samples_per_clock)]
+            for i in range(nconverters)]
+        input_controls = [[prng.randrange(2**cs) for j in range(4*samples_per_clock)]
+            for i in range(nconverters)]
+        reference_lanes = samples_to_lanes(samples_per_frame=s,
+                                           nlanes=nlanes,
+                                           nconverters=nconverters,
+                                           nbits=n,
+                                           samples=input_samples,
+                                           nbits_per_word=np,
+                                           control_bits=cs,
+                                           control_words=cf,
+                                           controls=input_controls)
+
+        octets_per_lane = jesd_settings.octets_per_lane
+        lane_data_width = len(dut.tx.source.lane0)
+        output_lanes    = [[] for i in range(nlanes)]
+        output_samples  = [[] for i in range(nconverters)]
+        output_controls = [[] for i in range(nconverters)]
+
+        def generator(dut):
+            for i in range(4):
+                for c in range(nconverters):
+                    converter_data = getattr(dut.tx.sink,      "converter"+str(c))
+                    converter_ctrl = getattr(dut.tx.sink_ctrl, "converter"+str(c))
+                    for j in range(samples_per_clock):
+                        yield converter_data[n*j:n*(j+1)].eq(input_samples[c][samples_per_clock*i+j])
+                        yield converter_ctrl[cs*j:cs*(j+1)].eq(input_controls[c][samples_per_clock*i+j])
+                yield
+
+        def checker(dut):
+            yield
+            for i in range(4):
+                for l in range(nlanes):
+                    lane_data = (yield getattr(dut.tx.source, "lane"+str(l)))
+                    for f in range(lane_data_width//(octets_per_lane*8)):
+                        frame = [(lane_data >> (f*8*octets_per_lane)+8*k) & 0xff
+                            for k in range(octets_per_lane)]
+                        output_lanes[l].append(frame)
+                for c in range(nconverters):
+                    converter_data = (yield getattr(dut.rx.source,      "converter"+str(c)))
+                    converter_ctrl = (yield getattr(dut.rx.source_ctrl, "converter"+str(c)))
+                    for j in range(samples_per_clock):
+                        output_samples[c].append((converter_data >> n*j) & (2**n-1))
+                        output_controls[c].append((converter_ctrl >> cs*j) & (2**cs-1))
+                yield
+
+        run_simulation(dut, [generator(dut), checker(dut)])
+        self.assertEqual(reference_lanes, output_lanes)
+        self.assertEqual(input_samples,   output_samples)
+        self.assertEqual(input_controls,  output_controls)
+
+    def test_transport_control_bits(self):
+        # N=14, CS=2, N'=16: control bits in samples' words.
+        self.transport_control_test(nlanes=4, nconverters=4, n=14, np=16, s=1, cs=2, cf=0)
+        # N=11, CS=1, N'=12: tightly packed 12-bit words.
+        self.transport_control_test(nlanes=2, nconverters=4, n=11, np=12, s=2, cs=1, cf=0)
+        # N=13, CS=1, N'=16: control bits + tail bits.
+        self.transport_control_test(nlanes=2, nconverters=2, n=13, np=16, s=1, cs=1, cf=0)
+
+    def test_settings_legacy_control_bits(self):
+        # CS control bits not fitting in the N' bits words (N=N'): deprecated, ignored as with CS=0
+        # (but still reported in the ILAS).
+        ps = JESD204BPhysicalSettings(l=4, m=4, n=16, np=16)
+        ts = JESD204BTransportSettings(f=2, s=1, k=16, cs=1)
+        with self.assertWarns(DeprecationWarning):
+            jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+        self.assertEqual(jesd_settings.control_bits_per_sample, 0)
+        self.assertEqual(jesd_settings.tail_bits, 0)
+        self.assertEqual(jesd_settings.get_configuration_data()[7] >> 6, 1)
+        transport = LiteJESD204BTransportTX(jesd_settings, 64)
+        self.assertFalse(hasattr(transport, "sink_ctrl"))
+
+    def test_transport_control_words(self):
+        # N=15, CS=1, N'=16, CF=1: control bits of all the converters in one control word.
+        self.transport_control_test(nlanes=2, nconverters=4, n=15, np=16, s=1, cs=1, cf=1)
+        # N=16, CS=2, N'=16, CF=2: control bits of 2 converters per control word.
+        self.transport_control_test(nlanes=2, nconverters=4, n=16, np=16, s=1, cs=2, cf=2)
+
+    def transport_frames_test(self, nlanes, nconverters, n, np, s, samples_per_group, lane_data_width):
+        ps = JESD204BPhysicalSettings(l=nlanes, m=nconverters, n=n, np=np)
+        ts = JESD204BTransportSettings(f=2, s=s, k=16, cs=0)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+
+        converter_data_width = samples_per_group*n
+
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.tx = LiteJESD204BTransportTX(jesd_settings, converter_data_width, lane_data_width)
+                self.submodules.rx = LiteJESD204BTransportRX(jesd_settings, converter_data_width, lane_data_width)
+                self.comb += [
+                    self.rx.sink.eq(self.tx.source),
+                    self.rx.start.eq(self.tx.start)
+                ]
+
+        dut = DUT()
+        ngroups = 4
+        prng = random.Random(42)
+        input_samples = [[prng.randrange(2**n) for j in range(ngroups*samples_per_group)]
+            for i in range(nconverters)]
+        reference_lanes = samples_to_lanes(samples_per_frame=s,
+                                           nlanes=nlanes,
+                                           nconverters=nconverters,
+                                           nbits=n,
+                                           samples=input_samples,
+                                           nbits_per_word=np)
+        # Lanes' octets (frames are not aligned on clocks).
+        reference_octets = [sum(frames, []) for frames in reference_lanes]
+
+        output_octets  = [[] for i in range(nlanes)]
+        output_samples = [[] for i in range(nconverters)]
+
+        clocks_per_group = (samples_per_group//s)*jesd_settings.octets_per_lane*8//len(dut.tx.source.lane0)
+
+        def generator(dut):
+            yield dut.tx.start.eq(1)
+            for group in range(ngroups):
+                for c in range(nconverters):
+                    converter_data = getattr(dut.tx.sink, "converter"+str(c))
+                    for j in range(samples_per_group):
+                        yield converter_data[n*j:n*(j+1)].eq(input_samples[c][samples_per_group*group+j])
+                for i in range(clocks_per_group):
+                    yield
+                    self.assertEqual((yield dut.tx.ready), int(i == 0))
+                    yield dut.tx.start.eq(0)
+
+        def checker(dut):
+            yield
+            for i in range(ngroups*clocks_per_group + 1):
+                if i < ngroups*clocks_per_group:
+                    for l in range(nlanes):
+                        lane_data = (yield getattr(dut.tx.source, "lane"+str(l)))
+                        output_octets[l] += [(lane_data >> 8*k) & 0xff for k in range(len(dut.tx.source.lane0)//8)]
+                if (yield dut.rx.valid) and len(output_samples[0]) < ngroups*samples_per_group:
+                    for c in range(nconverters):
+                        converter_data = (yield getattr(dut.rx.source, "converter"+str(c)))
+                        for j in range(samples_per_group):
+                            output_samples[c].append((converter_data >> n*j) & (2**n-1))
+                yield
+
+        run_simulation(dut, [generator(dut), checker(dut)])
+        self.assertEqual(reference_octets, output_octets)
+        self.assertEqual(input_samples,    output_samples)
+
+    def test_transport_high_density(self):
+        # F=1, HD=1: 16-bit samples spread over 2 lanes.
+        self.transport_frames_test(nlanes=2, nconverters=1, n=16, np=16, s=1,
+            samples_per_group=4, lane_data_width=32)
+        # F=3, HD=1: 12-bit samples spread over 4 lanes.
+        self.transport_frames_test(nlanes=4, nconverters=8, n=12, np=12, s=1,
+            samples_per_group=4, lane_data_width=None)
+
+    def test_transport_odd_frames(self):
+        # F=3 on 32-bit lanes: 4 frames sent over 3 clocks.
+        self.transport_frames_test(nlanes=1, nconverters=2, n=12, np=12, s=1,
+            samples_per_group=4, lane_data_width=32)
+        # F=3 on 64-bit lanes: 8 frames sent over 3 clocks.
+        self.transport_frames_test(nlanes=2, nconverters=4, n=12, np=12, s=1,
+            samples_per_group=8, lane_data_width=64)
+
+    def test_settings_lmfc_cycles(self):
+        # LMFC period only checked against the link data width it is asked for (F=3, K=4: 12 octets
+        # per multiframe, 3 clocks on 32-bit links, not an integer number of 64-bit clocks).
+        ps = JESD204BPhysicalSettings(l=1, m=2, n=12, np=12)
+        ts = JESD204BTransportSettings(f=3, s=1, k=4, cs=0)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+        self.assertEqual(jesd_settings.get_lmfc_cycles(32), 3)
+        with self.assertRaises(AssertionError):
+            jesd_settings.get_lmfc_cycles(64)
+        # Legacy attributes.
+        self.assertEqual(jesd_settings.lmfc_cycles,      3)
+        self.assertEqual(jesd_settings.octets_per_frame, 1) # Per converter (S*N'/8, truncated).
+        self.assertEqual(jesd_settings.nibbles_per_word, 3)
+        # Not an integer number of 32-bit clocks (F=3, K=5): rejected on use, not on construction.
+        ts = JESD204BTransportSettings(f=3, s=1, k=5, cs=0)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+        with self.assertRaises(AssertionError):
+            jesd_settings.get_lmfc_cycles(32)
+        # Legacy octets per frame of a converter (M=4, L=2, S=1, N'=16: 2, F=4).
+        ps = JESD204BPhysicalSettings(l=2, m=4, n=16, np=16)
+        ts = JESD204BTransportSettings(f=4, s=1, k=16, cs=0)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+        self.assertEqual(jesd_settings.octets_per_frame, 2)
+        self.assertEqual(jesd_settings.octets_per_lane,  4)
+
     def test_stpl_generator(self):
         ps = JESD204BPhysicalSettings(l=4, m=4, n=16, np=16)
         ts = JESD204BTransportSettings(f=2, s=1, k=16, cs=1)
@@ -195,3 +397,29 @@ class TestTransport(unittest.TestCase):
 
         run_simulation(stpl, [generator(stpl)])
         self.assertEqual(stpl._errors, 1)
+
+    def test_stpl_checker_pipeline(self):
+        ps = JESD204BPhysicalSettings(l=4, m=4, n=16, np=16)
+        ts = JESD204BTransportSettings(f=2, s=1, k=16, cs=0)
+        jesd_settings = JESD204BSettings(ps, ts, did=0x5a, bid=0x5)
+        references = [0x0000000000000000, 0x0100010001000100, 0x0200020002000200, 0x0300030003000300]
+
+        # Pipelined checkers count the same errors, delayed by their latency.
+        errors = {}
+        for pipeline_stages in [0, 1, 3]:
+            stpl = LiteJESD204BSTPLChecker(jesd_settings, 64, random=False, pipeline_stages=pipeline_stages)
+            errors[pipeline_stages] = []
+
+            def generator(dut):
+                for i in range(16):
+                    for j, reference in enumerate(references):
+                        error = (i in [4, 5, 9]) and (j == i%4)
+                        yield getattr(dut.sink, "converter"+str(j)).eq(reference ^ (error << (4*j)))
+                    yield
+                    errors[pipeline_stages].append((yield dut.errors))
+
+            run_simulation(stpl, [generator(stpl)])
+            self.assertEqual(stpl.latency, pipeline_stages)
+        for pipeline_stages in [1, 3]:
+            self.assertEqual(errors[pipeline_stages][pipeline_stages:], errors[0][:16-pipeline_stages])
+        self.assertEqual(errors[0][-1], 4) # Initial (zeroed sink) + 3 injected.